@@ -2,4 +2,16 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
-application = get_asgi_application()
+# Bajo ASGI las vistas sync corren en hilos del executor: las conexiones persistentes no se
+# cierran al terminar cada request.
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+django_application = get_asgi_application()
+
+from core.realtime import calendar_socket  # noqa: E402 (requiere Django inicializado)
+
+
+async def application(scope, receive, send):
+    # HTTP va a Django; los WebSockets (ws/calendars/<id>/) a los cambios en vivo.
+    if scope['type'] == 'websocket':
+        return await calendar_socket(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -1,5 +1,8 @@
+import os
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'dev-secret-key'
 DEBUG = True
@@ -18,6 +21,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -47,10 +51,54 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
-DATABASES = {
+# SQLite por defecto; DB_ENGINE=postgresql usa PostgreSQL (requiere `pip install psycopg[binary]`)
+# con las variables POSTGRES_*. Las conexiones se reutilizan DB_CONN_MAX_AGE segundos entre
+# requests (config/asgi.py lo pone en 0: bajo ASGI no se reutilizan de forma segura).
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
+if os.environ.get('DB_ENGINE') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'fiuna'),
+            'USER': os.environ.get('POSTGRES_USER', 'fiuna'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            # Base de pruebas en archivo y no en memoria: las pruebas de escrituras concurrentes
+            # necesitan los mismos locks (WAL, busy_timeout) que en producción.
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
+    }
+
+# PRAGMAs de cada conexión SQLite nueva (core/signals.py). WAL deja leer mientras otro
+# proceso escribe y, con synchronous=NORMAL, solo sincroniza a disco en los checkpoints;
+# busy_timeout (ms) hace esperar el lock de escritura en vez de fallar con "database is locked".
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+    'cache_size': -32000,  # negativo: KiB
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+# Caché en disco: compartido entre los procesos del servidor y los workers de trabajos.
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'var' / 'cache',
     }
 }
 
@@ -68,6 +116,9 @@ CORS_ALLOWED_ORIGINS = [
     'http://localhost:5173',
 ]
 CORS_ALLOW_CREDENTIALS = True
+# Control de concurrencia por revisión del calendario (If-Match / ETag).
+CORS_ALLOW_HEADERS = (*default_headers, 'if-match')
+CORS_EXPOSE_HEADERS = ['ETag']
 CSRF_TRUSTED_ORIGINS = [
     'http://localhost:5173',
 ]
@@ -80,3 +131,63 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
 }
+
+# Solver automático de calendarios (segundos).
+SOLVER_TIME_BUDGET = 5
+SOLVER_MAX_TIME_BUDGET = 20
+# Sugerencias ante una asignación rechazada: tiempo de búsqueda (segundos) y largo máximo
+# de las cadenas de movimientos.
+SUGGEST_TIME_BUDGET = 0.2
+SUGGEST_MAX_MOVES = 3
+
+# Trabajos en segundo plano (manage.py run_workers).
+JOBS_WORKERS = 2
+JOBS_MAX_PER_CALENDAR = 2
+JOBS_RESULT_DIR = BASE_DIR / 'var' / 'jobs'
+# Cada worker renueva heartbeat_at de sus trabajos cada JOBS_HEARTBEAT_INTERVAL segundos; un
+# trabajo en ejecución sin señal en JOBS_HEARTBEAT_TIMEOUT se da por interrumpido.
+JOBS_HEARTBEAT_INTERVAL = 10
+JOBS_HEARTBEAT_TIMEOUT = 60
+
+# Caché de exportaciones direccionado por contenido.
+EXPORT_CACHE_DIR = BASE_DIR / 'var' / 'export_cache'
+EXPORT_CACHE_MAX_BYTES = 200 * 1024 * 1024
+# Las exportaciones se arman en memoria hasta este tamaño; más grandes van a disco.
+EXPORT_SPOOL_MAX_BYTES = 8 * 1024 * 1024
+# Procesos para renderizar en paralelo las secciones del cuadernillo PDF (1 = en serie); el pool
+# se crea una vez por proceso del servidor y lo comparten todas las exportaciones.
+PDF_WORKERS = 4
+
+# Feeds públicos (JSON e iCalendar) generados al publicar una versión y cuánto pueden
+# cachearlos navegadores y proxies (segundos).
+PUBLISH_DIR = BASE_DIR / 'var' / 'published'
+PUBLIC_FEED_MAX_AGE = 60 * 60
+
+# Versiones: cada cuántas versiones se guarda un snapshot completo y cuántos se memoizan.
+VERSION_KEYFRAME_INTERVAL = 20
+VERSION_SNAPSHOT_CACHE_SIZE = 256
+
+# Resultados de manage.py benchmark y línea base contra la que se comparan.
+BENCHMARK_DIR = BASE_DIR / 'var' / 'benchmarks'
+
+# Importación de planillas: filas por lote de escritura.
+IMPORT_BATCH_SIZE = 1000
+
+# Índice de reglas compilado por calendario: entradas en memoria por proceso y vida en el caché.
+RULE_INDEX_CACHE_SIZE = 64
+RULE_INDEX_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Cambios en vivo (WebSocket, servidor ASGI): cada cuánto se consultan los cambios nuevos
+# (segundos) y cuánto se conservan para reconexiones.
+REALTIME_POLL_INTERVAL = 0.5
+REALTIME_RETENTION_SECONDS = 60 * 60
+
+# Métricas por request: header Server-Timing y /api/metrics (formato Prometheus). Cada
+# proceso vuelca sus contadores en METRICS_DIR cada METRICS_FLUSH_INTERVAL segundos para
+# sumar los de todos los workers; los de procesos terminados que no se escriben hace
+# METRICS_STALE_SECONDS se acumulan en merged.json. METRICS_ENABLED=0 desactiva todo (middleware, spans y endpoint).
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+METRICS_DIR = BASE_DIR / 'var' / 'metrics'
+METRICS_FLUSH_INTERVAL = 5
+METRICS_STALE_SECONDS = 24 * 60 * 60
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
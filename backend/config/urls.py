@@ -6,14 +6,18 @@ from core import views
 
 router = DefaultRouter()
 router.register('subjects', views.SubjectViewSet, basename='subjects')
+router.register('cohorts', views.CohortViewSet, basename='cohorts')
 router.register('calendars', views.ExamCalendarViewSet, basename='calendars')
 router.register('rules', views.RuleViewSet, basename='rules')
 router.register('versions', views.CalendarVersionViewSet, basename='versions')
+router.register('jobs', views.JobViewSet, basename='jobs')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/login/', views.LoginView.as_view()),
     path('api/auth/logout/', views.LogoutView.as_view()),
     path('api/auth/me/', views.MeView.as_view()),
+    path('api/metrics', views.metrics, name='metrics'),
+    path('api/public/calendars/<int:calendar_id>/<str:feed>', views.public_feed, name='public-feed'),
     path('api/', include(router.urls)),
 ]
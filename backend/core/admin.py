@@ -1,5 +1,5 @@
 from django.contrib import admin
 
-from .models import CalendarBlockedDay, CalendarVersion, ExamCalendar, ExamEvent, Rule, Subject
+from .models import CalendarBlockedDay, Cohort, CalendarVersion, ExamCalendar, ExamEvent, Job, Rule, Subject
 
-admin.site.register([Subject, ExamCalendar, CalendarBlockedDay, ExamEvent, Rule, CalendarVersion])
+admin.site.register([Subject, Cohort, ExamCalendar, CalendarBlockedDay, ExamEvent, Rule, CalendarVersion, Job])
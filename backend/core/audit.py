@@ -0,0 +1,59 @@
+from collections import defaultdict
+import time
+
+from .constraints import CalendarContext, summarize_conflicts
+from .models import ExamEvent, Subject
+from .rule_index import rule_index
+
+
+def audit_calendars(calendars):
+    # Revalida todos los eventos de los calendarios contra las reglas vigentes. Eventos y
+    # materias se leen con una query cada uno para todos los calendarios; las reglas salen
+    # del índice en caché y cada regla se evalúa en un solo pase (CalendarContext.audit_conflicts).
+    started = time.monotonic()
+    calendars = list(calendars)
+    events = defaultdict(list)
+    for calendar_id, *row in ExamEvent.objects.filter(calendar__in=calendars).values_list(
+        'calendar_id', 'id', 'subject_id', 'date', 'subject__is_heavy', 'subject__semester_group',
+    ).iterator(chunk_size=2000):
+        events[calendar_id].append(row)
+    subjects = Subject.objects.in_bulk({row[1] for rows in events.values() for row in rows})
+
+    reports = []
+    for calendar in calendars:
+        context = CalendarContext(calendar, events[calendar.id], rule_index(calendar))
+        conflicts = context.audit_conflicts(subjects)
+        violations = []
+        for subject_id, (event_id, day) in sorted(context.date_by_subject.items(), key=lambda item: (item[1][1], item[0])):
+            found = conflicts[subject_id]
+            if not found:
+                continue
+            result = summarize_conflicts(found)
+            violations.append({
+                'event_id': event_id,
+                'subject': subject_id,
+                'subject_name': subjects[subject_id].name,
+                'date': day.isoformat(),
+                'severity': result['severity'],
+                'message': result['message'],
+                'conflicts': [
+                    {'severity': severity.lower(), 'message': message}
+                    for severity, message in dict.fromkeys(found)
+                ],
+            })
+        reports.append({
+            'calendar': calendar.id,
+            'calendar_name': calendar.name,
+            'period_type': calendar.period_type,
+            'events': len(events[calendar.id]),
+            'hard': sum(1 for v in violations if v['severity'] == 'hard'),
+            'soft': sum(1 for v in violations if v['severity'] == 'soft'),
+            'violations': violations,
+        })
+    return {
+        'calendars': reports,
+        'events': sum(report['events'] for report in reports),
+        'hard': sum(report['hard'] for report in reports),
+        'soft': sum(report['soft'] for report in reports),
+        'elapsed_ms': round((time.monotonic() - started) * 1000, 1),
+    }
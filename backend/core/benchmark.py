@@ -0,0 +1,195 @@
+from datetime import timedelta
+import logging
+import os
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+
+import django
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import CalendarVersion, ExamCalendar, Rule, Subject
+from .versions import delete_version, set_head
+
+OPERATIONS = (
+    'validate_assignment', 'assign_event', 'retrieve', 'save_version', 'restore_version', 'export_excel', 'export_pdf',
+)
+# Métricas comparadas contra la línea base y margen absoluto por debajo del cual una
+# diferencia se considera ruido (además de la tolerancia relativa).
+COMPARED_METRICS = {'p50_ms': 1.0, 'p95_ms': 2.0, 'queries': 0, 'peak_kib': 64}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p * (len(values) - 1))))] if values else 0.0
+
+
+class Benchmark:
+    # Mide las operaciones a través de la API completa (middleware, vistas, serializers) sobre
+    # un calendario existente. Al terminar lo restaura a su estado inicial y borra las
+    # versiones que creó.
+
+    def __init__(self, calendar: ExamCalendar, user, seed=0):
+        self.calendar = calendar
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        self.random = random.Random(seed)
+        self.base = f'/api/calendars/{calendar.id}/'
+        blocked = set(calendar.blocked_days.values_list('date', flat=True))
+        span = (calendar.end_date - calendar.start_date).days + 1
+        self.days = [
+            day.isoformat() for day in (calendar.start_date + timedelta(days=n) for n in range(span))
+            if day.weekday() != 6 and day not in blocked
+        ]
+        self.events = list(calendar.events.values_list('id', 'subject_id'))
+        self.subjects = list(Subject.objects.values_list('id', flat=True))
+        self.original_head = calendar.head_version_id
+        self.created = []
+        self.initial = None
+        self.restores = 0
+
+    def call(self, method, path, data=None, expected=(200,)):
+        response = getattr(self.client, method)(self.base + path, data, format='json')
+        if response.status_code not in expected:
+            raise RuntimeError(f'{method.upper()} {self.base}{path} respondió {response.status_code}')
+        if response.streaming:
+            b''.join(response.streaming_content)
+            response.close()
+        return response
+
+    def setup(self):
+        self.initial = self.call('post', 'save_version/', {'label': 'benchmark: estado inicial'}).data['id']
+        self.created.append(self.initial)
+
+    def teardown(self):
+        self.call('post', f'restore_version/{self.initial}/')
+        for version_id in reversed(self.created):
+            delete_version(CalendarVersion.objects.get(id=version_id))
+        head = CalendarVersion.objects.filter(id=self.original_head).first()
+        set_head(self.calendar, head)
+
+    # Operaciones medidas: cada una hace una request.
+
+    def validate_assignment(self):
+        self.call('post', 'validate_assignment/', {
+            'subject': self.random.choice(self.subjects), 'date': self.random.choice(self.days),
+        })
+
+    def assign_event(self):
+        # Mueve un evento existente; un conflicto hard (400) también cuenta como medición.
+        event_id, subject_id = self.random.choice(self.events)
+        self.call('post', 'assign_event/', {
+            'subject': subject_id, 'date': self.random.choice(self.days), 'event_id': event_id,
+        }, expected=(200, 400))
+
+    def retrieve(self):
+        self.call('get', '')
+
+    def save_version(self):
+        self.created.append(self.call('post', 'save_version/', {'label': 'benchmark'}).data['id'])
+
+    def restore_version(self):
+        # Alterna entre el estado inicial y la última versión guardada para que cada
+        # restauración tenga cambios que aplicar.
+        self.restores += 1
+        target = self.created[-1] if self.restores % 2 else self.initial
+        self.call('post', f'restore_version/{target}/')
+
+    def export_excel(self):
+        # Con un directorio de caché vacío se mide la generación, no un acierto de caché.
+        with tempfile.TemporaryDirectory() as directory, override_settings(EXPORT_CACHE_DIR=directory):
+            self.call('get', 'export/excel/')
+
+    def export_pdf(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(EXPORT_CACHE_DIR=directory):
+            self.call('get', 'export/pdf/')
+
+    def measure(self, name, iterations, warmup):
+        operation = getattr(self, name)
+        for _ in range(warmup):
+            operation()
+        latencies = []
+        queries = []
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                operation()
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured.captured_queries))
+        # La memoria se mide en una pasada aparte: tracemalloc distorsiona los tiempos.
+        tracemalloc.start()
+        try:
+            operation()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return {
+            'iterations': iterations,
+            'p50_ms': round(percentile(latencies, 0.5), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'mean_ms': round(sum(latencies) / len(latencies), 2),
+            'max_ms': round(max(latencies), 2),
+            'queries': int(percentile(queries, 0.5)),
+            'peak_kib': round(peak / 1024, 1),
+        }
+
+
+def run_benchmark(calendar: ExamCalendar, user, operations=OPERATIONS, iterations=20, warmup=2, seed=0, log=None):
+    benchmark = Benchmark(calendar, user, seed)
+    results = {}
+    # Los 400 de assign_event son esperables: no se registran como advertencias.
+    request_logger = logging.getLogger('django.request')
+    level = request_logger.level
+    request_logger.setLevel(logging.ERROR)
+    benchmark.setup()
+    try:
+        for name in operations:
+            results[name] = benchmark.measure(name, iterations, warmup)
+            if log:
+                log(name, results[name])
+    finally:
+        benchmark.teardown()
+        request_logger.setLevel(level)
+    return {
+        'created_at': timezone.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'cpus': os.cpu_count(),
+        },
+        'dataset': {
+            'calendar': calendar.id,
+            'events': len(benchmark.events),
+            'subjects': len(benchmark.subjects),
+            'calendar_rules': Rule.objects.filter(calendar=calendar).count(),
+            'global_rules': Rule.objects.filter(global_rule=True).count(),
+            'blocked_days': calendar.blocked_days.count(),
+            'versions': calendar.versions.count(),
+        },
+        'iterations': iterations,
+        'operations': results,
+    }
+
+
+def compare_results(current, baseline, tolerance=0.25):
+    # Regresión: la métrica supera a la de la línea base en más de `tolerance` (relativa) y
+    # en más del margen absoluto de COMPARED_METRICS. Las queries no tienen tolerancia.
+    regressions = []
+    for name, metrics in current['operations'].items():
+        before = baseline.get('operations', {}).get(name)
+        if before is None:
+            continue
+        for metric, slack in COMPARED_METRICS.items():
+            if metric not in before:
+                continue
+            limit = before[metric] if metric == 'queries' else max(before[metric] * (1 + tolerance), before[metric] + slack)
+            if metrics[metric] > limit:
+                regressions.append({'operation': name, 'metric': metric, 'baseline': before[metric], 'current': metrics[metric]})
+    return regressions
@@ -0,0 +1,246 @@
+from collections import defaultdict
+from datetime import date, timedelta
+import datetime
+from hashlib import sha256
+import json
+from typing import Optional
+
+from .models import ExamCalendar, Subject
+from .rule_index import rule_index
+
+
+def parse_date(value: date | str) -> date:
+    if isinstance(value, str):
+        return datetime.date.fromisoformat(value)
+    return value
+
+
+def parse_event_id(value) -> Optional[int]:
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def summarize_conflicts(conflicts):
+    # Evita mensajes repetidos cuando múltiples reglas producen la misma advertencia.
+    hard = list(dict.fromkeys(msg for sev, msg in conflicts if sev == 'HARD'))
+    soft = list(dict.fromkeys(msg for sev, msg in conflicts if sev == 'SOFT'))
+    if hard:
+        return {'is_valid': False, 'severity': 'hard', 'message': ' | '.join(hard)}
+    if soft:
+        return {'is_valid': True, 'severity': 'soft', 'message': ' | '.join(soft)}
+    return {'is_valid': True, 'severity': None, 'message': 'OK'}
+
+
+class CalendarContext:
+    # Estado del calendario cargado con un número fijo de queries e indexado en
+    # memoria; la validación no consulta la base por cada regla.
+
+    def __init__(self, calendar: ExamCalendar, events, index, blocked_dates=None):
+        self.calendar = calendar
+        self.index = index
+        # Los feriados vienen del índice salvo que se indiquen otros (restaurar versión).
+        self.blocked_dates = index.blocked_dates if blocked_dates is None else set(blocked_dates)
+        # subject_id -> (event_id, date)
+        self.date_by_subject = {}
+        # date -> {subject_id: event_id}
+        self.subjects_by_date = defaultdict(dict)
+        # date -> {subject_id: event_id}, solo materias pesadas
+        self.heavy_by_date = defaultdict(dict)
+        # subject_id -> grupo (semestre), para MAX_EXAMS_PER_DAY_GROUP
+        self.group_by_subject = {}
+        for event_id, subject_id, day, is_heavy, group in events:
+            self.place(subject_id, day, event_id, is_heavy, group)
+
+        # Reglas compiladas y compartidas por el índice (core/rule_index.py): no se modifican.
+        self.rules = index.rules
+        self.rules_by_subject = index.by_subject
+        self.general_rules = index.general
+
+    @classmethod
+    def load(cls, calendar: ExamCalendar):
+        # Solo los eventos se leen siempre; reglas y feriados salen del índice en caché.
+        events = calendar.events.values_list('id', 'subject_id', 'date', 'subject__is_heavy', 'subject__semester_group')
+        return cls(calendar, events, rule_index(calendar))
+
+    def audit_conflicts(self, subjects):
+        # Revalida todos los eventos ubicados en un pase por regla (no por evento): cada
+        # evaluador recorre sus materias o los índices por fecha una sola vez. Devuelve
+        # subject_id -> conflictos, en el mismo orden que conflicts().
+        conflicts = {
+            subject_id: self.static_conflicts(subjects[subject_id], day)
+            for subject_id, (_, day) in self.date_by_subject.items()
+            if subject_id in subjects
+        }
+        for rule in self.rules:
+            rule.audit(self, subjects, conflicts)
+        return conflicts
+
+    def validate_events(self, subjects):
+        # Revalida cada evento ubicado; devuelve solo los que tienen advertencias o conflictos.
+        conflicts = self.audit_conflicts(subjects)
+        results = []
+        for subject_id, (event_id, day) in sorted(self.date_by_subject.items(), key=lambda item: (item[1][1], item[0])):
+            if subject_id not in conflicts:
+                continue
+            result = summarize_conflicts(conflicts[subject_id])
+            if result['severity'] is not None:
+                results.append({
+                    'event_id': event_id,
+                    'subject': subject_id,
+                    'subject_name': subjects[subject_id].name,
+                    'date': day.isoformat(),
+                    **result,
+                })
+        return results
+
+    def place(self, subject_id: int, day: date, event_id: Optional[int] = None, is_heavy: bool = False, group=None):
+        self.unplace(subject_id)
+        self.date_by_subject[subject_id] = (event_id, day)
+        self.group_by_subject[subject_id] = group
+        self.subjects_by_date[day][subject_id] = event_id
+        if is_heavy:
+            self.heavy_by_date[day][subject_id] = event_id
+
+    def unplace(self, subject_id: int):
+        placed = self.date_by_subject.pop(subject_id, None)
+        if placed is None:
+            return
+        _, day = placed
+        self.subjects_by_date[day].pop(subject_id, None)
+        self.heavy_by_date[day].pop(subject_id, None)
+
+    def event_on(self, subject_id: int, day: date, event_id: Optional[int] = None) -> bool:
+        placed = self.date_by_subject.get(subject_id)
+        return placed is not None and placed[1] == day and (event_id is None or placed[0] != event_id)
+
+    def date_of(self, subject_id: int, event_id: Optional[int] = None) -> Optional[date]:
+        placed = self.date_by_subject.get(subject_id)
+        if placed is None or (event_id is not None and placed[0] == event_id):
+            return None
+        return placed[1]
+
+    def group_count(self, day: date, group, subject_id: int, event_id: Optional[int] = None) -> int:
+        # Exámenes de otras materias del mismo grupo ubicados ese día.
+        group_by_subject = self.group_by_subject
+        return sum(
+            1 for other, other_event in self.subjects_by_date.get(day, {}).items()
+            if other != subject_id and (event_id is None or other_event != event_id) and group_by_subject.get(other) == group
+        )
+
+    def heavy_on(self, day: date, subject_id: int, event_id: Optional[int] = None) -> bool:
+        return any(
+            other != subject_id and (event_id is None or other_event != event_id)
+            for other, other_event in self.heavy_by_date.get(day, {}).items()
+        )
+
+    def rules_for(self, subject_id: int):
+        return self.index.rules_for(subject_id)
+
+    def static_conflicts(self, subject: Subject, target_date: date):
+        calendar = self.calendar
+        conflicts = []
+        if target_date < calendar.start_date or target_date > calendar.end_date:
+            conflicts.append(('HARD', 'La fecha está fuera del rango del calendario.'))
+
+        if target_date.weekday() == 6:
+            conflicts.append(('HARD', 'No se permiten exámenes los domingos.'))
+
+        if target_date in self.blocked_dates:
+            conflicts.append(('HARD', 'El día está marcado como feriado/bloqueado.'))
+
+        constraints = self.index.subject_constraints(subject)
+        if constraints.weekday_mask is not None and not constraints.weekday_mask >> target_date.weekday() & 1:
+            conflicts.append(constraints.weekday_message)
+
+        if constraints.fixed_dates is not None and target_date.isoformat() not in constraints.fixed_dates:
+            conflicts.append(constraints.fixed_message)
+        return conflicts
+
+    def rule_conflicts(self, subject: Subject, target_date: date, event_id: Optional[int] = None):
+        # Cada regla es un evaluador de core/rules.py ya compilado por el índice.
+        conflicts = []
+        for rule in self.rules_for(subject.id):
+            rule.check(self, subject, target_date, event_id, conflicts)
+        return conflicts
+
+    def conflicts(self, subject: Subject, target_date: date, event_id: Optional[int] = None):
+        return self.static_conflicts(subject, target_date) + self.rule_conflicts(subject, target_date, event_id)
+
+    def validate(self, subject: Subject, target_date: date | str, event_id=None):
+        target_date = parse_date(target_date)
+        return summarize_conflicts(self.conflicts(subject, target_date, parse_event_id(event_id)))
+
+    def fingerprint(self, subjects) -> str:
+        calendar = self.calendar
+        state = {
+            'range': [calendar.start_date.isoformat(), calendar.end_date.isoformat()],
+            'events': sorted((s, e, d.isoformat(), self.group_by_subject.get(s)) for s, (e, d) in self.date_by_subject.items()),
+            'heavy': sorted(s for day in self.heavy_by_date.values() for s in day),
+            'blocked': sorted(d.isoformat() for d in self.blocked_dates),
+            'rules': [
+                (r.id, r.rule_type, r.severity, r.subject_a_id, r.subject_b_id, r.params, r.subject_a_name, r.subject_b_name)
+                for r in self.rules
+            ],
+            'subjects': [(s.id, s.name, s.semester_group, s.is_heavy, s.allowed_weekdays, s.fixed_dates) for s in subjects],
+            # Cambia con cada invalidación del índice (reglas, feriados o materias editadas).
+            'index': self.index.version,
+        }
+        return sha256(json.dumps(state, sort_keys=True, default=str).encode()).hexdigest()
+
+    def feasibility_matrix(self, subjects, start: date, end: date):
+        days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+        calendar = self.calendar
+
+        # Chequeos hard que dependen solo del día: se calculan una vez por columna.
+        day_conflicts = []
+        for day in days:
+            conflicts = []
+            if day < calendar.start_date or day > calendar.end_date:
+                conflicts.append(('HARD', 'La fecha está fuera del rango del calendario.'))
+            if day.weekday() == 6:
+                conflicts.append(('HARD', 'No se permiten exámenes los domingos.'))
+            if day in self.blocked_dates:
+                conflicts.append(('HARD', 'El día está marcado como feriado/bloqueado.'))
+            day_conflicts.append(conflicts)
+        weekdays = [day.weekday() for day in days]
+        iso_days = [day.isoformat() for day in days]
+
+        rows = []
+        for subject in subjects:
+            # Máscara de días de semana permitidos y conjunto de fechas fijas, precalculados por el índice.
+            constraints = self.index.subject_constraints(subject)
+            weekday_mask = 0b1111111 if constraints.weekday_mask is None else constraints.weekday_mask
+            weekday_conflict = constraints.weekday_message
+            fixed_dates = constraints.fixed_dates
+            fixed_conflict = constraints.fixed_message
+
+            placed = self.date_by_subject.get(subject.id)
+            event_id = placed[0] if placed else None
+            # Las reglas de la materia se buscan una vez por fila y se evalúan en cada celda.
+            checks = [rule.check for rule in self.rules_for(subject.id)]
+            severities = []
+            messages = []
+            for index, day in enumerate(days):
+                conflicts = list(day_conflicts[index])
+                if not weekday_mask >> weekdays[index] & 1:
+                    conflicts.append(weekday_conflict)
+                if fixed_dates is not None and iso_days[index] not in fixed_dates:
+                    conflicts.append(fixed_conflict)
+                for check in checks:
+                    check(self, subject, day, event_id, conflicts)
+                result = summarize_conflicts(conflicts)
+                severities.append(result['severity'])
+                messages.append(result['message'])
+            rows.append({
+                'subject': subject.id,
+                'subject_name': subject.name,
+                'event_id': event_id,
+                'current_date': placed[1].isoformat() if placed else None,
+                'severity': severities,
+                'message': messages,
+            })
+        return {'dates': iso_days, 'subjects': rows}
@@ -0,0 +1,101 @@
+from contextlib import suppress
+from hashlib import sha256
+import json
+import os
+from pathlib import Path
+import shutil
+import tempfile
+
+from django.conf import settings
+
+from .exports import EXPORTER_VERSION, export_excel, export_pdf
+from .models import ExamCalendar, Subject
+from .services import build_snapshot
+
+EXPORTERS = {
+    'xlsx': export_excel,
+    'pdf': export_pdf,
+}
+
+
+def export_cache_key(calendar: ExamCalendar, snapshot, fmt: str, live: bool) -> str:
+    # Clave por contenido: cualquier cambio en eventos, feriados, reglas o en los datos
+    # de las materias exportadas produce una clave nueva.
+    subject_ids = sorted({e['subject_id'] for e in snapshot.get('events', [])})
+    subjects = list(
+        Subject.objects.filter(id__in=subject_ids).order_by('id').values_list('id', 'name', 'semester_group', 'is_heavy')
+    )
+    payload = {
+        'calendar': [calendar.name, calendar.period_type, calendar.start_date, calendar.end_date],
+        'source': 'live' if live else 'version',
+        'snapshot': snapshot,
+        'subjects': subjects,
+        'format': fmt,
+        'exporter': EXPORTER_VERSION,
+    }
+    return sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def export_key(calendar: ExamCalendar, snapshot, fmt: str) -> str:
+    # Sin snapshot se exporta el estado actual del calendario.
+    live = snapshot is None
+    return export_cache_key(calendar, build_snapshot(calendar) if live else snapshot, fmt, live)
+
+
+def cache_dir() -> Path:
+    directory = Path(settings.EXPORT_CACHE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def evict(max_bytes=None, keep=None):
+    # LRU por fecha de modificación: cada acierto "toca" el archivo.
+    max_bytes = settings.EXPORT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    total = 0
+    for entry in os.scandir(cache_dir()):
+        if not entry.is_file() or entry.name.startswith('.'):
+            continue
+        stat = entry.stat()
+        total += stat.st_size
+        if entry.path != keep:
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        total -= size
+
+
+def cached_export(calendar: ExamCalendar, snapshot, fmt: str, key=None):
+    # `key`: la de export_key() si el llamador ya la calculó (p. ej. para responder 304).
+    live = snapshot is None
+    if key is None:
+        key = export_key(calendar, snapshot, fmt)
+    path = cache_dir() / f'{key}.{fmt}'
+    try:
+        # Se devuelve el archivo abierto: una evicción concurrente no afecta la descarga.
+        fh = open(path, 'rb')
+    except FileNotFoundError:
+        pass
+    else:
+        os.utime(fh.fileno())
+        return fh, key
+
+    # Escritura atómica: otro worker nunca ve un archivo a medio escribir.
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir(), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as fh, EXPORTERS[fmt](calendar, None if live else snapshot) as content:
+            shutil.copyfileobj(content, fh)
+        os.replace(tmp_path, path)
+    except BaseException:
+        # Si la exportación falla, el temporal no queda en el directorio del caché.
+        with suppress(FileNotFoundError):
+            os.unlink(tmp_path)
+        raise
+    fh = open(path, 'rb')
+    evict(keep=str(path))
+    return fh, key
@@ -1,13 +1,20 @@
 from collections import defaultdict
+from datetime import date
 from io import BytesIO
+import re
+from tempfile import SpooledTemporaryFile
+from xml.sax.saxutils import escape
 
+from django.conf import settings
 from openpyxl import Workbook
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+from reportlab.platypus import Paragraph, Spacer
 
-from .models import ExamCalendar
+from .metrics import span
+from .models import ExamCalendar, Subject
+from .pdf import build_booklet, build_document, calendar_table, pdf_styles
+
+# Incrementar cuando cambie el contenido generado: invalida el caché de exportaciones.
+EXPORTER_VERSION = 3
 
 WEEKDAY_LABELS_ES = {
     'Monday': 'Lunes',
@@ -18,80 +25,169 @@ WEEKDAY_LABELS_ES = {
     'Saturday': 'Sábado',
     'Sunday': 'Domingo',
 }
+EXCEL_HEADER = ['Periodo', 'Calendario', 'Fecha', 'Día de semana', 'Asignatura', 'Grupo', 'Pesada']
 
 
-def build_calendar_rows(calendar: ExamCalendar, snapshot=None):
+def weekday_label(day: date):
+    day_name_en = day.strftime('%A')
+    return WEEKDAY_LABELS_ES.get(day_name_en, day_name_en)
+
+
+def iter_calendar_rows(calendar: ExamCalendar, snapshot=None):
+    # Genera (fecha, día, asignatura, grupo, pesada) ordenado por fecha y asignatura. En vivo
+    # se lee con values_list().iterator(): no se materializan modelos ni la lista completa.
     if snapshot:
         events = snapshot.get('events', [])
-        blocked = {b['date']: b.get('reason', 'FERIADO/BLOQUEADO') for b in snapshot.get('blocked_days', [])}
-        subject_ids = [e['subject_id'] for e in events]
-        subjects = {s.id: s for s in calendar.events.model.subject.field.related_model.objects.filter(id__in=subject_ids)}
-        rows = []
-        for e in events:
-            s = subjects[e['subject_id']]
-            day_name_en = __import__('datetime').date.fromisoformat(e['date']).strftime('%A')
-            day_name = WEEKDAY_LABELS_ES.get(day_name_en, day_name_en)
-            rows.append((e['date'], day_name, s.name, s.semester_group, 'Sí' if s.is_heavy else 'No'))
-        return rows, blocked
-    rows = []
-    for event in calendar.events.select_related('subject').order_by('date', 'subject__name'):
-        day_name_en = event.date.strftime('%A')
-        day_name = WEEKDAY_LABELS_ES.get(day_name_en, day_name_en)
-        rows.append((event.date.isoformat(), day_name, event.subject.name, event.subject.semester_group, 'Sí' if event.subject.is_heavy else 'No'))
-    blocked = {b.date.isoformat(): b.reason for b in calendar.blocked_days.all()}
-    return rows, blocked
+        subjects = {
+            subject_id: (name, group, heavy)
+            for subject_id, name, group, heavy in Subject.objects.filter(
+                id__in=[e['subject_id'] for e in events]
+            ).values_list('id', 'name', 'semester_group', 'is_heavy')
+        }
+        rows = sorted((e['date'], *subjects[e['subject_id']]) for e in events)
+    else:
+        rows = (
+            calendar.events.order_by('date', 'subject__name')
+            .values_list('date', 'subject__name', 'subject__semester_group', 'subject__is_heavy')
+            .iterator(chunk_size=2000)
+        )
+    for day, name, group, heavy in rows:
+        day = date.fromisoformat(day) if isinstance(day, str) else day
+        yield day.isoformat(), weekday_label(day), name, group, 'Sí' if heavy else 'No'
 
 
-def export_excel(calendar: ExamCalendar, snapshot=None):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = 'Exámenes'
-    ws.append(['Periodo', 'Calendario', 'Fecha', 'Día de semana', 'Asignatura', 'Grupo', 'Pesada'])
-    rows, _ = build_calendar_rows(calendar, snapshot)
-    for r in rows:
-        ws.append([calendar.get_period_type_display(), calendar.name, *r])
+def calendar_blocked_days(calendar: ExamCalendar, snapshot=None):
+    if snapshot:
+        return {b['date']: b.get('reason', 'FERIADO/BLOQUEADO') for b in snapshot.get('blocked_days', [])}
+    return {day.isoformat(): reason for day, reason in calendar.blocked_days.values_list('date', 'reason')}
 
-    summary = wb.create_sheet('Resumen')
-    summary.append(['Fecha', 'Cantidad'])
-    counter = defaultdict(int)
-    for r in rows:
-        counter[r[0]] += 1
-    for day, qty in sorted(counter.items()):
-        summary.append([day, qty])
 
-    out = BytesIO()
+def build_calendar_rows(calendar: ExamCalendar, snapshot=None):
+    return list(iter_calendar_rows(calendar, snapshot)), calendar_blocked_days(calendar, snapshot)
+
+
+def spooled_file():
+    # En memoria hasta EXPORT_SPOOL_MAX_BYTES; por encima pasa a un archivo temporal.
+    return SpooledTemporaryFile(max_size=settings.EXPORT_SPOOL_MAX_BYTES)
+
+
+def save_workbook(wb: Workbook):
+    out = spooled_file()
     wb.save(out)
     out.seek(0)
     return out
 
 
+def write_calendar_sheet(ws, calendar: ExamCalendar, snapshot=None):
+    # Escribe las filas en una hoja write-only y devuelve la cantidad de exámenes por día.
+    period = calendar.get_period_type_display()
+    counter = defaultdict(int)
+    ws.append(EXCEL_HEADER)
+    for row in iter_calendar_rows(calendar, snapshot):
+        ws.append([period, calendar.name, *row])
+        counter[row[0]] += 1
+    return counter
+
+
+def export_excel(calendar: ExamCalendar, snapshot=None):
+    # Modo write-only: openpyxl vuelca cada fila a disco en lugar de mantener celdas en memoria.
+    wb = Workbook(write_only=True)
+    with span('excel_rows'):
+        counter = write_calendar_sheet(wb.create_sheet('Exámenes'), calendar, snapshot)
+        summary = wb.create_sheet('Resumen')
+        summary.append(['Fecha', 'Cantidad'])
+        for day, qty in sorted(counter.items()):
+            summary.append([day, qty])
+    with span('excel_save'):
+        return save_workbook(wb)
+
+
+def sheet_title(calendar: ExamCalendar, used):
+    # Excel limita los nombres de hoja a 31 caracteres y prohíbe []:*?/\
+    base = re.sub(r'[\[\]:*?/\\]', '-', f'{calendar.period_type} {calendar.name}')[:31] or str(calendar.id)
+    title = base
+    suffix = 2
+    while title.lower() in used:
+        title = f'{base[:31 - len(str(suffix)) - 1]}~{suffix}'
+        suffix += 1
+    used.add(title.lower())
+    return title
+
+
+def export_excel_many(calendars):
+    # Una hoja por calendario más un resumen con la cantidad de exámenes de cada uno.
+    wb = Workbook(write_only=True)
+    used = {'resumen'}
+    totals = []
+    with span('excel_rows'):
+        for calendar in calendars:
+            counter = write_calendar_sheet(wb.create_sheet(sheet_title(calendar, used)), calendar)
+            totals.append((calendar, sum(counter.values())))
+    summary = wb.create_sheet('Resumen')
+    summary.append(['Periodo', 'Calendario', 'Desde', 'Hasta', 'Exámenes'])
+    for calendar, total in totals:
+        summary.append([
+            calendar.get_period_type_display(), calendar.name,
+            calendar.start_date.isoformat(), calendar.end_date.isoformat(), total,
+        ])
+    with span('excel_save'):
+        return save_workbook(wb)
+
+
 def export_pdf(calendar: ExamCalendar, snapshot=None):
+    styles = pdf_styles()
     out = BytesIO()
-    doc = SimpleDocTemplate(out, pagesize=A4)
-    styles = getSampleStyleSheet()
-    elements = [
-        Paragraph('FIUNA - Planificador de Exámenes', styles['Title']),
-        Paragraph(f'{calendar.name} - {calendar.get_period_type_display()}', styles['Heading2']),
-        Paragraph(f'Rango: {calendar.start_date} a {calendar.end_date}', styles['Normal']),
-        Spacer(1, 12),
-    ]
-    rows, blocked = build_calendar_rows(calendar, snapshot)
-    data = [['Fecha', 'Día', 'Asignaturas']] 
+    doc = build_document(out, footer=f'{calendar.name} - {calendar.get_period_type_display()}')
+    with span('pdf_rows'):
+        rows, blocked = build_calendar_rows(calendar, snapshot)
     grouped = defaultdict(list)
-    for date, day, subject, _, _ in rows:
-        grouped[(date, day)].append(subject)
-    for (date, day), subjects in sorted(grouped.items()):
-        marker = f' ({blocked[date]})' if date in blocked else ''
-        data.append([date, day, ', '.join(subjects) + marker])
-
-    table = Table(data, colWidths=[90, 90, 320])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#8a1e11')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-    ]))
-    elements.append(table)
-    doc.build(elements)
+    for iso, day, subject, _, _ in rows:
+        grouped[(iso, day)].append(subject)
+    with span('pdf_render'):
+        doc.build([
+            Paragraph('FIUNA - Planificador de Exámenes', styles['title']),
+            Paragraph(escape(f'{calendar.name} - {calendar.get_period_type_display()}'), styles['heading']),
+            Paragraph(f'Rango: {calendar.start_date} a {calendar.end_date}', styles['normal']),
+            Spacer(1, 12),
+            calendar_table([(iso, day, subjects) for (iso, day), subjects in sorted(grouped.items())], blocked),
+        ])
     out.seek(0)
     return out
+
+
+def booklet_sections(calendars):
+    # Una sección por calendario y grupo con exámenes; los datos se arman acá para que el
+    # renderizado (core/pdf.py) pueda correr en otros procesos sin tocar la base.
+    sections = []
+    for calendar in calendars:
+        blocked = calendar_blocked_days(calendar)
+        by_group = defaultdict(lambda: defaultdict(list))
+        counts = defaultdict(int)
+        for iso, _, name, group, heavy in iter_calendar_rows(calendar):
+            by_group[group][iso].append(f'{name} *' if heavy == 'Sí' else name)
+            counts[group] += 1
+        for group, label in Subject.SemesterGroup.choices:
+            if group not in by_group:
+                continue
+            sections.append({
+                'calendar_id': calendar.id,
+                'calendar': calendar.name,
+                'period': calendar.get_period_type_display(),
+                'group': label,
+                'count': counts[group],
+                'title': f'{calendar.name} - {calendar.get_period_type_display()} - {label}',
+                'subtitle': f'Rango: {calendar.start_date} a {calendar.end_date} · {counts[group]} exámenes (* pesada)',
+                'start': calendar.start_date.isoformat(),
+                'end': calendar.end_date.isoformat(),
+                'days': dict(by_group[group]),
+                'blocked': blocked,
+            })
+    return sections
+
+
+def export_pdf_booklet(calendars, subtitle=''):
+    # Cuadernillo de fin de periodo: índice + grilla mensual por calendario y grupo.
+    with span('pdf_rows'):
+        sections = booklet_sections(calendars)
+    with span('pdf_render'):
+        return build_booklet('FIUNA - Planificador de Exámenes', subtitle, sections, workers=settings.PDF_WORKERS)
@@ -0,0 +1,226 @@
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+import gzip
+from hashlib import sha256
+import json
+import os
+from pathlib import Path
+import shutil
+import uuid
+
+from django.conf import settings
+from django.utils import timezone
+
+from .exports import weekday_label
+from .models import CalendarVersion, Subject
+from .versions import version_snapshot
+
+# Feeds públicos de un calendario publicado: JSON e iCalendar del calendario completo y de
+# cada grupo. Se generan una vez al publicar una versión y se guardan comprimidos con gzip en
+# PUBLISH_DIR/<calendar_id>/<carpeta>/; current.json apunta a la última carpeta publicada y
+# guarda ETag y fecha de cada feed, así servirlos no consulta la base.
+
+CONTENT_TYPES = {
+    'json': 'application/json; charset=utf-8',
+    'ics': 'text/calendar; charset=utf-8',
+}
+INDEX_FEED = 'index.json'
+
+# calendar_id -> (mtime de current.json, contenido); se relee cuando se vuelve a publicar.
+_published = {}
+
+
+def calendar_dir(calendar_id) -> Path:
+    return Path(settings.PUBLISH_DIR) / str(calendar_id)
+
+
+def feed_names():
+    names = ['calendar.json', 'calendar.ics']
+    for group in Subject.SemesterGroup.values:
+        names += [f'{group.lower()}.json', f'{group.lower()}.ics']
+    return names
+
+
+def ics_text(value):
+    return str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def ics_fold(line):
+    # RFC 5545: líneas de hasta 75 octetos; las siguientes empiezan con un espacio.
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    start = 0
+    limit = 75
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # No cortar en medio de un carácter UTF-8.
+        while end < len(encoded) and encoded[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode())
+        start = end
+        limit = 74
+    return '\r\n '.join(parts)
+
+
+def render_ics(data):
+    calendar = data['calendar']
+    title = f"{calendar['name']} - {calendar['period']}" + (f" - {data['group']['label']}" if data['group'] else '')
+    stamp = datetime.fromisoformat(data['published_at']).astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//FIUNA//Planificador de Examenes//ES',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{ics_text(title)}',
+        f"X-PUBLISHED-TTL:PT{max(settings.PUBLIC_FEED_MAX_AGE // 60, 1)}M",
+    ]
+    for exam in data['exams']:
+        day = date.fromisoformat(exam['date'])
+        description = f"{calendar['name']} ({calendar['period']}) · {exam['group_label']}" + (' · Pesada' if exam['heavy'] else '')
+        lines += [
+            'BEGIN:VEVENT',
+            # UID estable por calendario y materia: al republicar, los clientes actualizan el evento.
+            f"UID:exam-{calendar['id']}-{exam['subject_id']}@fiuna-planificador",
+            f'DTSTAMP:{stamp}',
+            f"SEQUENCE:{data['version']['number']}",
+            f"DTSTART;VALUE=DATE:{day.strftime('%Y%m%d')}",
+            f"DTEND;VALUE=DATE:{(day + timedelta(days=1)).strftime('%Y%m%d')}",
+            f"SUMMARY:{ics_text('Examen: ' + exam['subject'])}",
+            f'DESCRIPTION:{ics_text(description)}',
+            f"CATEGORIES:{ics_text(exam['group_label'])}",
+            'TRANSP:TRANSPARENT',
+            'END:VEVENT',
+        ]
+    lines.append('END:VCALENDAR')
+    return ('\r\n'.join(ics_fold(line) for line in lines) + '\r\n').encode()
+
+
+def render_json(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def feed_data(version: CalendarVersion, published_at):
+    # Datos de la versión con los que se arman todos los feeds (las únicas queries).
+    calendar = version.calendar
+    snapshot = version_snapshot(version)
+    events = snapshot.get('events', [])
+    subjects = {
+        subject_id: (name, code, group, heavy)
+        for subject_id, name, code, group, heavy in Subject.objects.filter(
+            id__in=[e['subject_id'] for e in events]
+        ).values_list('id', 'name', 'code', 'semester_group', 'is_heavy')
+    }
+    groups = dict(Subject.SemesterGroup.choices)
+    exams = []
+    for event in events:
+        if event['subject_id'] not in subjects:
+            continue
+        name, code, group, heavy = subjects[event['subject_id']]
+        exams.append({
+            'date': event['date'],
+            'weekday': weekday_label(date.fromisoformat(event['date'])),
+            'subject_id': event['subject_id'],
+            'subject': name,
+            'code': code or None,
+            'group': group,
+            'group_label': groups.get(group, group),
+            'heavy': heavy,
+        })
+    exams.sort(key=lambda exam: (exam['date'], exam['subject']))
+    return {
+        'calendar': {
+            'id': calendar.id,
+            'name': calendar.name,
+            'period_type': calendar.period_type,
+            'period': calendar.get_period_type_display(),
+            'start_date': calendar.start_date.isoformat(),
+            'end_date': calendar.end_date.isoformat(),
+        },
+        'version': {'id': version.id, 'number': version.version_number, 'label': version.label},
+        'published_at': published_at.isoformat(),
+        'group': None,
+        'blocked_days': [
+            {'date': b['date'], 'reason': b.get('reason', '')} for b in sorted(snapshot.get('blocked_days', []), key=lambda b: b['date'])
+        ],
+        'exams': exams,
+    }
+
+
+def publish_version(version: CalendarVersion):
+    # Genera todos los feeds en una carpeta nueva y recién al final cambia current.json: quien
+    # esté leyendo la publicación anterior no ve archivos a medio escribir.
+    published_at = timezone.now().replace(microsecond=0)
+    data = feed_data(version, published_at)
+    directory = calendar_dir(version.calendar_id)
+    folder = f'v{version.version_number}-{uuid.uuid4().hex[:8]}'
+    (directory / folder).mkdir(parents=True)
+
+    feeds = {}
+    groups = dict(Subject.SemesterGroup.choices)
+
+    def store(name, body):
+        (directory / folder / f'{name}.gz').write_bytes(gzip.compress(body, compresslevel=9, mtime=0))
+        feeds[name] = {'etag': sha256(body).hexdigest()[:32], 'size': len(body)}
+
+    for name in feed_names():
+        slug, fmt = name.split('.')
+        group = None if slug == 'calendar' else slug.upper()
+        feed = data if group is None else {
+            **data,
+            'group': {'code': group, 'label': groups[group]},
+            'exams': [exam for exam in data['exams'] if exam['group'] == group],
+        }
+        store(name, render_json(feed) if fmt == 'json' else render_ics(feed))
+    store(INDEX_FEED, render_json({
+        'calendar': data['calendar'],
+        'version': data['version'],
+        'published_at': data['published_at'],
+        'feeds': {name: {'size': meta['size']} for name, meta in feeds.items()},
+    }))
+
+    meta = {
+        'folder': folder,
+        'version': version.id,
+        'published_at': int(published_at.timestamp()),
+        'feeds': feeds,
+    }
+    temporary = directory / f'.current-{uuid.uuid4().hex[:8]}.json'
+    temporary.write_text(json.dumps(meta))
+    os.replace(temporary, directory / 'current.json')
+    # Se conserva la publicación anterior para las descargas en curso.
+    previous = sorted(
+        (entry for entry in os.scandir(directory) if entry.is_dir() and entry.name != folder),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in previous[:-1]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+    return {
+        'calendar': version.calendar_id,
+        'version': version.id,
+        'published_at': data['published_at'],
+        'exams': len(data['exams']),
+        'feeds': sorted(feeds),
+    }
+
+
+def published(calendar_id):
+    # current.json del calendario (None si nunca se publicó), memoizado por mtime.
+    path = calendar_dir(calendar_id) / 'current.json'
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _published.get(calendar_id)
+    if cached is None or cached[0] != mtime:
+        cached = _published[calendar_id] = (mtime, json.loads(path.read_text()))
+    return cached[1]
+
+
+def read_feed(calendar_id, meta, name):
+    # Bytes comprimidos del feed; None si la carpeta ya se borró (publicación concurrente).
+    try:
+        return (calendar_dir(calendar_id) / meta['folder'] / f'{name}.gz').read_bytes()
+    except FileNotFoundError:
+        return None
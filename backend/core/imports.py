@@ -0,0 +1,354 @@
+from datetime import date, datetime
+import unicodedata
+from zipfile import BadZipFile
+
+from django.conf import settings
+from django.db import transaction
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+
+from .constraints import CalendarContext
+from .rules import WEEKDAY_LABELS_ES, WEEKDAY_NAMES
+from .models import CalendarBlockedDay, Cohort, ExamCalendar, ExamEvent, Subject
+from .realtime import publish
+from .revisions import calendar_write
+from .rule_index import bump_rule_index, rule_index
+
+# Encabezados aceptados por columna (normalizados: minúsculas y sin acentos). Coinciden
+# con los de core/exports.py para poder reimportar un Excel exportado.
+COLUMNS = {
+    'subjects': {
+        'name': ['asignatura', 'nombre', 'materia', 'name'],
+        'code': ['codigo', 'code'],
+        'semester_group': ['grupo', 'semestre', 'semester_group'],
+        'is_heavy': ['pesada', 'is_heavy'],
+        'allowed_weekdays': ['dias permitidos', 'allowed_weekdays'],
+        'fixed_dates': ['fechas fijas', 'fixed_dates'],
+    },
+    'blocked_days': {
+        'date': ['fecha', 'date'],
+        'reason': ['motivo', 'reason'],
+    },
+    'events': {
+        'date': ['fecha', 'date'],
+        'subject': ['asignatura', 'materia', 'subject'],
+        'code': ['codigo', 'code'],
+    },
+    # Una fila por par cohorte-materia (matriz de inscripción en formato largo).
+    'cohorts': {
+        'name': ['cohorte', 'nombre', 'name'],
+        'size': ['estudiantes', 'alumnos', 'size'],
+        'subject': ['asignatura', 'materia', 'subject'],
+        'code': ['codigo', 'code'],
+    },
+}
+REQUIRED = {
+    'subjects': ['name', 'semester_group'],
+    'blocked_days': ['date'],
+    'events': ['date'],
+    'cohorts': ['name'],
+}
+CALENDAR_KINDS = ('blocked_days', 'events')
+SUBJECT_KINDS = ('events', 'cohorts')
+MAX_REPORTED_ERRORS = 1000
+
+WEEKDAYS_BY_LABEL = {}
+for _name in WEEKDAY_NAMES:
+    WEEKDAYS_BY_LABEL[_name.lower()] = _name
+for _name, _label in WEEKDAY_LABELS_ES.items():
+    WEEKDAYS_BY_LABEL[unicodedata.normalize('NFKD', _label).encode('ascii', 'ignore').decode().lower()] = _name
+
+
+class ImportFileError(Exception):
+    pass
+
+
+def normalize(value):
+    text = unicodedata.normalize('NFKD', str(value or '')).encode('ascii', 'ignore').decode()
+    return ' '.join(text.strip().lower().split())
+
+
+def parse_cell_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value or '').strip()
+    for fmt in ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y'):
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f'Fecha inválida: {value!r}')
+
+
+def parse_bool(value):
+    return normalize(value) in ('si', 's', 'x', 'true', '1', 'yes')
+
+
+def parse_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (date, datetime)):
+        return [value]
+    return [part.strip() for part in str(value).replace(';', ',').split(',') if part.strip()]
+
+
+def parse_semester_group(value):
+    text = normalize(value)
+    for choice, label in Subject.SemesterGroup.choices:
+        if text in (choice.lower(), normalize(label)):
+            return choice
+    raise ValueError(f'Grupo inválido: {value!r}')
+
+
+def parse_weekdays(value):
+    weekdays = []
+    for part in parse_list(value):
+        name = WEEKDAYS_BY_LABEL.get(normalize(part))
+        if name is None:
+            raise ValueError(f'Día inválido: {part!r}')
+        weekdays.append(name)
+    return weekdays
+
+
+def iter_sheet(fileobj, kind, sheet=None):
+    # Modo read-only: openpyxl entrega las filas en streaming sin cargar la hoja completa.
+    try:
+        wb = load_workbook(fileobj, read_only=True, data_only=True)
+    except (BadZipFile, InvalidFileException, OSError):
+        raise ImportFileError('El archivo no es un Excel (.xlsx) válido.')
+    try:
+        if sheet and sheet not in wb.sheetnames:
+            raise ImportFileError(f'La hoja {sheet!r} no existe en el archivo.')
+        ws = wb[sheet] if sheet else wb.worksheets[0]
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        positions = {}
+        aliases = COLUMNS[kind]
+        for index, title in enumerate(header):
+            for field, names in aliases.items():
+                if normalize(title) in names and field not in positions:
+                    positions[field] = index
+        missing = [field for field in REQUIRED[kind] if field not in positions]
+        if kind in SUBJECT_KINDS and 'subject' not in positions and 'code' not in positions:
+            missing.append('subject')
+        if missing:
+            titles = ', '.join(aliases[field][0].title() for field in missing)
+            raise ImportFileError(f'Faltan columnas obligatorias: {titles}')
+        for number, row in enumerate(rows, start=2):
+            if not row or all(cell in (None, '') for cell in row):
+                continue
+            yield number, {field: row[index] if index < len(row) else None for field, index in positions.items()}
+    finally:
+        wb.close()
+
+
+class Importer:
+    def __init__(self, kind, calendar: ExamCalendar = None, batch_size=None):
+        if kind not in COLUMNS:
+            raise ImportFileError(f'Tipo de importación desconocido: {kind}')
+        if kind in CALENDAR_KINDS and calendar is None:
+            raise ImportFileError('Se requiere un calendario para importar feriados o eventos.')
+        self.kind = kind
+        self.calendar = calendar
+        self.batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+        # updated: filas que cambiaron algo; unchanged: filas iguales a lo ya guardado.
+        self.report = {'kind': kind, 'rows': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'error_count': 0, 'errors': []}
+        self.subject_ids = None
+        self.subjects = None
+        self.context = None
+
+    def error(self, number, message):
+        self.report['error_count'] += 1
+        if len(self.report['errors']) < MAX_REPORTED_ERRORS:
+            self.report['errors'].append({'row': number, 'error': message})
+
+    def run(self, fileobj, sheet=None, dry_run=False, revision=None):
+        parse = getattr(self, f'parse_{self.kind}')
+        flush = getattr(self, f'flush_{self.kind}')
+        calendar_kind = self.kind in CALENDAR_KINDS
+        # Feriados y eventos se escriben como cualquier cambio del calendario: revisión nueva
+        # y rechazo si no coincide con la que vio el cliente (ver core/revisions.py).
+        with calendar_write(self.calendar, revision) if calendar_kind else transaction.atomic():
+            batch = {}
+            for number, row in iter_sheet(fileobj, self.kind, sheet):
+                self.report['rows'] += 1
+                try:
+                    key, values = parse(row)
+                except ValueError as exc:
+                    self.error(number, str(exc))
+                    continue
+                # Si una clave se repite dentro del lote, gana la última fila.
+                batch[key] = values
+                if len(batch) >= self.batch_size:
+                    flush(batch)
+                    batch = {}
+            if batch:
+                flush(batch)
+            changed = self.report['created'] or self.report['updated']
+            if calendar_kind and changed and not dry_run:
+                # Cambios masivos: los editores conectados recargan el calendario.
+                publish(self.calendar.id, 'reload')
+            if dry_run or (calendar_kind and not changed):
+                # Sin filas nuevas ni modificadas tampoco cambia la revisión.
+                transaction.set_rollback(True)
+        if calendar_kind and not dry_run:
+            self.report['revision'] = self.calendar.revision
+        self.report['dry_run'] = dry_run
+        return self.report
+
+    def parse_subjects(self, row):
+        name = str(row.get('name') or '').strip()
+        if not name:
+            raise ValueError('Falta el nombre de la asignatura.')
+        values = {
+            'name': name,
+            'code': str(row.get('code') or '').strip(),
+            'semester_group': parse_semester_group(row.get('semester_group')),
+            'is_heavy': parse_bool(row.get('is_heavy')),
+            'allowed_weekdays': parse_weekdays(row.get('allowed_weekdays')),
+            'fixed_dates': [parse_cell_date(d).isoformat() for d in parse_list(row.get('fixed_dates'))],
+        }
+        return (values['code'] or values['name']), values
+
+    def flush_subjects(self, batch):
+        # Upsert por código (o por nombre si no hay código) con una consulta por lote.
+        codes = [v['code'] for v in batch.values() if v['code']]
+        names = [v['name'] for v in batch.values() if not v['code']]
+        existing = {}
+        for subject in Subject.objects.filter(code__in=codes):
+            existing[subject.code] = subject
+        for subject in Subject.objects.filter(name__in=names):
+            existing.setdefault(subject.name, subject)
+        fields = ['name', 'code', 'semester_group', 'is_heavy', 'allowed_weekdays', 'fixed_dates']
+        to_create = []
+        to_update = []
+        for key, values in batch.items():
+            subject = existing.get(key)
+            if subject is None:
+                to_create.append(Subject(**values))
+            elif any(getattr(subject, field) != values[field] for field in fields):
+                for field in fields:
+                    setattr(subject, field, values[field])
+                to_update.append(subject)
+        Subject.objects.bulk_create(to_create)
+        # bulk_update arma un CASE por campo: lotes chicos evitan sentencias gigantes.
+        Subject.objects.bulk_update(to_update, fields, batch_size=100)
+        if to_update:
+            # bulk_update no emite señales: los nombres en el índice de reglas quedarían viejos.
+            bump_rule_index()
+        self.report['created'] += len(to_create)
+        self.report['updated'] += len(to_update)
+        self.report['unchanged'] += len(batch) - len(to_create) - len(to_update)
+
+    def parse_blocked_days(self, row):
+        day = parse_cell_date(row.get('date'))
+        reason = str(row.get('reason') or '').strip() or 'FERIADO/BLOQUEADO'
+        return day, {'date': day, 'reason': reason[:120]}
+
+    def flush_blocked_days(self, batch):
+        existing = dict(self.calendar.blocked_days.filter(date__in=list(batch)).values_list('date', 'reason'))
+        changed = [values for day, values in batch.items() if existing.get(day) != values['reason']]
+        CalendarBlockedDay.objects.bulk_create(
+            [CalendarBlockedDay(calendar=self.calendar, **values) for values in changed],
+            update_conflicts=True,
+            unique_fields=['calendar', 'date'],
+            update_fields=['reason'],
+        )
+        if changed:
+            bump_rule_index(self.calendar.id)
+        created = len(batch) - len(existing)
+        self.report['created'] += created
+        self.report['updated'] += len(changed) - created
+        self.report['unchanged'] += len(batch) - len(changed)
+
+    def resolve_subject(self, row):
+        if self.subject_ids is None:
+            # Un único barrido de materias: nombre y código normalizados -> id.
+            self.subject_ids = {}
+            self.subjects = {}
+            for subject in Subject.objects.only('id', 'name', 'code', 'allowed_weekdays', 'fixed_dates'):
+                self.subjects[subject.id] = subject
+                self.subject_ids.setdefault(('name', normalize(subject.name)), subject.id)
+                if subject.code:
+                    self.subject_ids.setdefault(('code', normalize(subject.code)), subject.id)
+        if row.get('code'):
+            subject_id = self.subject_ids.get(('code', normalize(row['code'])))
+            if subject_id:
+                return subject_id
+        subject_id = self.subject_ids.get(('name', normalize(row.get('subject'))))
+        if subject_id is None:
+            raise ValueError(f'Asignatura inexistente: {row.get("subject") or row.get("code")!r}')
+        return subject_id
+
+    def parse_events(self, row):
+        subject_id = self.resolve_subject(row)
+        day = parse_cell_date(row.get('date'))
+        if self.context is None:
+            # Solo los chequeos que no dependen de otros eventos (rango, domingos, feriados,
+            # días y fechas permitidos): no hace falta cargar los eventos del calendario.
+            self.context = CalendarContext(self.calendar, [], rule_index(self.calendar))
+        hard = [message for severity, message in self.context.static_conflicts(self.subjects[subject_id], day) if severity == 'HARD']
+        if hard:
+            raise ValueError(' | '.join(dict.fromkeys(hard)))
+        return subject_id, {'subject_id': subject_id, 'date': day}
+
+    def flush_events(self, batch):
+        existing = dict(self.calendar.events.filter(subject_id__in=list(batch)).values_list('subject_id', 'date'))
+        changed = [values for subject_id, values in batch.items() if existing.get(subject_id) != values['date']]
+        ExamEvent.objects.bulk_create(
+            [ExamEvent(calendar=self.calendar, **values) for values in changed],
+            update_conflicts=True,
+            unique_fields=['calendar', 'subject'],
+            update_fields=['date', 'updated_at'],
+        )
+        created = len(batch) - len(existing)
+        self.report['created'] += created
+        self.report['updated'] += len(changed) - created
+        self.report['unchanged'] += len(batch) - len(changed)
+
+    def parse_cohorts(self, row):
+        name = str(row.get('name') or '').strip()
+        if not name:
+            raise ValueError('Falta el nombre de la cohorte.')
+        size = row.get('size')
+        if size not in (None, ''):
+            try:
+                size = int(size)
+            except (TypeError, ValueError):
+                raise ValueError(f'Cantidad de estudiantes inválida: {size!r}')
+            if size < 0:
+                raise ValueError(f'Cantidad de estudiantes inválida: {size!r}')
+        else:
+            size = None
+        subject_id = self.resolve_subject(row)
+        return (name, subject_id), {'name': name[:120], 'size': size, 'subject_id': subject_id}
+
+    def flush_cohorts(self, batch):
+        names = {values['name'] for values in batch.values()}
+        cohorts = {cohort.name: cohort for cohort in Cohort.objects.filter(name__in=names)}
+        sizes = {values['name']: values['size'] for values in batch.values() if values['size'] is not None}
+        new = [Cohort(name=name, size=sizes.get(name, 1)) for name in names if name not in cohorts]
+        Cohort.objects.bulk_create(new)
+        changed = [c for c in cohorts.values() if c.name in sizes and c.size != sizes[c.name]]
+        for cohort in changed:
+            cohort.size = sizes[cohort.name]
+        Cohort.objects.bulk_update(changed, ['size'])
+        cohorts.update({c.name: c for c in new})
+
+        Link = Cohort.subjects.through
+        pairs = {(cohorts[values['name']].id, values['subject_id']) for values in batch.values()}
+        existing = set(
+            Link.objects.filter(cohort_id__in={c for c, _ in pairs}, subject_id__in={s for _, s in pairs})
+            .values_list('cohort_id', 'subject_id')
+        )
+        Link.objects.bulk_create(
+            [Link(cohort_id=c, subject_id=s) for c, s in pairs - existing], ignore_conflicts=True,
+        )
+        self.report['created'] += len(pairs - existing)
+        self.report['unchanged'] += len(pairs & existing)
+
+
+def import_xlsx(fileobj, kind, calendar: ExamCalendar = None, sheet=None, dry_run=False, revision=None):
+    return Importer(kind, calendar).run(fileobj, sheet=sheet, dry_run=dry_run, revision=revision)
@@ -0,0 +1,196 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+import multiprocessing
+import os
+from pathlib import Path
+import shutil
+import socket
+import time
+import traceback
+
+import django
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .export_cache import cached_export
+from .models import CalendarVersion, ExamCalendar, Job, Subject
+from .solver import apply_schedule, auto_schedule
+from .versions import version_snapshot
+
+ACTIVE_STATUSES = (Job.Status.QUEUED, Job.Status.RUNNING)
+
+
+class JobLimitExceeded(Exception):
+    pass
+
+
+def submit_job(calendar: ExamCalendar, kind: str, params, user):
+    with transaction.atomic():
+        # Serializa los envíos por calendario antes de contar: el UPDATE sin cambios bloquea la
+        # fila en PostgreSQL y toma el lock de escritura en SQLite (que ignora select_for_update).
+        ExamCalendar.objects.filter(id=calendar.id).update(revision=F('revision'))
+        active = Job.objects.filter(calendar=calendar, status__in=ACTIVE_STATUSES).count()
+        if active >= settings.JOBS_MAX_PER_CALENDAR:
+            raise JobLimitExceeded(
+                f'El calendario ya tiene {active} trabajos en curso (máximo {settings.JOBS_MAX_PER_CALENDAR}).'
+            )
+        return Job.objects.create(calendar=calendar, kind=kind, params=params or {}, created_by=user)
+
+
+def job_dir(job: Job) -> Path:
+    return Path(settings.JOBS_RESULT_DIR) / str(job.id)
+
+
+class JobProgress:
+    # Persiste el avance como máximo cada `interval` segundos para no saturar SQLite.
+    def __init__(self, job_id, interval=0.5):
+        self.job_id = job_id
+        self.interval = interval
+        self.last = 0.0
+
+    def __call__(self, phase, done, total):
+        now = time.monotonic()
+        if now - self.last < self.interval and done < total:
+            return
+        self.last = now
+        Job.objects.filter(id=self.job_id).update(progress=(done / total) if total else 1.0, message=phase)
+
+
+def _snapshot(job: Job):
+    version_id = job.params.get('version_id')
+    if not version_id:
+        return None
+    return version_snapshot(CalendarVersion.objects.get(id=version_id, calendar=job.calendar))
+
+
+def _write_result(job: Job, filename, content):
+    directory = job_dir(job)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / filename
+    with open(path, 'wb') as fh:
+        shutil.copyfileobj(content, fh)
+    return {'result_file': str(path), 'result_name': filename}
+
+
+def _run_export(job: Job, fmt):
+    content, _ = cached_export(job.calendar, _snapshot(job), fmt)
+    with content:
+        return _write_result(job, f'{job.calendar.name}.{fmt}', content)
+
+
+def run_export_excel(job: Job, progress):
+    return _run_export(job, 'xlsx')
+
+
+def run_export_pdf(job: Job, progress):
+    return _run_export(job, 'pdf')
+
+
+def run_auto_schedule(job: Job, progress):
+    params = job.params
+    subjects = Subject.objects.all().order_by('name')
+    if params.get('semester_group'):
+        subjects = subjects.filter(semester_group=params['semester_group'])
+    revision = job.calendar.revision
+    result = auto_schedule(
+        job.calendar,
+        list(subjects),
+        keep_existing=params.get('keep_existing', True),
+        seed=int(params.get('seed', 0)),
+        # El mismo tope que la acción sincrónica: un trabajo no corre el solver sin límite.
+        time_budget=max(0.1, min(float(params.get('time_budget', settings.SOLVER_TIME_BUDGET)), settings.SOLVER_MAX_TIME_BUDGET)),
+        progress=progress,
+    )
+    result['applied'] = apply_schedule(job.calendar, result['assignments'], revision, result['unplaced']) if params.get('apply') else None
+    return {'result': result}
+
+
+JOB_HANDLERS = {
+    Job.Kind.EXPORT_EXCEL: run_export_excel,
+    Job.Kind.EXPORT_PDF: run_export_pdf,
+    Job.Kind.AUTO_SCHEDULE: run_auto_schedule,
+}
+
+
+def run_job(job_id):
+    job = Job.objects.select_related('calendar').get(id=job_id)
+    try:
+        fields = JOB_HANDLERS[job.kind](job, JobProgress(job.id))
+    except Exception:
+        Job.objects.filter(id=job.id).update(
+            status=Job.Status.FAILED, error=traceback.format_exc(), finished_at=timezone.now(),
+        )
+        return False
+    Job.objects.filter(id=job.id).update(
+        status=Job.Status.DONE, progress=1.0, message='', finished_at=timezone.now(), **fields,
+    )
+    return True
+
+
+def worker_identity():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim_jobs(limit, worker=''):
+    # El UPDATE condicionado al estado evita que dos workers tomen el mismo trabajo.
+    claimed = []
+    if limit <= 0:
+        return claimed
+    for job_id in Job.objects.filter(status=Job.Status.QUEUED).order_by('created_at').values_list('id', flat=True)[:limit]:
+        now = timezone.now()
+        if Job.objects.filter(id=job_id, status=Job.Status.QUEUED).update(
+            status=Job.Status.RUNNING, started_at=now, worker=worker, heartbeat_at=now,
+        ):
+            claimed.append(job_id)
+    return claimed
+
+
+def heartbeat(job_ids):
+    return Job.objects.filter(id__in=job_ids, status=Job.Status.RUNNING).update(heartbeat_at=timezone.now())
+
+
+def fail_interrupted_jobs():
+    # Solo los trabajos cuyo worker dejó de dar señales: los de otros workers vivos siguen.
+    cutoff = timezone.now() - timedelta(seconds=settings.JOBS_HEARTBEAT_TIMEOUT)
+    return Job.objects.filter(status=Job.Status.RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True),
+    ).update(
+        status=Job.Status.FAILED, error='Trabajo interrumpido: su worker dejó de responder.', finished_at=timezone.now(),
+    )
+
+
+def serve_forever(workers=None, poll_interval=1.0, log=None, once=False):
+    workers = workers or settings.JOBS_WORKERS
+    log = log or (lambda message: None)
+    running = {}
+    worker = worker_identity()
+    beat_at = 0.0
+    # Procesos "spawn": cada hijo inicializa Django y abre sus propias conexiones.
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+        while True:
+            for job_id, future in list(running.items()):
+                if future.done():
+                    running.pop(job_id)
+                    exc = future.exception()
+                    if exc is not None:
+                        Job.objects.filter(id=job_id).update(
+                            status=Job.Status.FAILED, error=repr(exc), finished_at=timezone.now(),
+                        )
+                    log(f'Trabajo {job_id} finalizado')
+            if time.monotonic() - beat_at >= settings.JOBS_HEARTBEAT_INTERVAL:
+                # Señal de vida de los trabajos propios y limpieza de los de workers caídos.
+                beat_at = time.monotonic()
+                heartbeat(list(running))
+                interrupted = fail_interrupted_jobs()
+                if interrupted:
+                    log(f'{interrupted} trabajos interrumpidos marcados como fallidos')
+            for job_id in claim_jobs(workers - len(running), worker):
+                log(f'Trabajo {job_id} iniciado')
+                running[job_id] = pool.submit(run_job, job_id)
+            connections.close_all()
+            if once and not running:
+                return
+            time.sleep(poll_interval)
@@ -0,0 +1,123 @@
+from collections import defaultdict
+from datetime import date
+from itertools import accumulate
+
+from .models import Cohort, ExamCalendar, ExamEvent
+
+
+def overlapping_calendars(calendar: ExamCalendar):
+    return ExamCalendar.objects.filter(
+        start_date__lte=calendar.end_date, end_date__gte=calendar.start_date,
+    ).order_by('start_date', 'id')
+
+
+def _hot_runs(days, heavy, window, max_exams, max_heavy):
+    # Ventana deslizante sobre los exámenes de una cohorte ordenados por día (dos punteros
+    # + suma acumulada de pesadas): O(n). Devuelve máximos y tramos [i, j] que superan
+    # algún límite, fusionando ventanas solapadas.
+    heavy_prefix = [0, *accumulate(heavy)]
+    runs = []
+    max_count = max_heavy_count = 0
+    left = 0
+    for right, day in enumerate(days):
+        while day - days[left] >= window:
+            left += 1
+        count = right - left + 1
+        heavy_count = heavy_prefix[right + 1] - heavy_prefix[left]
+        max_count = max(max_count, count)
+        max_heavy_count = max(max_heavy_count, heavy_count)
+        if count > max_exams or heavy_count > max_heavy:
+            if runs and left <= runs[-1][1]:
+                runs[-1][1] = right
+            else:
+                runs.append([left, right])
+    return max_count, max_heavy_count, runs
+
+
+def student_load(calendar: ExamCalendar, window=2, max_exams=2, max_heavy=1):
+    # Carga por cohorte considerando todos los calendarios cuyo rango se solapa con el dado.
+    # La inscripción se recorre como matriz dispersa (materia -> cohortes): el costo es
+    # proporcional a los pares examen × cohorte existentes, no a materias × estudiantes.
+    calendars = list(overlapping_calendars(calendar))
+    events = list(
+        ExamEvent.objects.filter(calendar__in=calendars)
+        .values_list('calendar_id', 'subject_id', 'subject__name', 'date', 'subject__is_heavy')
+    )
+    cohorts_by_subject = defaultdict(list)
+    for subject_id, cohort_id in Cohort.subjects.through.objects.filter(
+        subject_id__in={e[1] for e in events}
+    ).values_list('subject_id', 'cohort_id'):
+        cohorts_by_subject[subject_id].append(cohort_id)
+
+    exams_by_cohort = defaultdict(list)
+    for index, event in enumerate(events):
+        for cohort_id in cohorts_by_subject.get(event[1], ()):
+            exams_by_cohort[cohort_id].append((event[3].toordinal(), index))
+    cohorts = {
+        cohort_id: (name, size)
+        for cohort_id, name, size in Cohort.objects.filter(id__in=exams_by_cohort).values_list('id', 'name', 'size')
+    }
+
+    students = defaultdict(int)
+    heavy_students = defaultdict(int)
+    exams_by_day = defaultdict(int)
+    for event in events:
+        exams_by_day[event[3].toordinal()] += 1
+
+    cohort_rows = []
+    hotspots = []
+    for cohort_id, exams in exams_by_cohort.items():
+        name, size = cohorts[cohort_id]
+        exams.sort()
+        days = [day for day, _ in exams]
+        heavy = [1 if events[index][4] else 0 for _, index in exams]
+        for day in set(days):
+            students[day] += size
+        for day in {d for d, h in zip(days, heavy) if h}:
+            heavy_students[day] += size
+        max_count, max_heavy_count, runs = _hot_runs(days, heavy, window, max_exams, max_heavy)
+        cohort_rows.append({
+            'cohort': cohort_id,
+            'name': name,
+            'size': size,
+            'exams': len(exams),
+            'heavy': sum(heavy),
+            'max_in_window': max_count,
+            'max_heavy_in_window': max_heavy_count,
+            'hotspots': len(runs),
+        })
+        for first, last in runs:
+            members = [events[index] for _, index in exams[first:last + 1]]
+            hotspots.append({
+                'cohort': cohort_id,
+                'cohort_name': name,
+                'size': size,
+                'start': date.fromordinal(days[first]).isoformat(),
+                'end': date.fromordinal(days[last]).isoformat(),
+                'count': len(members),
+                'heavy': sum(1 for e in members if e[4]),
+                'exams': [
+                    {'calendar': e[0], 'subject': e[1], 'subject_name': e[2], 'date': e[3].isoformat(), 'is_heavy': e[4]}
+                    for e in members
+                ],
+            })
+
+    cohort_rows.sort(key=lambda row: (-row['max_heavy_in_window'], -row['max_in_window'], -row['size'], row['name']))
+    hotspots.sort(key=lambda h: (-h['heavy'], -h['count'], -h['size'], h['start'], h['cohort_name']))
+    return {
+        'calendars': [
+            {'id': c.id, 'name': c.name, 'period_type': c.period_type,
+             'start_date': c.start_date.isoformat(), 'end_date': c.end_date.isoformat()}
+            for c in calendars
+        ],
+        'window': window,
+        'max_exams': max_exams,
+        'max_heavy': max_heavy,
+        'cohorts': cohort_rows,
+        'hotspots': hotspots,
+        'daily': [
+            {'date': date.fromordinal(day).isoformat(), 'exams': exams_by_day[day],
+             'students': students[day], 'heavy_students': heavy_students[day]}
+            for day in sorted(exams_by_day)
+        ],
+    }
@@ -0,0 +1,45 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.audit import audit_calendars
+from core.models import ExamCalendar
+
+
+class Command(BaseCommand):
+    help = 'Revalida todos los eventos de uno o todos los calendarios contra las reglas vigentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('calendar_id', type=int, nargs='?', help='Sin calendario se auditan todos')
+        parser.add_argument('--year', type=int, help='Solo calendarios que empiezan en este año')
+        parser.add_argument('--period-type', choices=ExamCalendar.PeriodType.values)
+        parser.add_argument('--json', action='store_true', help='Imprime el reporte completo en JSON')
+        parser.add_argument('--fail-on-hard', action='store_true', help='Termina con error si hay conflictos hard')
+
+    def handle(self, *args, **options):
+        calendars = ExamCalendar.objects.order_by('start_date', 'id')
+        if options['calendar_id'] is not None:
+            calendars = calendars.filter(id=options['calendar_id'])
+            if not calendars.exists():
+                raise CommandError('Calendario inexistente')
+        if options['year']:
+            calendars = calendars.filter(start_date__year=options['year'])
+        if options['period_type']:
+            calendars = calendars.filter(period_type=options['period_type'])
+
+        report = audit_calendars(calendars)
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+        else:
+            for calendar in report['calendars']:
+                summary = f"{calendar['calendar_name']} ({calendar['period_type']}): {calendar['events']} eventos, {calendar['hard']} hard, {calendar['soft']} soft"
+                self.stdout.write(self.style.ERROR(summary) if calendar['hard'] else summary)
+                for violation in calendar['violations']:
+                    if violation['severity'] == 'hard' or options['verbosity'] > 1:
+                        self.stdout.write(f"  {violation['date']}  {violation['subject_name']}: {violation['message']}")
+            self.stdout.write(
+                f"Total: {len(report['calendars'])} calendarios, {report['events']} eventos, "
+                f"{report['hard']} hard, {report['soft']} soft ({report['elapsed_ms']} ms)"
+            )
+        if options['fail_on_hard'] and report['hard']:
+            raise CommandError('Hay eventos con conflictos hard')
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import ExamCalendar, Subject
+from core.solver import apply_schedule, auto_schedule
+
+
+class Command(BaseCommand):
+    help = 'Completa un calendario automáticamente a partir de las reglas vigentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('calendar_id', type=int)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--time-budget', type=float, default=5.0)
+        parser.add_argument('--semester-group', choices=Subject.SemesterGroup.values)
+        parser.add_argument('--replace', action='store_true', help='Reubica también los eventos ya asignados')
+        parser.add_argument('--apply', action='store_true', help='Guarda el resultado en el calendario')
+
+    def handle(self, *args, **options):
+        try:
+            calendar = ExamCalendar.objects.get(id=options['calendar_id'])
+        except ExamCalendar.DoesNotExist:
+            raise CommandError('Calendario inexistente')
+
+        subjects = Subject.objects.all().order_by('name')
+        if options['semester_group']:
+            subjects = subjects.filter(semester_group=options['semester_group'])
+
+        def progress(phase, done, total):
+            self.stdout.write(f'  {phase}: {done}/{total}')
+
+        result = auto_schedule(
+            calendar,
+            list(subjects),
+            keep_existing=not options['replace'],
+            seed=options['seed'],
+            time_budget=options['time_budget'],
+            progress=progress if options['verbosity'] > 1 else None,
+        )
+        for item in result['assignments']:
+            marker = ' (fija)' if item['pinned'] else ''
+            self.stdout.write(f"{item['date']}  {item['subject_name']}{marker}")
+        for item in result['unplaced']:
+            self.stdout.write(self.style.WARNING(f"Sin ubicar: {item['subject_name']} - {item['reason']}"))
+        self.stdout.write(f"Advertencias soft: {result['soft_cost']} | {result['stats']}")
+
+        if options['apply']:
+            applied = apply_schedule(calendar, result['assignments'], unplaced=result['unplaced'])
+            self.stdout.write(self.style.SUCCESS(f"Calendario actualizado: {applied['created']} creados, {applied['updated']} movidos, {applied['removed']} quitados"))
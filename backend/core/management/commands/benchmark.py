@@ -0,0 +1,81 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.utils import timezone
+
+from core.benchmark import OPERATIONS, compare_results, run_benchmark
+from core.models import ExamCalendar
+
+
+class Command(BaseCommand):
+    help = 'Mide latencia, queries y memoria de las operaciones principales y compara contra una línea base'
+
+    def add_arguments(self, parser):
+        parser.add_argument('calendar_id', type=int, nargs='?', help='Por defecto, el calendario con más eventos')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--operations', help=f"Lista separada por comas (por defecto: {','.join(OPERATIONS)})")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Archivo JSON de resultados (por defecto en BENCHMARK_DIR)')
+        parser.add_argument('--baseline', help='Línea base a comparar (por defecto BENCHMARK_DIR/baseline.json)')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Aumento relativo tolerado (0.25 = 25%%)')
+        parser.add_argument('--save-baseline', action='store_true', help='Guarda estos resultados como línea base')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['calendar_id'] is not None:
+            calendar = ExamCalendar.objects.filter(id=options['calendar_id']).first()
+        else:
+            calendar = ExamCalendar.objects.annotate(n=Count('events')).order_by('-n', 'id').first()
+        if calendar is None:
+            raise CommandError('No hay calendario para medir (ver manage.py seed_scale)')
+        operations = [name.strip() for name in (options['operations'] or '').split(',') if name.strip()] or list(OPERATIONS)
+        unknown = sorted(set(operations) - set(OPERATIONS))
+        if unknown:
+            raise CommandError(f"Operaciones desconocidas: {', '.join(unknown)}")
+        user = User.objects.filter(is_superuser=True).order_by('id').first()
+        if user is None:
+            user, _ = User.objects.get_or_create(username='benchmark')
+
+        def log(name, metrics):
+            self.stdout.write(
+                f"{name:<20} p50 {metrics['p50_ms']:>9.2f} ms  p95 {metrics['p95_ms']:>9.2f} ms  "
+                f"{metrics['queries']:>4} queries  {metrics['peak_kib']:>9.1f} KiB"
+            )
+
+        self.stdout.write(f'Calendario: {calendar} (#{calendar.id})')
+        results = run_benchmark(
+            calendar, user, operations,
+            iterations=options['iterations'], warmup=options['warmup'], seed=options['seed'], log=log,
+        )
+
+        directory = Path(settings.BENCHMARK_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        output = Path(options['output'] or directory / f"benchmark-{timezone.now():%Y%m%d-%H%M%S}.json")
+        output.write_text(json.dumps(results, indent=2, ensure_ascii=False))
+        self.stdout.write(f'Resultados: {output}')
+
+        baseline_path = Path(options['baseline'] or directory / 'baseline.json')
+        if options['save_baseline']:
+            baseline_path.write_text(json.dumps(results, indent=2, ensure_ascii=False))
+            self.stdout.write(self.style.SUCCESS(f'Línea base guardada en {baseline_path}'))
+            return
+        if not baseline_path.exists():
+            self.stdout.write(f'Sin línea base en {baseline_path} (usar --save-baseline)')
+            return
+        baseline = json.loads(baseline_path.read_text())
+        if baseline.get('dataset') != results['dataset']:
+            self.stdout.write(self.style.WARNING('La línea base se midió con otros datos; la comparación es orientativa'))
+        regressions = compare_results(results, baseline, options['tolerance'])
+        for item in regressions:
+            self.stdout.write(self.style.ERROR(
+                f"Regresión en {item['operation']}.{item['metric']}: {item['baseline']} -> {item['current']}"
+            ))
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS('Sin regresiones respecto de la línea base'))
+        elif options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} regresiones')
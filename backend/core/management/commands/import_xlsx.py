@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.imports import COLUMNS, ImportFileError, import_xlsx
+from core.models import ExamCalendar
+
+
+class Command(BaseCommand):
+    help = 'Importa materias, feriados o eventos desde una planilla Excel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(COLUMNS))
+        parser.add_argument('path')
+        parser.add_argument('--calendar', type=int, help='Calendario destino (feriados y eventos)')
+        parser.add_argument('--sheet', help='Nombre de la hoja (por defecto, la primera)')
+        parser.add_argument('--dry-run', action='store_true', help='Valida el archivo sin guardar cambios')
+
+    def handle(self, *args, **options):
+        calendar = None
+        if options['calendar'] is not None:
+            try:
+                calendar = ExamCalendar.objects.get(id=options['calendar'])
+            except ExamCalendar.DoesNotExist:
+                raise CommandError('Calendario inexistente')
+
+        started = time.monotonic()
+        try:
+            with open(options['path'], 'rb') as fh:
+                report = import_xlsx(fh, options['kind'], calendar, sheet=options['sheet'], dry_run=options['dry_run'])
+        except (ImportFileError, OSError) as exc:
+            raise CommandError(str(exc))
+
+        for item in report['errors']:
+            self.stdout.write(self.style.WARNING(f"Fila {item['row']}: {item['error']}"))
+        if report['error_count'] > len(report['errors']):
+            self.stdout.write(self.style.WARNING(f"... y {report['error_count'] - len(report['errors'])} errores más"))
+        elapsed = time.monotonic() - started
+        summary = (
+            f"{report['rows']} filas en {elapsed:.1f}s: {report['created']} creados, "
+            f"{report['updated']} actualizados, {report['unchanged']} sin cambios, {report['error_count']} con errores"
+        )
+        if options['dry_run']:
+            summary += ' (simulación, sin cambios)'
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,129 @@
+from datetime import date, timedelta
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection, connections
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from core.models import ExamCalendar, Subject
+
+# Perfil de SQLite sin ajustes (como antes de SQLITE_PRAGMAS): journal en modo DELETE,
+# fsync en cada commit y una conexión nueva por request.
+BASELINE_PRAGMAS = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+
+
+class Command(BaseCommand):
+    help = 'Mide el throughput de assign_event con varios editores concurrentes sobre un calendario de prueba'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=50, help='Requests por hilo')
+        parser.add_argument('--compare', action='store_true', help='Corre antes la misma carga sin el perfil de SQLite')
+
+    def handle(self, *args, **options):
+        user, created_user = User.objects.get_or_create(username='load-test')
+        start = date.today() + timedelta(days=365)
+        calendar = ExamCalendar.objects.create(
+            name='Prueba de carga', period_type=ExamCalendar.PeriodType.F1,
+            start_date=start, end_date=start + timedelta(days=30), created_by=user,
+        )
+        subjects = Subject.objects.bulk_create(
+            Subject(name=f'Carga {n}', semester_group=Subject.SemesterGroup.EXTRA) for n in range(options['threads'])
+        )
+        days = [start + timedelta(days=n) for n in range(31) if (start + timedelta(days=n)).weekday() < 5]
+
+        runs = [('perfil configurado', settings.SQLITE_PRAGMAS, settings.DB_CONN_MAX_AGE)]
+        if options['compare'] and connection.vendor == 'sqlite':
+            runs.insert(0, ('sin perfil', BASELINE_PRAGMAS, 0))
+        results = []
+        try:
+            for label, pragmas, max_age in runs:
+                result = self.run(label, pragmas, max_age, calendar, subjects, days, user, options['requests'])
+                results.append(result)
+                self.stdout.write(
+                    f"{label}: {result['ok']} ok, {result['errors']} errores en {result['seconds']:.2f} s "
+                    f"-> {result['throughput']:.1f} req/s (p50 {result['p50']:.1f} ms, p95 {result['p95']:.1f} ms)"
+                )
+        finally:
+            calendar.delete()
+            Subject.objects.filter(id__in=[subject.id for subject in subjects]).delete()
+            if created_user:
+                user.delete()
+        if len(results) == 2 and results[0]['throughput']:
+            self.stdout.write(self.style.SUCCESS(f"Mejora: x{results[1]['throughput'] / results[0]['throughput']:.2f}"))
+
+    def run(self, label, pragmas, max_age, calendar, subjects, days, user, requests):
+        # Cada hilo es un editor que mueve su materia por el calendario; todos compiten por
+        # el lock de escritura. close_old_connections imita el fin de request del servidor
+        # (el cliente de pruebas lo desconecta), que es donde actúa CONN_MAX_AGE.
+        latencies = []
+        errors = []
+        barrier = threading.Barrier(len(subjects))
+        db_settings = connections['default'].settings_dict
+        previous_max_age = db_settings['CONN_MAX_AGE']
+
+        def editor(offset, subject):
+            client = APIClient()
+            client.force_authenticate(user)
+            barrier.wait()
+            try:
+                for n in range(requests):
+                    started = time.perf_counter()
+                    try:
+                        response = client.post(
+                            f'/api/calendars/{calendar.id}/assign_event/',
+                            {'subject': subject.id, 'date': days[(offset + n) % len(days)].isoformat()},
+                            format='json',
+                        )
+                    except Exception as exc:
+                        errors.append(type(exc).__name__)
+                    else:
+                        if response.status_code == 200:
+                            latencies.append((time.perf_counter() - started) * 1000)
+                        else:
+                            errors.append(response.status_code)
+                    close_old_connections()
+            finally:
+                connections.close_all()
+
+        # journal_mode es persistente en el archivo y cambiarlo exige que nadie más lo tenga
+        # abierto: se fija una vez antes de lanzar los hilos.
+        pragmas = dict(pragmas)
+        journal_mode = pragmas.pop('journal_mode', None)
+        connections.close_all()
+        if journal_mode and connection.vendor == 'sqlite':
+            with override_settings(SQLITE_PRAGMAS={}), connection.cursor() as cursor:
+                cursor.execute(f'PRAGMA journal_mode = {journal_mode}')
+            connection.close()
+        db_settings['CONN_MAX_AGE'] = max_age
+        try:
+            with override_settings(SQLITE_PRAGMAS=pragmas):
+                threads = [threading.Thread(target=editor, args=(n, subject)) for n, subject in enumerate(subjects)]
+                started = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                seconds = time.perf_counter() - started
+        finally:
+            db_settings['CONN_MAX_AGE'] = previous_max_age
+            connections.close_all()
+
+        latencies.sort()
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] if latencies else 0.0
+
+        return {
+            'label': label,
+            'ok': len(latencies),
+            'errors': len(errors),
+            'seconds': seconds,
+            'throughput': len(latencies) / seconds if seconds else 0.0,
+            'p50': percentile(0.5),
+            'p95': percentile(0.95),
+        }
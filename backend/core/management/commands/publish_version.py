@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.feeds import publish_version
+from core.models import CalendarVersion
+
+
+class Command(BaseCommand):
+    help = 'Publica los feeds JSON e iCalendar de un calendario a partir de una versión guardada'
+
+    def add_arguments(self, parser):
+        parser.add_argument('version_id', type=int)
+
+    def handle(self, *args, **options):
+        version = CalendarVersion.objects.select_related('calendar').filter(id=options['version_id']).first()
+        if version is None:
+            raise CommandError('Versión inexistente')
+        result = publish_version(version)
+        self.stdout.write(self.style.SUCCESS(
+            f"Calendario {result['calendar']} publicado desde la versión {version.version_number}: "
+            f"{result['exams']} exámenes, feeds en /api/public/calendars/{result['calendar']}/"
+        ))
+        for feed in result['feeds']:
+            self.stdout.write(f'  {feed}')
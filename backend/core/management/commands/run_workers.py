@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.jobs import fail_interrupted_jobs, serve_forever
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta los trabajos en segundo plano (exportaciones y planificación automática)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.JOBS_WORKERS)
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--once', action='store_true', help='Procesa la cola pendiente y termina')
+
+    def handle(self, *args, **options):
+        interrupted = fail_interrupted_jobs()
+        if interrupted:
+            self.stdout.write(self.style.WARNING(f'{interrupted} trabajos interrumpidos marcados como fallidos'))
+        self.stdout.write(self.style.SUCCESS(f"Workers iniciados: {options['workers']}"))
+        try:
+            serve_forever(
+                workers=options['workers'],
+                poll_interval=options['poll_interval'],
+                log=self.stdout.write,
+                once=options['once'],
+            )
+        except KeyboardInterrupt:
+            self.stdout.write('Workers detenidos')
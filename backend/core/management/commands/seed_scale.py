@@ -0,0 +1,175 @@
+from datetime import date, timedelta
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import CalendarBlockedDay, ExamCalendar, ExamEvent, Rule, Subject
+from core.rule_index import bump_rule_index
+from core.versions import create_version
+
+# Datos sintéticos a escala de producción para reproducir problemas de rendimiento. Todo lo
+# generado se reconoce por el prefijo (código de materia ESC-, calendarios "Escala ...").
+CODE_PREFIX = 'ESC-'
+CALENDAR_PREFIX = 'Escala'
+AREAS = [
+    'Cálculo', 'Álgebra', 'Física', 'Química', 'Programación', 'Estadística', 'Mecánica',
+    'Electrónica', 'Termodinámica', 'Materiales', 'Redes', 'Bases de Datos', 'Control',
+    'Circuitos', 'Geometría', 'Economía', 'Sistemas', 'Estructuras', 'Hidráulica', 'Señales',
+]
+LEVELS = ['I', 'II', 'III', 'IV']
+# (mes, día) de inicio de cada periodo; cada periodo dura PERIOD_DAYS días.
+PERIOD_STARTS = {'P1': (4, 6), 'P2': (6, 1), 'F1': (7, 6), 'F2': (12, 1)}
+PERIOD_DAYS = 26
+# Mezcla de reglas por par de materias: (tipo, severidad, params, peso).
+PAIR_RULES = [
+    (Rule.RuleType.PREFER_SAME_DAY, Rule.Severity.SOFT, {}, 40),
+    (Rule.RuleType.SAME_DAY, Rule.Severity.HARD, {}, 10),
+    (Rule.RuleType.SAME_DAY, Rule.Severity.SOFT, {}, 10),
+    (Rule.RuleType.FORBID_SAME_DAY, Rule.Severity.HARD, {}, 25),
+    (Rule.RuleType.MIN_GAP_DAYS, Rule.Severity.SOFT, {'min_days': 2}, 15),
+]
+
+
+class Command(BaseCommand):
+    help = 'Genera un conjunto de datos grande y reproducible (materias, calendarios, reglas, feriados y versiones)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subjects', type=int, default=3000)
+        parser.add_argument('--calendars-per-period', type=int, default=12)
+        parser.add_argument('--year', type=int, default=date.today().year + 1, help='Primer año de los calendarios')
+        parser.add_argument('--years', type=int, default=1)
+        parser.add_argument('--rules-per-calendar', type=int, default=150, help='Reglas entre pares de materias por calendario')
+        parser.add_argument('--global-rules', type=int, default=20)
+        parser.add_argument('--blocked-days', type=int, default=3, help='Feriados por calendario')
+        parser.add_argument('--fill', type=float, default=0.85, help='Fracción de las materias de cada calendario ya ubicadas')
+        parser.add_argument('--versions', type=int, default=300, help='Versiones en total, repartidas entre los calendarios')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--clear', action='store_true', help='Borra antes los datos generados por este comando')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        rng = random.Random(options['seed'])
+        if options['clear']:
+            self.clear()
+        user = User.objects.filter(is_superuser=True).order_by('id').first()
+        if user is None:
+            user, _ = User.objects.get_or_create(username='seed-scale')
+
+        with transaction.atomic():
+            subjects = self.create_subjects(rng, options['subjects'])
+            calendars = self.create_calendars(rng, user, subjects, options)
+            self.create_global_rules(rng, subjects, options['global_rules'])
+        # bulk_create no emite señales: se invalida el índice de reglas a mano.
+        bump_rule_index()
+        versions = self.create_versions(rng, user, calendars, options['versions'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(subjects)} materias, {len(calendars)} calendarios, "
+            f"{ExamEvent.objects.filter(calendar__in=[c for c, _ in calendars]).count()} eventos, "
+            f"{Rule.objects.filter(calendar__in=[c for c, _ in calendars]).count() + options['global_rules']} reglas, "
+            f"{versions} versiones ({time.monotonic() - started:.1f} s)"
+        ))
+
+    def clear(self):
+        calendars = ExamCalendar.objects.filter(name__startswith=f'{CALENDAR_PREFIX} ')
+        deleted = calendars.count()
+        calendars.delete()
+        Rule.objects.filter(global_rule=True, subject_a__code__startswith=CODE_PREFIX).delete()
+        Subject.objects.filter(code__startswith=CODE_PREFIX).delete()
+        bump_rule_index()
+        self.stdout.write(f'{deleted} calendarios generados anteriormente eliminados')
+
+    def create_subjects(self, rng, count):
+        groups = [Subject.SemesterGroup.SEM2] * 45 + [Subject.SemesterGroup.SEM4] * 45 + [Subject.SemesterGroup.EXTRA] * 10
+        subjects = []
+        for n in range(count):
+            # Pocas materias con días restringidos, como en los planes reales.
+            weekdays = rng.choice([['Monday', 'Wednesday', 'Friday'], ['Saturday']]) if rng.random() < 0.04 else []
+            subjects.append(Subject(
+                name=f'{rng.choice(AREAS)} {rng.choice(LEVELS)} ({n + 1:05})',
+                code=f'{CODE_PREFIX}{n + 1:05}',
+                semester_group=rng.choice(groups),
+                is_heavy=rng.random() < 0.3,
+                allowed_weekdays=weekdays,
+            ))
+        return Subject.objects.bulk_create(subjects, batch_size=1000)
+
+    def create_calendars(self, rng, user, subjects, options):
+        # Cada periodo reparte todas las materias entre sus calendarios (uno por carrera).
+        per_period = options['calendars_per_period']
+        calendars = []
+        blocked = []
+        events = []
+        rules = []
+        for year in range(options['year'], options['year'] + options['years']):
+            for period, (month, day) in PERIOD_STARTS.items():
+                start = date(year, month, day)
+                days = [start + timedelta(days=n) for n in range(PERIOD_DAYS)]
+                for index in range(per_period):
+                    calendar = ExamCalendar.objects.create(
+                        name=f'{CALENDAR_PREFIX} {period} {year} #{index + 1:02}', period_type=period,
+                        start_date=start, end_date=days[-1], created_by=user,
+                    )
+                    members = subjects[index::per_period]
+                    calendars.append((calendar, members))
+                    holidays = set(rng.sample(days, min(options['blocked_days'], len(days))))
+                    blocked.extend(CalendarBlockedDay(calendar=calendar, date=d) for d in sorted(holidays))
+                    open_days = [d for d in days if d.weekday() != 6 and d not in holidays]
+                    for subject in rng.sample(members, int(len(members) * options['fill'])):
+                        events.append(ExamEvent(calendar=calendar, subject=subject, date=rng.choice(open_days)))
+                    rules.extend(self.calendar_rules(rng, calendar, members, options['rules_per_calendar']))
+        CalendarBlockedDay.objects.bulk_create(blocked, batch_size=1000)
+        ExamEvent.objects.bulk_create(events, batch_size=1000)
+        Rule.objects.bulk_create(rules, batch_size=1000)
+        return calendars
+
+    def calendar_rules(self, rng, calendar, members, count):
+        rules = [
+            Rule(calendar=calendar, rule_type=Rule.RuleType.HEAVY_NOT_SAME_DAY, severity=Rule.Severity.SOFT),
+            Rule(
+                calendar=calendar, rule_type=Rule.RuleType.MAX_EXAMS_PER_DAY_GROUP,
+                severity=Rule.Severity.SOFT, params={'max_exams': 4},
+            ),
+        ]
+        if len(members) < 2:
+            return rules
+        weights = [weight for *_, weight in PAIR_RULES]
+        # Grafo denso: las reglas se concentran en un subconjunto de las materias.
+        hubs = rng.sample(members, max(2, len(members) // 3))
+        for _ in range(count):
+            rule_type, severity, params, _ = rng.choices(PAIR_RULES, weights)[0]
+            subject_a, subject_b = rng.sample(hubs, 2)
+            rules.append(Rule(
+                calendar=calendar, rule_type=rule_type, severity=severity,
+                subject_a=subject_a, subject_b=subject_b, params=params,
+            ))
+        return rules
+
+    def create_global_rules(self, rng, subjects, count):
+        Rule.objects.bulk_create([
+            Rule(
+                global_rule=True, rule_type=Rule.RuleType.PREFER_SAME_DAY, severity=Rule.Severity.SOFT,
+                subject_a=subject_a, subject_b=subject_b,
+            )
+            for subject_a, subject_b in (rng.sample(subjects, 2) for _ in range(count))
+        ])
+
+    def create_versions(self, rng, user, calendars, count):
+        # Entre versión y versión se mueven algunos eventos, así cada una guarda un delta real.
+        if not calendars:
+            return 0
+        events = {calendar.id: list(calendar.events.all()) for calendar, _ in calendars}
+        now = timezone.now()
+        for n in range(count):
+            calendar, _ = calendars[n % len(calendars)]
+            moved = rng.sample(events[calendar.id], min(5, len(events[calendar.id])))
+            for event in moved:
+                event.date = calendar.start_date + timedelta(days=rng.randrange(PERIOD_DAYS))
+                event.updated_at = now
+            ExamEvent.objects.bulk_update(moved, ['date', 'updated_at'])
+            create_version(calendar, f'Borrador {n // len(calendars) + 1}', user)
+        return count
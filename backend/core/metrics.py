@@ -0,0 +1,288 @@
+from bisect import bisect_left
+from contextlib import contextmanager, suppress
+from contextvars import ContextVar
+import json
+import os
+from pathlib import Path
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin lock entre procesos.
+    fcntl = None
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+# Instrumentación por request: tiempo total, queries SQL y tramos con nombre (span) en el
+# header Server-Timing, más contadores e histogramas que expone /api/metrics en formato
+# Prometheus. Con METRICS_ENABLED=False el middleware no se instala y span() no mide nada.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_PREFIX = 'fiuna_'
+METRIC_HELP = {
+    'http_request_duration_seconds': ('histogram', 'Duración de los requests por vista y método'),
+    'http_requests_total': ('counter', 'Requests por vista, método y código de estado'),
+    'http_request_db_queries_total': ('counter', 'Queries SQL ejecutadas por los requests'),
+    'http_request_db_seconds_total': ('counter', 'Tiempo en queries SQL de los requests'),
+    'span_duration_seconds': ('histogram', 'Duración de los tramos instrumentados (core.metrics.span)'),
+}
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    # Acumulador del request en curso; también hace de execute_wrapper de la conexión.
+    __slots__ = ('queries', 'sql_seconds', 'spans')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.spans = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_seconds += time.perf_counter() - started
+
+    def server_timing(self, total):
+        parts = [f'total;dur={total * 1000:.1f}', f'db;dur={self.sql_seconds * 1000:.1f};desc="{self.queries} queries"']
+        parts.extend(f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.spans.items())
+        return ', '.join(parts)
+
+
+MERGED_FILE = 'merged.json'
+
+# Marca de respaldo para la identidad del proceso donde no hay /proc.
+_IMPORTED_AT = str(time.time_ns())
+
+
+def _start_time(pid):
+    # Inicio del proceso en ticks desde el arranque (campo 22 de /proc/<pid>/stat); None si
+    # el proceso no existe o no hay /proc.
+    try:
+        stat = Path(f'/proc/{pid}/stat').read_text()
+    except OSError:
+        return None
+    return stat.rsplit(')', 1)[1].split()[19]
+
+
+def process_key():
+    # pid más inicio del proceso: un pid reutilizado no pisa el archivo de un proceso muerto.
+    pid = os.getpid()
+    return f'{pid}-{_start_time(pid) or _IMPORTED_AT}'
+
+
+def _alive(key):
+    pid, _, started = key.partition('-')
+    return pid.isdigit() and started == _start_time(int(pid))
+
+
+@contextmanager
+def _directory_lock(directory):
+    with open(directory / '.lock', 'a') as fh:
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        yield
+
+
+def _read(path):
+    try:
+        data = json.loads(Path(path).read_text())
+    except (OSError, ValueError):
+        return None
+    counters = {(name, tuple(tuple(pair) for pair in labels)): value for name, labels, value in data['counters']}
+    histograms = {(name, tuple(tuple(pair) for pair in labels)): values for name, labels, values in data['histograms']}
+    return counters, histograms, data.get('sources', [])
+
+
+def _write(path, counters, histograms, **extra):
+    temporary = path.with_suffix('.tmp')
+    temporary.write_text(json.dumps({
+        'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+        'histograms': [[name, labels, values] for (name, labels), values in histograms.items()],
+        **extra,
+    }))
+    os.replace(temporary, path)
+
+
+def _add(counters, histograms, other_counters, other_histograms):
+    for key, value in other_counters.items():
+        counters[key] = counters.get(key, 0) + value
+    for key, values in other_histograms.items():
+        current = histograms.get(key, [0] * len(values))
+        histograms[key] = [a + b for a, b in zip(current, values)]
+
+
+class Registry:
+    # Contadores e histogramas del proceso, indexados por (nombre, etiquetas). Con
+    # METRICS_DIR cada proceso vuelca los suyos a <pid>-<inicio>.json cada
+    # METRICS_FLUSH_INTERVAL segundos y /api/metrics suma los de todos los workers.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        # Histograma: cantidad por bucket (el último es +Inf) seguida de la suma.
+        self.histograms = {}
+        self.flushed_at = 0.0
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, seconds):
+        key = (name, labels)
+        index = bisect_left(LATENCY_BUCKETS, seconds)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += seconds
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counters), {key: list(values) for key, values in self.histograms.items()}
+
+    def maybe_flush(self):
+        if settings.METRICS_DIR and time.monotonic() - self.flushed_at >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        self.flushed_at = time.monotonic()
+        counters, histograms = self.snapshot()
+        directory = Path(settings.METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        _write(directory / f'{process_key()}.json', counters, histograms)
+
+    def fold(self, directory, paths):
+        # Suma los archivos de procesos muertos a merged.json y los borra: los totales no
+        # bajan al terminar un worker. `sources` registra lo ya sumado por si se corta
+        # entre la escritura y el borrado. Se llama con el lock del directorio tomado.
+        merged = directory / MERGED_FILE
+        counters, histograms, sources = _read(merged) or ({}, {}, [])
+        sources = [name for name in sources if (directory / name).exists()]
+        for path in paths:
+            name = Path(path).name
+            data = _read(path)
+            if name in sources or data is None:
+                continue
+            _add(counters, histograms, data[0], data[1])
+            sources.append(name)
+        _write(merged, counters, histograms, sources=sources)
+        for path in paths:
+            with suppress(FileNotFoundError):
+                os.unlink(path)
+
+    def collect(self):
+        # Métricas de este proceso más las volcadas por los demás y las acumuladas de los
+        # que ya terminaron. Un archivo sin escribir hace más de METRICS_STALE_SECONDS cuyo
+        # proceso ya no existe se pasa a merged.json.
+        counters, histograms = self.snapshot()
+        if not settings.METRICS_DIR or not Path(settings.METRICS_DIR).is_dir():
+            return counters, histograms
+        directory = Path(settings.METRICS_DIR)
+        own = f'{process_key()}.json'
+        cutoff = time.time() - settings.METRICS_STALE_SECONDS
+        # Con el lock, ningún archivo se cuenta dos veces (o ninguna) mientras otro lo pasa.
+        with _directory_lock(directory):
+            dead = [
+                entry.path for entry in os.scandir(directory)
+                if entry.name not in (own, MERGED_FILE) and entry.name.endswith('.json')
+                and entry.stat().st_mtime < cutoff and not _alive(entry.name[:-5])
+            ]
+            if dead:
+                self.fold(directory, dead)
+            for entry in os.scandir(directory):
+                if entry.name == own or not entry.name.endswith('.json'):
+                    continue
+                data = _read(entry.path)
+                if data is not None:
+                    _add(counters, histograms, data[0], data[1])
+        return counters, histograms
+
+
+registry = Registry()
+
+
+@contextmanager
+def span(name):
+    # Tramo con nombre: suma su duración al Server-Timing del request en curso y a su histograma.
+    if not settings.METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        timings = _current.get()
+        if timings is not None:
+            timings.spans[name] = timings.spans.get(name, 0.0) + elapsed
+        registry.observe('span_duration_seconds', (('span', name),), elapsed)
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(timings):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        elapsed = time.perf_counter() - started
+        response['Server-Timing'] = timings.server_timing(elapsed)
+
+        match = request.resolver_match
+        labels = (('view', match.view_name if match else 'unmatched'), ('method', request.method))
+        registry.observe('http_request_duration_seconds', labels, elapsed)
+        registry.inc('http_requests_total', labels + (('status', str(response.status_code)),))
+        registry.inc('http_request_db_queries_total', labels, timings.queries)
+        registry.inc('http_request_db_seconds_total', labels, timings.sql_seconds)
+        registry.maybe_flush()
+        return response
+
+
+def _label_text(labels):
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for key, value in labels
+    )
+    return ','.join(f'{key}="{value}"' for key, value in escaped)
+
+
+def render_metrics():
+    # Formato de texto de Prometheus (version 0.0.4).
+    counters, histograms = registry.collect()
+    lines = []
+    for name, (kind, description) in METRIC_HELP.items():
+        full = METRIC_PREFIX + name
+        lines.append(f'# HELP {full} {description}')
+        lines.append(f'# TYPE {full} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{full}{{{_label_text(labels)}}} {value}')
+            continue
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip((*LATENCY_BUCKETS, '+Inf'), values[:-1]):
+                cumulative += count
+                lines.append(f'{full}_bucket{{{_label_text(labels + (("le", bound),))}}} {cumulative}')
+            lines.append(f'{full}_sum{{{_label_text(labels)}}} {values[-1]}')
+            lines.append(f'{full}_count{{{_label_text(labels)}}} {cumulative}')
+    return '\n'.join(lines) + '\n'
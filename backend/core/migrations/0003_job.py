@@ -0,0 +1,39 @@
+# Generated by Django 5.0.7 on 2026-10-18 14:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_subject_group_extra'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('EXPORT_EXCEL', 'Exportación Excel'), ('EXPORT_PDF', 'Exportación PDF'), ('AUTO_SCHEDULE', 'Planificación automática')], max_length=20)),
+                ('status', models.CharField(choices=[('QUEUED', 'En cola'), ('RUNNING', 'En ejecución'), ('DONE', 'Finalizado'), ('FAILED', 'Fallido')], default='QUEUED', max_length=10)),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('progress', models.FloatField(default=0)),
+                ('message', models.CharField(blank=True, max_length=200)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('result_file', models.CharField(blank=True, max_length=255)),
+                ('result_name', models.CharField(blank=True, max_length=200)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('calendar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='core.examcalendar')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.7 on 2026-10-18 14:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_version_delta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examcalendar',
+            name='head_version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.calendarversion'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.7 on 2026-10-18 14:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_calendar_head_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='calendarversion',
+            index=models.Index(fields=['calendar', '-version_number'], name='core_version_calendar_number'),
+        ),
+        migrations.AddIndex(
+            model_name='examevent',
+            index=models.Index(fields=['calendar', 'date'], name='core_event_calendar_date'),
+        ),
+        migrations.AddIndex(
+            model_name='rule',
+            index=models.Index(fields=['enabled', 'global_rule'], name='core_rule_enabled_global'),
+        ),
+        migrations.AddIndex(
+            model_name='rule',
+            index=models.Index(fields=['calendar', 'enabled'], name='core_rule_calendar_enabled'),
+        ),
+        migrations.AddIndex(
+            model_name='subject',
+            index=models.Index(fields=['semester_group', 'name'], name='core_subject_group_name'),
+        ),
+    ]
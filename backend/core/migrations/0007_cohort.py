@@ -0,0 +1,22 @@
+# Generated by Django 5.0.7 on 2026-10-18 14:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Cohort',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=120, unique=True)),
+                ('size', models.PositiveIntegerField(default=1)),
+                ('subjects', models.ManyToManyField(blank=True, related_name='cohorts', to='core.subject')),
+            ],
+        ),
+    ]
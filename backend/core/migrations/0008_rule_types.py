@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-18 14:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_cohort'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='rule',
+            name='rule_type',
+            field=models.CharField(choices=[('SAME_DAY', 'Mismo día'), ('PREFER_SAME_DAY', 'Preferir mismo día'), ('FORBID_SAME_DAY', 'Prohibir mismo día'), ('HEAVY_NOT_SAME_DAY', 'Pesadas no mismo día'), ('SUBJECT_ONLY_WEEKDAYS', 'Solo días permitidos'), ('SUBJECT_ONLY_FIXED_DATES', 'Solo fechas fijas'), ('MAX_EXAMS_PER_DAY_GROUP', 'Máximo de exámenes por día y grupo'), ('MIN_GAP_DAYS', 'Separación mínima en días')], max_length=40),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.7 on 2026-10-18 14:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_calendar_change'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calendarchange',
+            name='revision',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examcalendar',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='calendarchange',
+            index=models.Index(fields=['calendar', 'revision'], name='core_change_calendar_rev'),
+        ),
+    ]
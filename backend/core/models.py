@@ -15,6 +15,20 @@ class Subject(models.Model):
     allowed_weekdays = models.JSONField(default=list, blank=True)
     fixed_dates = models.JSONField(default=list, blank=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['semester_group', 'name'], name='core_subject_group_name')]
+
+    def __str__(self):
+        return self.name
+
+
+class Cohort(models.Model):
+    # Grupo de estudiantes que rinde el mismo conjunto de materias (p. ej. recursantes de
+    # 2do semestre que cursan materias de 4to). Es la matriz de inscripción materia × cohorte.
+    name = models.CharField(max_length=120, unique=True)
+    size = models.PositiveIntegerField(default=1)
+    subjects = models.ManyToManyField(Subject, related_name='cohorts', blank=True)
+
     def __str__(self):
         return self.name
 
@@ -33,6 +47,13 @@ class ExamCalendar(models.Model):
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Última versión guardada o restaurada: es el padre de la próxima versión.
+    head_version = models.ForeignKey(
+        'CalendarVersion', on_delete=models.SET_NULL, related_name='+', null=True, blank=True,
+    )
+    # Se incrementa en cada escritura de eventos o feriados (core/revisions.py); los clientes
+    # la envían en If-Match para no pisar cambios de otro editor.
+    revision = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f'{self.name} ({self.get_period_type_display()})'
@@ -56,6 +77,7 @@ class ExamEvent(models.Model):
 
     class Meta:
         unique_together = ('calendar', 'subject')
+        indexes = [models.Index(fields=['calendar', 'date'], name='core_event_calendar_date')]
 
 
 class Rule(models.Model):
@@ -66,6 +88,8 @@ class Rule(models.Model):
         HEAVY_NOT_SAME_DAY = 'HEAVY_NOT_SAME_DAY', 'Pesadas no mismo día'
         SUBJECT_ONLY_WEEKDAYS = 'SUBJECT_ONLY_WEEKDAYS', 'Solo días permitidos'
         SUBJECT_ONLY_FIXED_DATES = 'SUBJECT_ONLY_FIXED_DATES', 'Solo fechas fijas'
+        MAX_EXAMS_PER_DAY_GROUP = 'MAX_EXAMS_PER_DAY_GROUP', 'Máximo de exámenes por día y grupo'
+        MIN_GAP_DAYS = 'MIN_GAP_DAYS', 'Separación mínima en días'
 
     class Severity(models.TextChoices):
         HARD = 'HARD', 'Hard'
@@ -80,15 +104,75 @@ class Rule(models.Model):
     params = models.JSONField(default=dict, blank=True)
     enabled = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['enabled', 'global_rule'], name='core_rule_enabled_global'),
+            models.Index(fields=['calendar', 'enabled'], name='core_rule_calendar_enabled'),
+        ]
+
 
 class CalendarVersion(models.Model):
     calendar = models.ForeignKey(ExamCalendar, on_delete=models.CASCADE, related_name='versions')
     version_number = models.PositiveIntegerField()
     label = models.CharField(max_length=120, blank=True)
+    # Los keyframes guardan el snapshot completo; el resto solo el delta respecto de `parent`.
+    parent = models.ForeignKey('self', on_delete=models.RESTRICT, related_name='children', null=True, blank=True)
+    is_keyframe = models.BooleanField(default=True)
+    depth = models.PositiveIntegerField(default=0)
     snapshot = models.JSONField(default=dict)
+    delta = models.JSONField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
 
     class Meta:
         unique_together = ('calendar', 'version_number')
+        indexes = [models.Index(fields=['calendar', '-version_number'], name='core_version_calendar_number')]
         ordering = ['-version_number']
+
+
+class Job(models.Model):
+    class Kind(models.TextChoices):
+        EXPORT_EXCEL = 'EXPORT_EXCEL', 'Exportación Excel'
+        EXPORT_PDF = 'EXPORT_PDF', 'Exportación PDF'
+        AUTO_SCHEDULE = 'AUTO_SCHEDULE', 'Planificación automática'
+
+    class Status(models.TextChoices):
+        QUEUED = 'QUEUED', 'En cola'
+        RUNNING = 'RUNNING', 'En ejecución'
+        DONE = 'DONE', 'Finalizado'
+        FAILED = 'FAILED', 'Fallido'
+
+    calendar = models.ForeignKey(ExamCalendar, on_delete=models.CASCADE, related_name='jobs')
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    params = models.JSONField(default=dict, blank=True)
+    progress = models.FloatField(default=0)
+    message = models.CharField(max_length=200, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    result_file = models.CharField(max_length=255, blank=True)
+    result_name = models.CharField(max_length=200, blank=True)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Proceso run_workers que tomó el trabajo (host:pid) y su última señal de vida.
+    worker = models.CharField(max_length=120, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+
+class CalendarChange(models.Model):
+    # Cambios publicados para los editores conectados por WebSocket (core/realtime.py). Sin
+    # calendario aplica a todos (reglas globales). Se purgan tras REALTIME_RETENTION_SECONDS.
+    calendar = models.ForeignKey(ExamCalendar, on_delete=models.CASCADE, related_name='changes', null=True, blank=True)
+    kind = models.CharField(max_length=20)
+    # Revisión del calendario que produjo el cambio: arma el delta de las respuestas 409.
+    revision = models.PositiveIntegerField(null=True, blank=True)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['calendar', 'revision'], name='core_change_calendar_rev')]
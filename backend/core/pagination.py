@@ -0,0 +1,14 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ListCursorPagination(CursorPagination):
+    # Paginación por cursor: estable ante inserciones y sin OFFSET. Cada vista define su
+    # orden en `cursor_ordering` (el último campo debe ser único para desempatar).
+    page_size = 200
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = '-id'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'cursor_ordering', self.ordering)
+        return (ordering,) if isinstance(ordering, str) else tuple(ordering)
@@ -0,0 +1,275 @@
+import atexit
+from calendar import Calendar
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date
+from functools import lru_cache
+from io import BytesIO
+import multiprocessing
+import os
+import threading
+from xml.sax.saxutils import escape
+
+from pypdf import PdfReader, PdfWriter
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import (
+    BaseDocTemplate, Frame, KeepTogether, PageBreak, PageTemplate, Paragraph, Spacer, Table, TableStyle,
+)
+
+# Renderizado de PDF sin acceso a la base: las funciones reciben datos simples (dict,
+# listas, strings) para poder ejecutarse en procesos separados. Se usan las fuentes
+# estándar de reportlab (Helvetica), que no se incrustan ni requieren registro.
+
+BRAND = colors.HexColor('#8a1e11')
+MONTH_NAMES_ES = [
+    '', 'Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio',
+    'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre',
+]
+WEEKDAY_HEADERS_ES = ['Lun', 'Mar', 'Mié', 'Jue', 'Vie', 'Sáb', 'Dom']
+
+LIST_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), BRAND),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+])
+MONTH_TABLE_STYLE = [
+    ('BACKGROUND', (0, 0), (-1, 0), BRAND),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('BACKGROUND', (6, 1), (6, -1), colors.HexColor('#eeeeee')),
+]
+INDEX_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), BRAND),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('LINEBELOW', (0, 1), (-1, -1), 0.25, colors.lightgrey),
+    ('ALIGN', (-2, 0), (-1, -1), 'RIGHT'),
+])
+PARALLEL_MIN_SECTIONS = 8
+MARGIN = 30
+FOOTER_Y = 20
+OUTSIDE_RANGE = colors.HexColor('#f7f7f7')
+BLOCKED = colors.HexColor('#f6d5d1')
+
+# Pool de procesos para render_sections, compartido por todo el proceso (_process_pool).
+_pool = None
+_pool_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def pdf_styles():
+    # Se arma una vez por proceso: getSampleStyleSheet() crea decenas de estilos.
+    base = getSampleStyleSheet()
+    return {
+        'title': base['Title'],
+        'heading': base['Heading2'],
+        'normal': base['Normal'],
+        'small': ParagraphStyle('small', parent=base['Normal'], fontSize=7, leading=8.5),
+        'day': ParagraphStyle('day', parent=base['Normal'], fontName='Helvetica-Bold', fontSize=8, leading=10),
+        'muted': ParagraphStyle('muted', parent=base['Normal'], fontSize=7, leading=8.5, textColor=colors.grey),
+    }
+
+
+def _page_number(canvas, pagesize, number):
+    canvas.drawRightString(pagesize[0] - MARGIN, FOOTER_Y, f'p. {number}')
+
+
+def _footer(text, page_numbers=True):
+    def draw(canvas, doc):
+        canvas.saveState()
+        canvas.setFont('Helvetica', 8)
+        canvas.setFillColor(colors.grey)
+        canvas.drawString(doc.leftMargin, FOOTER_Y, text)
+        if page_numbers:
+            _page_number(canvas, doc.pagesize, doc.page)
+        canvas.restoreState()
+    return draw
+
+
+def build_document(out, pagesize=A4, footer='', page_numbers=True):
+    # Plantilla reutilizable: un único marco y pie con el título de la sección.
+    doc = BaseDocTemplate(out, pagesize=pagesize, leftMargin=MARGIN, rightMargin=MARGIN, topMargin=MARGIN, bottomMargin=36)
+    frame = Frame(doc.leftMargin, doc.bottomMargin, doc.width, doc.height, id='body')
+    doc.addPageTemplates([PageTemplate(id='page', frames=[frame], onPage=_footer(footer, page_numbers))])
+    return doc
+
+
+def page_number_stamps(pagesize, first, count):
+    # Páginas transparentes con solo el número ("p. N" desde `first`), para estampar sobre
+    # páginas ya renderizadas.
+    out = BytesIO()
+    canvas = Canvas(out, pagesize=pagesize)
+    for number in range(first, first + count):
+        canvas.setFont('Helvetica', 8)
+        canvas.setFillColor(colors.grey)
+        _page_number(canvas, pagesize, number)
+        canvas.showPage()
+    canvas.save()
+    return PdfReader(BytesIO(out.getvalue())).pages
+
+
+def calendar_table(days, blocked):
+    # Tabla plana Fecha / Día / Asignaturas; `days`: [(fecha, día, [asignaturas])].
+    data = [['Fecha', 'Día', 'Asignaturas']]
+    for iso, day_name, subjects in days:
+        marker = f' ({blocked[iso]})' if iso in blocked else ''
+        data.append([iso, day_name, ', '.join(subjects) + marker])
+    table = Table(data, colWidths=[90, 90, 320], repeatRows=1)
+    table.setStyle(LIST_TABLE_STYLE)
+    return table
+
+
+def month_grid(year, month, start, end, subjects_by_day, blocked, width):
+    styles = pdf_styles()
+    data = [WEEKDAY_HEADERS_ES]
+    style = list(MONTH_TABLE_STYLE)
+    for row, week in enumerate(Calendar().monthdatescalendar(year, month), start=1):
+        cells = []
+        for col, day in enumerate(week):
+            iso = day.isoformat()
+            if day.month != month:
+                cells.append('')
+                continue
+            content = [Paragraph(str(day.day), styles['day'])]
+            if not start <= day <= end:
+                style.append(('BACKGROUND', (col, row), (col, row), OUTSIDE_RANGE))
+            elif iso in blocked:
+                style.append(('BACKGROUND', (col, row), (col, row), BLOCKED))
+                content.append(Paragraph(escape(blocked[iso]), styles['muted']))
+            content.extend(Paragraph(escape(name), styles['small']) for name in subjects_by_day.get(iso, []))
+            cells.append(content)
+        data.append(cells)
+    table = Table(data, colWidths=[width / 7] * 7, repeatRows=1)
+    table.setStyle(TableStyle(style))
+    return table
+
+
+def _months(start, end):
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def render_section(section):
+    # Una sección del cuadernillo (calendario × grupo) como PDF independiente, sin número de
+    # página: build_booklet estampa la numeración del cuadernillo al concatenar.
+    # `section`: {title, subtitle, start, end, days: {fecha: [asignaturas]}, blocked: {fecha: motivo}}.
+    styles = pdf_styles()
+    out = BytesIO()
+    doc = build_document(out, pagesize=landscape(A4), footer=section['title'], page_numbers=False)
+    start = date.fromisoformat(section['start'])
+    end = date.fromisoformat(section['end'])
+    elements = [
+        Paragraph(escape(section['title']), styles['heading']),
+        Paragraph(escape(section['subtitle']), styles['normal']),
+        Spacer(1, 8),
+    ]
+    for index, (year, month) in enumerate(_months(start, end)):
+        grid = month_grid(year, month, start, end, section['days'], section['blocked'], doc.width)
+        block = [Paragraph(f'{MONTH_NAMES_ES[month]} {year}', styles['heading']), grid]
+        if index:
+            elements.append(PageBreak())
+        elements.append(KeepTogether(block))
+    doc.build(elements)
+    return out.getvalue()
+
+
+def render_cover(title, subtitle, entries):
+    # `entries`: [(sección, periodo, grupo, exámenes, página inicial)].
+    styles = pdf_styles()
+    out = BytesIO()
+    doc = build_document(out, pagesize=landscape(A4), footer=title)
+    data = [['Calendario', 'Periodo', 'Grupo', 'Exámenes', 'Página']]
+    data.extend([name, period, group, str(count), str(page)] for name, period, group, count, page in entries)
+    width = doc.width
+    table = Table(data, colWidths=[width * 0.42, width * 0.18, width * 0.18, width * 0.11, width * 0.11], repeatRows=1)
+    table.setStyle(INDEX_TABLE_STYLE)
+    doc.build([
+        Paragraph(escape(title), styles['title']),
+        Paragraph(escape(subtitle), styles['heading']),
+        Spacer(1, 12),
+        table,
+    ])
+    return out.getvalue()
+
+
+def _process_pool(workers):
+    # Un único pool por proceso del servidor, creado con el primer cuadernillo grande y
+    # compartido por los requests siguientes: arrancar procesos spawn cuesta ~0.5 s y un pool
+    # por request multiplicaría los procesos con varias exportaciones a la vez.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            atexit.register(_pool.shutdown, cancel_futures=True)
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def render_sections(sections, workers=1):
+    # Arrancar procesos cuesta ~0.5 s: con pocas secciones o un solo CPU se renderiza en serie.
+    workers = min(workers, os.cpu_count() or 1)
+    if workers <= 1 or len(sections) < PARALLEL_MIN_SECTIONS:
+        return [render_section(section) for section in sections]
+    # Los procesos solo importan reportlab: no necesitan Django ni conexiones a la base.
+    pool = _process_pool(workers)
+    try:
+        return list(pool.map(render_section, sections, chunksize=max(1, len(sections) // (workers * 4))))
+    except BrokenProcessPool:
+        # Un proceso del pool murió: se descarta (el próximo cuadernillo crea otro) y este se
+        # renderiza en serie.
+        _discard_pool(pool)
+        return [render_section(section) for section in sections]
+
+
+def build_booklet(title, subtitle, sections, workers=1):
+    # Renderiza las secciones (en paralelo si workers > 1), arma el índice con la página
+    # inicial de cada una y concatena todo con marcadores por sección. El índice va primero y
+    # conserva su numeración; las secciones se numeran al final, con la página del cuadernillo.
+    rendered = [PdfReader(BytesIO(content)) for content in render_sections(sections, workers)]
+    cover_pages = 1
+    while True:
+        page = cover_pages + 1
+        entries = []
+        for section, reader in zip(sections, rendered):
+            entries.append((section['calendar'], section['period'], section['group'], section['count'], page))
+            page += len(reader.pages)
+        cover = PdfReader(BytesIO(render_cover(title, subtitle, entries)))
+        if len(cover.pages) == cover_pages:
+            break
+        cover_pages = len(cover.pages)
+
+    writer = PdfWriter()
+    for cover_page in cover.pages:
+        writer.add_page(cover_page)
+    numbers = iter(page_number_stamps(landscape(A4), cover_pages + 1, page - cover_pages - 1))
+    parents = {}
+    for section, reader in zip(sections, rendered):
+        first = len(writer.pages)
+        for section_page in reader.pages:
+            stamped = writer.add_page(section_page)
+            stamped.merge_page(next(numbers))
+            # merge_page deja el contenido sin comprimir: triplicaría el tamaño del PDF.
+            stamped.compress_content_streams()
+        parent = parents.get(section['calendar_id'])
+        if parent is None:
+            parent = writer.add_outline_item(f"{section['calendar']} - {section['period']}", first)
+            parents[section['calendar_id']] = parent
+        writer.add_outline_item(section['group'], first, parent=parent)
+    out = BytesIO()
+    writer.write(out)
+    out.seek(0)
+    return out
@@ -0,0 +1,213 @@
+import asyncio
+from datetime import timedelta
+from http.cookies import CookieError, SimpleCookie
+from importlib import import_module
+import json
+import re
+import threading
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import close_old_connections, transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from .models import CalendarBlockedDay, CalendarChange, CalendarVersion, ExamCalendar, ExamEvent, Rule
+
+# Cambios en vivo por calendario. Las escrituras registran un CalendarChange en su propia
+# transacción; cada proceso ASGI consulta la tabla (una sola query para todos los
+# calendarios) y reparte los cambios a sus WebSockets. Así no hace falta un broker: sirve
+# tanto si la escritura ocurrió en este proceso como en otro (runserver, run_workers).
+
+SOCKET_PATH = re.compile(r'^/ws/calendars/(?P<calendar_id>\d+)/$')
+PRUNE_EVERY = 200
+
+
+def _serialize(kind, ids):
+    # Import diferido: serializers importa versions, que publica cambios desde acá.
+    from .serializers import CalendarBlockedDaySerializer, CalendarVersionSerializer, ExamEventSerializer, RuleSerializer
+
+    if kind == 'events':
+        return ExamEventSerializer(ExamEvent.objects.filter(id__in=ids).select_related('subject'), many=True).data
+    if kind == 'blocked_days':
+        return CalendarBlockedDaySerializer(CalendarBlockedDay.objects.filter(id__in=ids), many=True).data
+    if kind == 'rules':
+        return RuleSerializer(Rule.objects.filter(id__in=ids), many=True).data
+    if kind == 'versions':
+        return CalendarVersionSerializer(CalendarVersion.objects.filter(id__in=ids).defer('snapshot', 'delta'), many=True).data
+    return []
+
+
+def publish(calendar_id, kind, upsert=(), delete=()):
+    # `kind`: events, blocked_days, rules, versions o reload (el cliente vuelve a cargar todo).
+    # `upsert`: ids a enviar serializados; `delete`: ids borrados (fechas en blocked_days).
+    # calendar_id=None llega a todos los calendarios (reglas globales).
+    upsert = list(upsert)
+    delete = [str(value) for value in delete] if kind == 'blocked_days' else list(delete)
+    if kind != 'reload' and not upsert and not delete:
+        return
+
+    # El cambio se guarda dentro de la transacción de la escritura, con la revisión que esta
+    # dejó en el calendario: si se revierte, el cambio tampoco existe.
+    payload = {'upsert': _serialize(kind, upsert) if upsert else [], 'delete': delete}
+    revision = ExamCalendar.objects.filter(id=calendar_id).values_list('revision', flat=True).first() if calendar_id else None
+    change = CalendarChange.objects.create(calendar_id=calendar_id, kind=kind, revision=revision, payload=payload)
+
+    def committed():
+        if change.id % PRUNE_EVERY == 0:
+            cutoff = timezone.now() - timedelta(seconds=settings.REALTIME_RETENTION_SECONDS)
+            CalendarChange.objects.filter(created_at__lt=cutoff).delete()
+        hub.notify()
+
+    transaction.on_commit(committed)
+
+
+def _changes_after(last_id, limit=500):
+    rows = CalendarChange.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'calendar_id', 'kind', 'revision', 'payload')
+    return list(rows[:limit])
+
+
+def _last_change_id():
+    return CalendarChange.objects.aggregate(last=Max('id'))['last'] or 0
+
+
+def _missed_changes(calendar_id, after):
+    # Cambios perdidos durante una reconexión; None si ya se purgaron (hay que recargar).
+    oldest = CalendarChange.objects.aggregate(oldest=Min('id'))['oldest']
+    if oldest is not None and oldest > after + 1:
+        return None
+    rows = CalendarChange.objects.filter(Q(calendar_id=calendar_id) | Q(calendar__isnull=True), id__gt=after)
+    return list(rows.order_by('id').values_list('id', 'calendar_id', 'kind', 'revision', 'payload'))
+
+
+def message(change_id, kind, payload, revision=None):
+    return json.dumps({'id': change_id, 'kind': kind, 'revision': revision, **payload}, ensure_ascii=False)
+
+
+class ChangeHub:
+    # Un poller por proceso para todos los calendarios; cada socket tiene su propia cola.
+
+    def __init__(self):
+        self.subscribers = {}
+        self.last_id = None
+        self.task = None
+        self.loop = None
+        self.wakeup = None
+        self.lock = threading.Lock()
+
+    def notify(self):
+        # Puede llamarse desde el hilo de una vista sync: despierta al poller sin esperar el intervalo.
+        with self.lock:
+            loop, wakeup = self.loop, self.wakeup
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wakeup.set)
+
+    async def subscribe(self, calendar_id):
+        queue = asyncio.Queue()
+        self.subscribers.setdefault(calendar_id, set()).add(queue)
+        if self.task is None or self.task.done():
+            with self.lock:
+                self.loop = asyncio.get_running_loop()
+                self.wakeup = asyncio.Event()
+            self.last_id = await sync_to_async(_last_change_id)()
+            self.task = asyncio.create_task(self.poll())
+        return queue, self.last_id
+
+    def unsubscribe(self, calendar_id, queue):
+        queues = self.subscribers.get(calendar_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[calendar_id]
+
+    async def poll(self):
+        while self.subscribers:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), settings.REALTIME_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            rows = await sync_to_async(_changes_after)(self.last_id)
+            for change_id, calendar_id, kind, revision, payload in rows:
+                self.last_id = change_id
+                targets = self.subscribers.values() if calendar_id is None else [self.subscribers.get(calendar_id, ())]
+                text = message(change_id, kind, payload, revision)
+                for queues in targets:
+                    for queue in queues:
+                        queue.put_nowait(text)
+            if len(rows) == 500:
+                self.wakeup.set()
+
+
+hub = ChangeHub()
+
+
+def _authorize(scope, calendar_id):
+    close_old_connections()
+    headers = {key.decode('latin-1'): value.decode('latin-1') for key, value in scope.get('headers', [])}
+    # Los navegadores envían las cookies en cualquier WebSocket: se exige un origen permitido.
+    origin = headers.get('origin')
+    host = headers.get('host', '')
+    if origin and origin not in settings.CORS_ALLOWED_ORIGINS and origin.split('://', 1)[-1] != host:
+        return False
+    cookie = SimpleCookie()
+    try:
+        cookie.load(headers.get('cookie', ''))
+    except CookieError:
+        return False
+    session_key = cookie[settings.SESSION_COOKIE_NAME].value if settings.SESSION_COOKIE_NAME in cookie else None
+    if not session_key:
+        return False
+    session = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+    user = get_user(SimpleNamespace(session=session))
+    return user.is_authenticated and ExamCalendar.objects.filter(id=calendar_id).exists()
+
+
+async def calendar_socket(scope, receive, send):
+    # ws/calendars/<id>/?after=<último id recibido>: envía `hello` con el último id y luego
+    # cada cambio como JSON {id, kind, revision, upsert, delete}.
+    match = SOCKET_PATH.match(scope['path'])
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+    if match is None:
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+    calendar_id = int(match['calendar_id'])
+    if not await sync_to_async(_authorize)(scope, calendar_id):
+        await send({'type': 'websocket.close', 'code': 4403})
+        return
+    await send({'type': 'websocket.accept'})
+
+    queue, last_id = await hub.subscribe(calendar_id)
+    try:
+        after = parse_qs(scope.get('query_string', b'').decode()).get('after', [''])[0]
+        if after.isdigit():
+            missed = await sync_to_async(_missed_changes)(calendar_id, int(after))
+            if missed is None:
+                await send({'type': 'websocket.send', 'text': message(last_id, 'reload', {})})
+            else:
+                for change_id, _, kind, revision, payload in missed:
+                    if change_id <= last_id:
+                        await send({'type': 'websocket.send', 'text': message(change_id, kind, payload, revision)})
+        await send({'type': 'websocket.send', 'text': message(last_id, 'hello', {})})
+
+        incoming = asyncio.create_task(receive())
+        outgoing = asyncio.create_task(queue.get())
+        while True:
+            done, _ = await asyncio.wait({incoming, outgoing}, return_when=asyncio.FIRST_COMPLETED)
+            if incoming in done:
+                if incoming.result()['type'] == 'websocket.disconnect':
+                    break
+                # Los mensajes del cliente (pings) se ignoran.
+                incoming = asyncio.create_task(receive())
+            if outgoing in done:
+                await send({'type': 'websocket.send', 'text': outgoing.result()})
+                outgoing = asyncio.create_task(queue.get())
+        incoming.cancel()
+        outgoing.cancel()
+    finally:
+        hub.unsubscribe(calendar_id, queue)
@@ -0,0 +1,54 @@
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import CalendarChange, ExamCalendar
+
+# Control de concurrencia optimista por calendario. Cada escritura de eventos o feriados
+# incrementa ExamCalendar.revision dentro de su transacción; si el cliente envió la revisión
+# que vio (If-Match) y ya no coincide, la escritura se rechaza con el delta desde esa revisión.
+
+
+class RevisionConflict(Exception):
+    def __init__(self, calendar, expected):
+        self.calendar = calendar
+        self.expected = expected
+        super().__init__(f'El calendario fue modificado por otra persona (se esperaba la revisión {expected}).')
+
+
+def current_revision(calendar_id):
+    return ExamCalendar.objects.values_list('revision', flat=True).get(id=calendar_id)
+
+
+@contextmanager
+def calendar_write(calendar, revision=None):
+    # Transacción corta de validación y escritura. El UPDATE de la revisión va primero: en
+    # SQLite toma el lock de escritura al empezar (otra escritura espera a que termine en vez
+    # de fallar al pasar de lectura a escritura) y la validación ve el mismo estado que se
+    # escribe. Si el llamador hace set_rollback, la revisión tampoco cambia.
+    with transaction.atomic():
+        rows = ExamCalendar.objects.filter(id=calendar.id)
+        if revision is not None:
+            rows = rows.filter(revision=revision)
+        if not rows.update(revision=F('revision') + 1):
+            raise RevisionConflict(calendar, revision)
+        calendar.revision = current_revision(calendar.id)
+        try:
+            yield calendar.revision
+        except BaseException:
+            calendar.revision -= 1
+            raise
+        if transaction.get_rollback():
+            calendar.revision -= 1
+
+
+def changes_since(calendar_id, revision):
+    # Cambios del calendario posteriores a `revision` en el formato de los mensajes del
+    # WebSocket; None si no se puede asegurar que estén todos (se purgaron: hay que recargar).
+    changes = CalendarChange.objects.filter(calendar_id=calendar_id)
+    rows = list(changes.filter(revision__gt=revision).order_by('id').values_list('id', 'kind', 'revision', 'payload'))
+    complete = (rows and rows[0][2] == revision + 1) or changes.filter(revision__lte=revision).exists()
+    if not complete:
+        return None
+    return [{'id': change_id, 'kind': kind, 'revision': rev, **payload} for change_id, kind, rev, payload in rows]
@@ -0,0 +1,136 @@
+from collections import OrderedDict, namedtuple
+from heapq import merge
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .models import ExamCalendar, Rule
+from .rules import compile_rule, weekday_mask, weekdays_es
+
+GLOBAL_VERSION_KEY = 'rule_index:version'
+
+SubjectConstraints = namedtuple('SubjectConstraints', ['weekday_mask', 'weekday_message', 'fixed_dates', 'fixed_message'])
+
+
+class RuleIndex:
+    # Reglas y feriados de un calendario compilados una vez por versión; se guarda en el
+    # caché de Django (compartido entre procesos) y en memoria del proceso.
+
+    def __init__(self, rules, blocked_dates, version=None):
+        # Clave de versión con la que se compiló (entra en el ETag de la matriz de factibilidad).
+        self.version = version
+        # Evaluadores de core/rules.py; los tipos sin evaluador se descartan.
+        self.rules = [evaluator for evaluator in map(compile_rule, rules) if evaluator is not None]
+        self.blocked_dates = frozenset(blocked_dates)
+        # subject_id -> [(posición, regla)] en el orden original de las reglas.
+        self.by_subject = {}
+        # Reglas que aplican a cualquier materia (HEAVY_NOT_SAME_DAY, MAX_EXAMS_PER_DAY_GROUP).
+        self.general = []
+        for position, rule in enumerate(self.rules):
+            subject_ids = rule.subject_ids()
+            if subject_ids is None:
+                self.general.append((position, rule))
+            for subject_id in subject_ids or ():
+                self.by_subject.setdefault(subject_id, []).append((position, rule))
+        self._subjects = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_subjects'] = {}
+        return state
+
+    @staticmethod
+    def rules_queryset(calendar: ExamCalendar):
+        # `__in=[True]` en lugar de `=True`: Django escribe los booleanos como columna
+        # suelta y SQLite solo usa los índices (enabled, global_rule) y (calendar, enabled)
+        # con comparaciones de igualdad.
+        return (
+            Rule.objects.filter(enabled__in=[True], global_rule__in=[True]) |
+            Rule.objects.filter(calendar=calendar, enabled__in=[True])
+        ).select_related('subject_a', 'subject_b').order_by('id')
+
+    @classmethod
+    def build(cls, calendar: ExamCalendar, version=None):
+        return cls(cls.rules_queryset(calendar), calendar.blocked_days.values_list('date', flat=True), version)
+
+    def rules_for(self, subject_id: int):
+        return [rule for _, rule in merge(self.by_subject.get(subject_id, []), self.general)]
+
+    def subject_constraints(self, subject) -> SubjectConstraints:
+        # Memoizado por contenido: una materia editada en memoria nunca usa datos viejos.
+        key = (subject.id, subject.name, tuple(subject.allowed_weekdays or ()), tuple(subject.fixed_dates or ()))
+        constraints = self._subjects.get(key)
+        if constraints is None:
+            mask = weekday_mask(subject.allowed_weekdays) if subject.allowed_weekdays else None
+            constraints = SubjectConstraints(
+                mask,
+                ('HARD', f'{subject.name} solo puede rendirse en: {weekdays_es(subject.allowed_weekdays)}.') if mask is not None else None,
+                frozenset(subject.fixed_dates) if subject.fixed_dates else None,
+                ('HARD', f'{subject.name} solo permite fechas específicas.'),
+            )
+            self._subjects[key] = constraints
+        return constraints
+
+
+def calendar_version_key(calendar_id):
+    return f'{GLOBAL_VERSION_KEY}:{calendar_id}'
+
+
+def current_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Valor inicial nuevo: si el caché se vació, nunca se reutiliza un índice anterior.
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+class _Bump:
+    # Callback de on_commit con su clave a la vista: mientras espera, la transacción en curso
+    # tiene cambios en reglas o feriados que el índice guardado con esa versión no incluye.
+    def __init__(self, key):
+        self.key = key
+
+    def __call__(self):
+        # Valor nuevo y no un incremento: incr no es atómico en todos los backends de caché y,
+        # si la clave expiró, podría volver a un número ya usado.
+        cache.set(self.key, time.time_ns(), None)
+
+
+def bump_rule_index(calendar_id=None):
+    # Sin calendario invalida todos (reglas globales, materias). Se aplica al confirmar la
+    # transacción para que otro proceso no compile el estado viejo con la versión nueva.
+    transaction.on_commit(_Bump(GLOBAL_VERSION_KEY if calendar_id is None else calendar_version_key(calendar_id)))
+
+
+def dirty_keys():
+    # Claves invalidadas en la transacción en curso. Django descarta los callbacks de
+    # on_commit de un savepoint o una transacción que se deshace, así que la marca dura lo
+    # mismo que los cambios.
+    return {func.key for _, func, _ in connection.run_on_commit if isinstance(func, _Bump)}
+
+
+_local = OrderedDict()
+
+
+def rule_index(calendar: ExamCalendar) -> RuleIndex:
+    global_key, calendar_key = GLOBAL_VERSION_KEY, calendar_version_key(calendar.id)
+    key = f'rule_index:{calendar.id}:{current_version(global_key)}:{current_version(calendar_key)}'
+    if connection.in_atomic_block and not dirty_keys().isdisjoint((global_key, calendar_key)):
+        # La transacción cambió reglas o feriados que la versión todavía no refleja: se compila
+        # lo que ella ve, sin caché, con una clave propia para que no comparta ETag.
+        return RuleIndex.build(calendar, f'{key}:{time.time_ns()}')
+    index = _local.get(key)
+    if index is not None:
+        _local.move_to_end(key)
+        return index
+    index = cache.get(key)
+    if index is None:
+        index = RuleIndex.build(calendar, key)
+        cache.set(key, index, settings.RULE_INDEX_CACHE_TIMEOUT)
+    _local[key] = index
+    while len(_local) > settings.RULE_INDEX_CACHE_SIZE:
+        _local.popitem(last=False)
+    return index
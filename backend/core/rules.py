@@ -0,0 +1,295 @@
+from collections import defaultdict
+from datetime import date, timedelta
+
+from .models import Rule, Subject
+
+WEEKDAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+WEEKDAY_LABELS_ES = {
+    'Monday': 'Lunes',
+    'Tuesday': 'Martes',
+    'Wednesday': 'Miércoles',
+    'Thursday': 'Jueves',
+    'Friday': 'Viernes',
+    'Saturday': 'Sábado',
+    'Sunday': 'Domingo',
+}
+GROUP_LABELS = dict(Subject.SemesterGroup.choices)
+
+# rule_type -> clase evaluadora. Un tipo sin evaluador registrado se ignora.
+RULE_EVALUATORS = {}
+
+
+def register(cls):
+    RULE_EVALUATORS[cls.rule_type] = cls
+    return cls
+
+
+def weekday_mask(names):
+    # Solo cuentan los nombres válidos: una lista sin ninguno da máscara 0 (ningún día).
+    mask = 0
+    for index, name in enumerate(WEEKDAY_NAMES):
+        if name in names:
+            mask |= 1 << index
+    return mask
+
+
+def weekdays_es(names):
+    return ', '.join(WEEKDAY_LABELS_ES.get(day, day) for day in names)
+
+
+def as_list(value):
+    if isinstance(value, str):
+        return [value]
+    return [item for item in value if isinstance(item, str)] if isinstance(value, list) else []
+
+
+def positive_int(value):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value >= 1 else None
+
+
+class RuleEvaluator:
+    # Una regla compilada: `compile` precalcula lo que dependa solo de la regla (máscaras,
+    # conjuntos) y `check` evalúa un candidato (materia, fecha) contra el CalendarContext,
+    # agregando (severidad, mensaje) a `conflicts`. Las instancias se guardan en el índice
+    # de reglas (core/rule_index.py), así que sus atributos deben poder serializarse.
+    rule_type = None
+    # A qué materias aplica: 'pair' (A y B), 'subject' (solo A) o 'all' (todas).
+    scope = 'all'
+
+    def __init__(self, rule: Rule):
+        self.id = rule.id
+        self.rule_type = rule.rule_type
+        self.severity = rule.severity
+        self.subject_a_id = rule.subject_a_id
+        self.subject_b_id = rule.subject_b_id
+        self.subject_a_name = rule.subject_a.name if rule.subject_a_id else None
+        self.subject_b_name = rule.subject_b.name if rule.subject_b_id else None
+        self.params = rule.params
+        self.compile(rule.params if isinstance(rule.params, dict) else {})
+
+    def compile(self, params):
+        pass
+
+    def subject_ids(self):
+        # None: aplica a cualquier materia; una tupla vacía: la regla está incompleta.
+        if self.scope == 'pair':
+            if not (self.subject_a_id and self.subject_b_id):
+                return ()
+            return tuple(dict.fromkeys((self.subject_a_id, self.subject_b_id)))
+        if self.scope == 'subject':
+            return (self.subject_a_id,) if self.subject_a_id else ()
+        return None
+
+    def other(self, subject_id):
+        if subject_id == self.subject_a_id:
+            return self.subject_b_id, self.subject_b_name
+        return self.subject_a_id, self.subject_a_name
+
+    def check(self, context, subject: Subject, target_date: date, event_id, conflicts):
+        raise NotImplementedError
+
+    def audit(self, context, subjects, conflicts):
+        # Revalida los eventos ya ubicados; `conflicts`: subject_id -> lista de conflictos de
+        # cada materia ubicada. Por defecto recorre solo las materias de la regla.
+        subject_ids = self.subject_ids()
+        for subject_id in conflicts if subject_ids is None else subject_ids:
+            found = conflicts.get(subject_id)
+            if found is not None:
+                event_id, day = context.date_by_subject[subject_id]
+                self.check(context, subjects[subject_id], day, event_id, found)
+
+    @classmethod
+    def clean(cls, subject_a, subject_b, params):
+        # Validación al crear/editar la regla; devuelve un mensaje de error o None.
+        if cls.scope == 'pair' and not (subject_a and subject_b):
+            return 'Esta regla requiere Materia A y Materia B.'
+        if cls.scope == 'subject' and not subject_a:
+            return 'Esta regla requiere Materia A.'
+        return None
+
+
+@register
+class SameDayEvaluator(RuleEvaluator):
+    rule_type = Rule.RuleType.SAME_DAY
+    scope = 'pair'
+
+    def check(self, context, subject, target_date, event_id, conflicts):
+        other_id, other_name = self.other(subject.id)
+        if not context.event_on(other_id, target_date, event_id):
+            conflicts.append((self.severity, f'Restricción: {subject.name} debe rendirse junto a {other_name} el mismo día.'))
+
+
+@register
+class PreferSameDayEvaluator(RuleEvaluator):
+    rule_type = Rule.RuleType.PREFER_SAME_DAY
+    scope = 'pair'
+
+    def check(self, context, subject, target_date, event_id, conflicts):
+        other_id, other_name = self.other(subject.id)
+        if not context.event_on(other_id, target_date, event_id):
+            conflicts.append(('SOFT', f'Preferencia: {subject.name} idealmente coincide con {other_name}.'))
+
+
+@register
+class ForbidSameDayEvaluator(RuleEvaluator):
+    rule_type = Rule.RuleType.FORBID_SAME_DAY
+    scope = 'pair'
+
+    def check(self, context, subject, target_date, event_id, conflicts):
+        other_id, other_name = self.other(subject.id)
+        if context.event_on(other_id, target_date, event_id):
+            conflicts.append((self.severity, f'Restricción: {subject.name} no puede rendirse el mismo día que {other_name}.'))
+
+
+@register
+class HeavyNotSameDayEvaluator(RuleEvaluator):
+    rule_type = Rule.RuleType.HEAVY_NOT_SAME_DAY
+
+    def check(self, context, subject, target_date, event_id, conflicts):
+        if not subject.is_heavy:
+            return
+        # Excluimos el propio evento (si se mueve) y la misma materia para permitir
+        # reasignaciones idempotentes sin falsos positivos.
+        heavy_same_date = context.heavy_on(target_date, subject.id, event_id)
+        heavy_adjacent_date = (
+            context.heavy_on(target_date - timedelta(days=1), subject.id, event_id) or
+            context.heavy_on(target_date + timedelta(days=1), subject.id, event_id)
+        )
+
+        # Regla ajustada: advertencia, no bloqueo.
+        if heavy_same_date:
+            conflicts.append(('SOFT', 'Advertencia: hay más de una materia pesada en la misma fecha.'))
+        if heavy_adjacent_date:
+            conflicts.append(('SOFT', 'Advertencia: hay materias pesadas con solo 1 día de separación.'))
+
+    def audit(self, context, subjects, conflicts):
+        # Las pesadas ya están agrupadas por fecha: cada evento se resuelve en O(1).
+        heavy_by_date = context.heavy_by_date
+        for subject_id, found in conflicts.items():
+            if not subjects[subject_id].is_heavy:
+                continue
+            _, day = context.date_by_subject[subject_id]
+            same = heavy_by_date.get(day, {})
+            if len(same) - (subject_id in same) > 0:
+                found.append(('SOFT', 'Advertencia: hay más de una materia pesada en la misma fecha.'))
+            if heavy_by_date.get(day - timedelta(days=1)) or heavy_by_date.get(day + timedelta(days=1)):
+                found.append(('SOFT', 'Advertencia: hay materias pesadas con solo 1 día de separación.'))
+
+
+@register
+class SubjectOnlyWeekdaysEvaluator(RuleEvaluator):
+    rule_type = Rule.RuleType.SUBJECT_ONLY_WEEKDAYS
+    scope = 'subject'
+
+    def compile(self, params):
+        # Máscara de días permitidos (bit 0 = lunes); None si la regla no restringe.
+        allowed = as_list(params.get('allowed_weekdays'))
+        self.weekday_mask = weekday_mask(allowed) if allowed else None
+        self.weekdays_es = weekdays_es(allowed) if allowed else ''
+
+    def check(self, context, subject, target_date, event_id, conflicts):
+        if self.weekday_mask is not None and not self.weekday_mask >> target_date.weekday() & 1:
+            conflicts.append((self.severity, f'{subject.name} solo puede rendirse en: {self.weekdays_es}.'))
+
+
+@register
+class SubjectOnlyFixedDatesEvaluator(RuleEvaluator):
+    rule_type = Rule.RuleType.SUBJECT_ONLY_FIXED_DATES
+    scope = 'subject'
+
+    def compile(self, params):
+        allowed = as_list(params.get('allowed_dates'))
+        self.allowed_dates = frozenset(allowed) if allowed else None
+
+    def check(self, context, subject, target_date, event_id, conflicts):
+        if self.allowed_dates is not None and target_date.isoformat() not in self.allowed_dates:
+            conflicts.append((self.severity, f'{subject.name} solo permite fechas específicas.'))
+
+    @classmethod
+    def clean(cls, subject_a, subject_b, params):
+        allowed = as_list(params.get('allowed_dates'))
+        if not allowed:
+            return 'Indicá al menos una fecha en params.allowed_dates.'
+        for value in allowed:
+            try:
+                date.fromisoformat(value)
+            except (TypeError, ValueError):
+                return f'Fecha inválida en params.allowed_dates: {value}.'
+        return super().clean(subject_a, subject_b, params)
+
+
+@register
+class MaxExamsPerDayGroupEvaluator(RuleEvaluator):
+    # Tope de exámenes por día dentro de un mismo grupo (semestre). Sin `semester_group`
+    # aplica a cada grupo por separado.
+    rule_type = Rule.RuleType.MAX_EXAMS_PER_DAY_GROUP
+
+    def compile(self, params):
+        self.max_exams = positive_int(params.get('max_exams'))
+        self.semester_group = params.get('semester_group') or None
+
+    def check(self, context, subject, target_date, event_id, conflicts):
+        if self.max_exams is None or (self.semester_group and subject.semester_group != self.semester_group):
+            return
+        if context.group_count(target_date, subject.semester_group, subject.id, event_id) >= self.max_exams:
+            label = GROUP_LABELS.get(subject.semester_group, subject.semester_group)
+            conflicts.append((self.severity, f'Se supera el máximo de {self.max_exams} exámenes por día del grupo {label}.'))
+
+    def audit(self, context, subjects, conflicts):
+        # Se cuenta una sola vez por (fecha, grupo) en lugar de recorrer el día por evento.
+        if self.max_exams is None:
+            return
+        counts = defaultdict(int)
+        for subject_id, (_, day) in context.date_by_subject.items():
+            counts[day, context.group_by_subject.get(subject_id)] += 1
+        for subject_id, found in conflicts.items():
+            subject = subjects[subject_id]
+            if self.semester_group and subject.semester_group != self.semester_group:
+                continue
+            _, day = context.date_by_subject[subject_id]
+            own = context.group_by_subject.get(subject_id) == subject.semester_group
+            if counts[day, subject.semester_group] - own >= self.max_exams:
+                label = GROUP_LABELS.get(subject.semester_group, subject.semester_group)
+                found.append((self.severity, f'Se supera el máximo de {self.max_exams} exámenes por día del grupo {label}.'))
+
+    @classmethod
+    def clean(cls, subject_a, subject_b, params):
+        if positive_int(params.get('max_exams')) is None:
+            return 'params.max_exams debe ser un entero mayor o igual a 1.'
+        group = params.get('semester_group')
+        if group and group not in Subject.SemesterGroup.values:
+            return f'Grupo inválido en params.semester_group: {group}.'
+        return super().clean(subject_a, subject_b, params)
+
+
+@register
+class MinGapDaysEvaluator(RuleEvaluator):
+    # Separación mínima entre dos materias: con min_days=N sus fechas deben distar al menos N días.
+    rule_type = Rule.RuleType.MIN_GAP_DAYS
+    scope = 'pair'
+
+    def compile(self, params):
+        self.min_days = positive_int(params.get('min_days'))
+
+    def check(self, context, subject, target_date, event_id, conflicts):
+        if self.min_days is None:
+            return
+        other_id, other_name = self.other(subject.id)
+        other_date = context.date_of(other_id, event_id)
+        if other_date is not None and abs((target_date - other_date).days) < self.min_days:
+            conflicts.append((self.severity, f'{subject.name} y {other_name} deben tener al menos {self.min_days} días de separación.'))
+
+    @classmethod
+    def clean(cls, subject_a, subject_b, params):
+        if positive_int(params.get('min_days')) is None:
+            return 'params.min_days debe ser un entero mayor o igual a 1.'
+        return super().clean(subject_a, subject_b, params)
+
+
+def compile_rule(rule: Rule):
+    evaluator = RULE_EVALUATORS.get(rule.rule_type)
+    return evaluator(rule) if evaluator is not None else None
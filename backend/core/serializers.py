@@ -1,7 +1,20 @@
 from django.contrib.auth.models import User
 from rest_framework import serializers
 
-from .models import CalendarBlockedDay, CalendarVersion, ExamCalendar, ExamEvent, Rule, Subject
+from .models import CalendarBlockedDay, CalendarVersion, Cohort, ExamCalendar, ExamEvent, Job, Rule, Subject
+from .rules import RULE_EVALUATORS
+from .versions import version_snapshot
+
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    # `fields` (iterable de nombres) limita los campos serializados; lo arma la vista a
+    # partir de ?fields= / ?include=.
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -16,6 +29,12 @@ class SubjectSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class CohortSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Cohort
+        fields = '__all__'
+
+
 class CalendarBlockedDaySerializer(serializers.ModelSerializer):
     class Meta:
         model = CalendarBlockedDay
@@ -36,19 +55,57 @@ class RuleSerializer(serializers.ModelSerializer):
         model = Rule
         fields = '__all__'
 
+    def validate(self, attrs):
+        # Cada evaluador de core/rules.py valida las materias y parámetros que necesita.
+        def current(field, default=None):
+            return attrs[field] if field in attrs else getattr(self.instance, field, default)
+
+        evaluator = RULE_EVALUATORS.get(current('rule_type'))
+        params = current('params', {})
+        if evaluator is not None:
+            error = evaluator.clean(current('subject_a'), current('subject_b'), params if isinstance(params, dict) else {})
+            if error:
+                raise serializers.ValidationError(error)
+        return attrs
+
 
 class CalendarVersionSerializer(serializers.ModelSerializer):
     class Meta:
         model = CalendarVersion
-        fields = '__all__'
-        read_only_fields = ['version_number', 'snapshot', 'created_at', 'created_by']
+        fields = ['id', 'calendar', 'version_number', 'label', 'parent', 'is_keyframe', 'created_at', 'created_by']
+        read_only_fields = ['version_number', 'parent', 'is_keyframe', 'created_at', 'created_by']
 
 
-class ExamCalendarSerializer(serializers.ModelSerializer):
+class CalendarVersionDetailSerializer(CalendarVersionSerializer):
+    snapshot = serializers.SerializerMethodField()
+
+    class Meta(CalendarVersionSerializer.Meta):
+        fields = CalendarVersionSerializer.Meta.fields + ['snapshot']
+
+    def get_snapshot(self, obj):
+        return version_snapshot(obj)
+
+
+class ExamCalendarSerializer(DynamicFieldsModelSerializer):
     blocked_days = CalendarBlockedDaySerializer(many=True, read_only=True)
     events = ExamEventSerializer(many=True, read_only=True)
 
     class Meta:
         model = ExamCalendar
         fields = '__all__'
-        read_only_fields = ['created_by', 'created_at', 'updated_at']
+        read_only_fields = ['created_by', 'created_at', 'updated_at', 'head_version', 'revision']
+
+
+class JobSerializer(serializers.ModelSerializer):
+    has_result_file = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        exclude = ['result_file']
+        read_only_fields = [
+            'status', 'progress', 'message', 'result', 'result_name', 'error',
+            'created_by', 'created_at', 'started_at', 'finished_at', 'worker', 'heartbeat_at',
+        ]
+
+    def get_has_result_file(self, obj):
+        return bool(obj.result_file)
@@ -1,111 +1,119 @@
-from datetime import date, timedelta
-import datetime
+from datetime import date
 from typing import Optional
 
-from .models import ExamCalendar, ExamEvent, Rule, Subject
+from django.db import transaction
+from django.utils import timezone
 
-WEEKDAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-WEEKDAY_LABELS_ES = {
-    'Monday': 'Lunes',
-    'Tuesday': 'Martes',
-    'Wednesday': 'Miércoles',
-    'Thursday': 'Jueves',
-    'Friday': 'Viernes',
-    'Saturday': 'Sábado',
-    'Sunday': 'Domingo',
-}
+from .constraints import CalendarContext, parse_date, parse_event_id
+from .metrics import span
+from .models import ExamCalendar, ExamEvent, Rule, Subject
+from .realtime import publish
+from .revisions import calendar_write
 
 
 def validate_exam_assignment(calendar: ExamCalendar, subject: Subject, target_date: date | str, event_id: Optional[int] = None):
-    if isinstance(target_date, str):
-        target_date = datetime.date.fromisoformat(target_date)
-    rules = list(
-        Rule.objects.filter(enabled=True).filter(global_rule=True) |
-        Rule.objects.filter(enabled=True, calendar=calendar)
-    )
-    conflicts = []
-
-    if target_date < calendar.start_date or target_date > calendar.end_date:
-        conflicts.append(('HARD', 'La fecha está fuera del rango del calendario.'))
-
-    if target_date.weekday() == 6:
-        conflicts.append(('HARD', 'No se permiten exámenes los domingos.'))
-
-    if calendar.blocked_days.filter(date=target_date).exists():
-        conflicts.append(('HARD', 'El día está marcado como feriado/bloqueado.'))
-
-    weekday_name = WEEKDAY_NAMES[target_date.weekday()]
-    if subject.allowed_weekdays and weekday_name not in subject.allowed_weekdays:
-        allowed_es = [WEEKDAY_LABELS_ES.get(day, day) for day in subject.allowed_weekdays]
-        conflicts.append(('HARD', f'{subject.name} solo puede rendirse en: {", ".join(allowed_es)}.'))
-
-    if subject.fixed_dates and target_date.isoformat() not in subject.fixed_dates:
-        conflicts.append(('HARD', f'{subject.name} solo permite fechas específicas.'))
-
-    # Excluimos el propio evento (si se mueve) y la misma materia para permitir
-    # reasignaciones idempotentes sin falsos positivos.
-    same_day_events = (
-        ExamEvent.objects.filter(calendar=calendar, date=target_date)
-        .exclude(id=event_id)
-        .exclude(subject_id=subject.id)
-    )
-
-    for rule in rules:
-        if rule.rule_type == Rule.RuleType.SAME_DAY and rule.subject_a_id and rule.subject_b_id:
-            if subject.id in (rule.subject_a_id, rule.subject_b_id):
-                other = rule.subject_b if subject.id == rule.subject_a_id else rule.subject_a
-                if not ExamEvent.objects.filter(calendar=calendar, subject=other, date=target_date).exclude(id=event_id).exists():
-                    conflicts.append((rule.severity, f'Restricción: {subject.name} debe rendirse junto a {other.name} el mismo día.'))
-
-        if rule.rule_type == Rule.RuleType.PREFER_SAME_DAY and rule.subject_a_id and rule.subject_b_id:
-            if subject.id in (rule.subject_a_id, rule.subject_b_id):
-                other = rule.subject_b if subject.id == rule.subject_a_id else rule.subject_a
-                if not ExamEvent.objects.filter(calendar=calendar, subject=other, date=target_date).exclude(id=event_id).exists():
-                    conflicts.append(('SOFT', f'Preferencia: {subject.name} idealmente coincide con {other.name}.'))
-
-        if rule.rule_type == Rule.RuleType.HEAVY_NOT_SAME_DAY:
-            if subject.is_heavy:
-                heavy_same_date = same_day_events.filter(subject__is_heavy=True).exists()
-                heavy_adjacent_date = (
-                    ExamEvent.objects.filter(calendar=calendar, subject__is_heavy=True)
-                    .exclude(id=event_id)
-                    .exclude(subject_id=subject.id)
-                    .filter(date__in=[target_date - timedelta(days=1), target_date + timedelta(days=1)])
-                    .exists()
-                )
-
-                # Regla ajustada: advertencia, no bloqueo.
-                if heavy_same_date:
-                    conflicts.append(('SOFT', 'Advertencia: hay más de una materia pesada en la misma fecha.'))
-                if heavy_adjacent_date:
-                    conflicts.append(('SOFT', 'Advertencia: hay materias pesadas con solo 1 día de separación.'))
-
-        if rule.rule_type == Rule.RuleType.SUBJECT_ONLY_WEEKDAYS:
-            if rule.subject_a_id == subject.id:
-                allowed_weekdays = rule.params.get('allowed_weekdays') if isinstance(rule.params, dict) else None
-                if isinstance(allowed_weekdays, str):
-                    allowed_weekdays = [allowed_weekdays]
-                if allowed_weekdays and weekday_name not in allowed_weekdays:
-                    allowed_es = [WEEKDAY_LABELS_ES.get(day, day) for day in allowed_weekdays]
-                    conflicts.append((rule.severity, f'{subject.name} solo puede rendirse en: {", ".join(allowed_es)}.'))
-
-    # Evita mensajes repetidos cuando múltiples reglas producen la misma advertencia.
-    hard = list(dict.fromkeys(msg for sev, msg in conflicts if sev == 'HARD'))
-    soft = list(dict.fromkeys(msg for sev, msg in conflicts if sev == 'SOFT'))
-    if hard:
-        return {'is_valid': False, 'severity': 'hard', 'message': ' | '.join(hard)}
-    if soft:
-        return {'is_valid': True, 'severity': 'soft', 'message': ' | '.join(soft)}
-    return {'is_valid': True, 'severity': None, 'message': 'OK'}
+    with span('context'):
+        context = CalendarContext.load(calendar)
+    with span('validate'):
+        return context.validate(subject, target_date, event_id)
+
+
+def assign_exam_event(calendar: ExamCalendar, subject: Subject, target_date: date | str, event_id: Optional[int] = None, revision=None):
+    # Valida y escribe en la misma transacción corta: dos asignaciones simultáneas no pueden
+    # validar contra un estado y escribir sobre otro. Devuelve (evento o None, validación).
+    with calendar_write(calendar, revision):
+        event = ExamEvent.objects.select_related('subject').get(id=event_id, calendar=calendar) if event_id else None
+        result = validate_exam_assignment(calendar, subject, target_date, event.id if event else None)
+        if not result['is_valid']:
+            transaction.set_rollback(True)
+            return None, result
+        with span('write'):
+            if event:
+                event.date = target_date
+                event.save()
+            else:
+                event, _ = ExamEvent.objects.update_or_create(calendar=calendar, subject=subject, defaults={'date': target_date})
+            publish(calendar.id, 'events', [event.id])
+    return event, result
+
+
+def plan_bulk_assignment(calendar: ExamCalendar, moves):
+    # Valida todos los movimientos juntos contra el estado resultante, para que pares
+    # SAME_DAY movidos a la vez no generen conflictos falsos.
+    with span('context'):
+        context = CalendarContext.load(calendar)
+    with span('bulk_plan'):
+        return plan_moves(context, moves)
+
+
+def plan_moves(context, moves):
+    subjects = Subject.objects.in_bulk([m.get('subject') for m in moves if str(m.get('subject', '')).isdigit()])
+    event_subject = {event_id: subject_id for subject_id, (event_id, _) in context.date_by_subject.items()}
+    results = []
+    seen = set()
+    for index, move in enumerate(moves):
+        item = {'index': index, 'subject': move.get('subject'), 'date': move.get('date'), 'event_id': None}
+        results.append(item)
+        subject = subjects.get(int(move['subject'])) if str(move.get('subject', '')).isdigit() else None
+        try:
+            target_date = parse_date(move.get('date'))
+        except (TypeError, ValueError):
+            target_date = None
+        if subject is None or not isinstance(target_date, date):
+            item['error'] = 'Materia o fecha inválida.'
+            continue
+        if subject.id in seen:
+            item['error'] = 'La materia aparece más de una vez en la lista.'
+            continue
+        seen.add(subject.id)
+        event_id = parse_event_id(move.get('event_id'))
+        if event_id is not None and event_subject.get(event_id) != subject.id:
+            item['error'] = 'El evento no pertenece a esta materia en el calendario.'
+            continue
+        placed = context.date_by_subject.get(subject.id)
+        item['event_id'] = placed[0] if placed else None
+        item['subject'] = subject.id
+        item['date'] = target_date.isoformat()
+        context.place(subject.id, target_date, item['event_id'], subject.is_heavy, subject.semester_group)
+
+    for item in results:
+        if 'error' in item:
+            item.update({'is_valid': False, 'severity': 'hard', 'message': item['error']})
+        else:
+            item.update(context.validate(subjects[item['subject']], item['date'], item['event_id']))
+    return results
+
+
+def apply_bulk_assignment(calendar: ExamCalendar, results):
+    now = timezone.now()
+    existing = ExamEvent.objects.in_bulk([item['event_id'] for item in results if item['event_id']])
+    to_update = []
+    to_create = []
+    with span('bulk_write'), transaction.atomic():
+        for item in results:
+            event = existing.get(item['event_id'])
+            if event is None:
+                event = ExamEvent(calendar=calendar, subject_id=item['subject'], date=item['date'])
+                to_create.append((item, event))
+            else:
+                event.date = parse_date(item['date'])
+                event.updated_at = now
+                to_update.append(event)
+        ExamEvent.objects.bulk_update(to_update, ['date', 'updated_at'])
+        ExamEvent.objects.bulk_create([event for _, event in to_create])
+        publish(calendar.id, 'events', [event.id for event in to_update] + [event.id for _, event in to_create])
+    for item, event in to_create:
+        item['event_id'] = event.id
+    return {'created': len(to_create), 'updated': len(to_update)}
 
 
 def build_snapshot(calendar: ExamCalendar):
     return {
         'events': [
-            {'subject_id': e.subject_id, 'date': e.date.isoformat()} for e in calendar.events.select_related('subject')
+            {'subject_id': e.subject_id, 'date': e.date.isoformat()} for e in calendar.events.order_by('subject_id')
         ],
         'blocked_days': [
-            {'date': b.date.isoformat(), 'reason': b.reason} for b in calendar.blocked_days.all()
+            {'date': b.date.isoformat(), 'reason': b.reason} for b in calendar.blocked_days.order_by('date')
         ],
         'rules': [
             {
@@ -118,6 +126,6 @@ def build_snapshot(calendar: ExamCalendar):
                 'global_rule': r.global_rule,
                 'enabled': r.enabled,
             }
-            for r in Rule.objects.filter(calendar=calendar, enabled=True)
+            for r in Rule.objects.filter(calendar=calendar, enabled=True).order_by('id')
         ],
     }
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import CalendarBlockedDay, Rule, Subject
+from .rule_index import bump_rule_index
+
+
+# Cualquier cambio en reglas o materias puede afectar a todos los calendarios (reglas
+# globales, nombres en los mensajes); un feriado solo afecta a su calendario.
+@receiver([post_save, post_delete], sender=Rule)
+@receiver([post_save, post_delete], sender=Subject)
+def invalidate_rule_index(sender, instance, **kwargs):
+    bump_rule_index()
+
+
+@receiver([post_save, post_delete], sender=CalendarBlockedDay)
+def invalidate_calendar_rule_index(sender, instance, **kwargs):
+    bump_rule_index(instance.calendar_id)
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    # Perfil de rendimiento de SQLite (settings.SQLITE_PRAGMAS) en cada conexión nueva.
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
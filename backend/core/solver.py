@@ -0,0 +1,351 @@
+from datetime import timedelta
+import random
+import time
+
+from django.utils import timezone
+
+from .constraints import CalendarContext
+from .models import ExamCalendar, ExamEvent, Rule
+from .realtime import publish
+from .revisions import calendar_write
+
+
+class ScheduleSolver:
+    # Backtracking con MRV y forward checking para las restricciones HARD, seguido de
+    # búsqueda local que minimiza la cantidad de advertencias SOFT. La verificación de
+    # cada candidato usa el mismo CalendarContext que validate_exam_assignment.
+
+    def __init__(self, context: CalendarContext, subjects, keep_existing=True, seed=0, time_budget=5.0, progress=None):
+        self.context = context
+        self.calendar = context.calendar
+        self.subjects = {s.id: s for s in subjects}
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.time_budget = time_budget
+        self.started = time.monotonic()
+        self.deadline = self.started + time_budget
+        self.progress = progress or (lambda phase, done, total: None)
+        self.stats = {'backtracks': 0, 'checks': 0, 'iterations': 0, 'improvements': 0}
+
+        calendar = self.calendar
+        self.days = [
+            calendar.start_date + timedelta(days=i)
+            for i in range((calendar.end_date - calendar.start_date).days + 1)
+        ]
+        self.event_ids = {}
+        self.pinned = {}
+        for subject_id in self.subjects:
+            placed = context.date_by_subject.get(subject_id)
+            if placed is None:
+                continue
+            self.event_ids[subject_id] = placed[0]
+            if keep_existing:
+                self.pinned[subject_id] = placed[1]
+            else:
+                context.unplace(subject_id)
+
+        self.units, self.unit_of = self._build_units()
+        self.neighbors = self._build_neighbors()
+        self.assigned = {}
+        self.unplaced = {}
+
+    def _build_units(self):
+        # Las materias unidas por SAME_DAY HARD se ubican juntas como una sola unidad.
+        parent = {subject_id: subject_id for subject_id in self.subjects}
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for subject_id in self.subjects:
+            for rule in self.context.rules_for(subject_id):
+                if rule.rule_type != Rule.RuleType.SAME_DAY or rule.severity != Rule.Severity.HARD:
+                    continue
+                other = rule.subject_b_id if subject_id == rule.subject_a_id else rule.subject_a_id
+                if other in self.subjects:
+                    parent[find(subject_id)] = find(other)
+
+        groups = {}
+        for subject_id in sorted(self.subjects):
+            groups.setdefault(find(subject_id), []).append(subject_id)
+        units = list(groups.values())
+        unit_of = {subject_id: index for index, members in enumerate(units) for subject_id in members}
+        return units, unit_of
+
+    def _build_neighbors(self):
+        neighbors = [set() for _ in self.units]
+        for index, members in enumerate(self.units):
+            for subject_id in members:
+                for _, rule in self.context.rules_by_subject.get(subject_id, []):
+                    for other in (rule.subject_a_id, rule.subject_b_id):
+                        other_unit = self.unit_of.get(other)
+                        if other_unit is not None and other_unit != index:
+                            neighbors[index].add(other_unit)
+        return neighbors
+
+    def _movable(self, unit):
+        return [subject_id for subject_id in self.units[unit] if subject_id not in self.pinned]
+
+    def _place(self, unit, day):
+        for subject_id in self._movable(unit):
+            subject = self.subjects[subject_id]
+            self.context.place(subject_id, day, self.event_ids.get(subject_id), subject.is_heavy, subject.semester_group)
+
+    def _unplace(self, unit):
+        for subject_id in self._movable(unit):
+            self.context.unplace(subject_id)
+
+    def _evaluate(self, subject_ids):
+        # Devuelve (materias con conflicto hard, cantidad de advertencias soft) del estado actual.
+        hard = 0
+        soft = 0
+        for subject_id in subject_ids:
+            placed = self.context.date_by_subject.get(subject_id)
+            if placed is None:
+                continue
+            conflicts = self.context.conflicts(self.subjects[subject_id], placed[1], placed[0])
+            if any(sev == 'HARD' for sev, _ in conflicts):
+                hard += 1
+            soft += len({msg for sev, msg in conflicts if sev == 'SOFT'})
+        return hard, soft
+
+    def _try(self, unit, day):
+        # Evalúa la unidad (no ubicada) en el día dado sin dejarla ubicada.
+        self.stats['checks'] += 1
+        self._place(unit, day)
+        result = self._evaluate(self.units[unit])
+        self._unplace(unit)
+        return result
+
+    def _out_of_time(self):
+        return time.monotonic() > self.deadline
+
+    def _initial_domains(self):
+        domains = {}
+        total = len(self.units)
+        for index, members in enumerate(self.units):
+            if index % 25 == 0:
+                self.progress('domains', index, total)
+            if not self._movable(index):
+                self.assigned[index] = self.pinned[members[0]]
+                continue
+            pinned_days = {self.pinned[s] for s in members if s in self.pinned}
+            if len(pinned_days) > 1:
+                self.unplaced[index] = 'Materias vinculadas por SAME_DAY ya están fijadas en fechas distintas.'
+                continue
+            candidates = list(pinned_days) if pinned_days else self.days
+            domain = [day for day in candidates if not self._try(index, day)[0]]
+            if not domain:
+                self.unplaced[index] = 'No existe ninguna fecha que cumpla las restricciones fuertes.'
+                continue
+            domains[index] = domain
+        self.progress('domains', total, total)
+        return domains
+
+    def _select_unit(self, domains, pending):
+        return min(pending, key=lambda unit: (len(domains[unit]), -len(self.units[unit]), self.rank[unit]))
+
+    def _order_values(self, unit, domain):
+        scored = []
+        for day in domain:
+            hard, soft = self._try(unit, day)
+            if not hard:
+                scored.append((soft, self.random.random(), day))
+        scored.sort()
+        return [day for _, _, day in scored]
+
+    def _forward_check(self, unit, domains, pending):
+        pruned = {}
+        for other in self.neighbors[unit]:
+            if other not in pending:
+                continue
+            remaining = [day for day in domains[other] if not self._try(other, day)[0]]
+            if len(remaining) != len(domains[other]):
+                pruned[other] = domains[other]
+                domains[other] = remaining
+            if not remaining:
+                return pruned, False
+        return pruned, True
+
+    def _search(self, domains):
+        pending = set(domains)
+        self.rank = {unit: self.random.random() for unit in range(len(self.units))}
+        max_backtracks = 20 * len(self.units) + 100
+        total = len(pending)
+        # Cada marco: [unidad, candidatos, índice del próximo candidato, dominios podados].
+        stack = []
+        descend = True
+        while True:
+            if descend:
+                if not pending:
+                    break
+                if len(stack) % 10 == 0:
+                    self.progress('search', total - len(pending), total)
+                unit = self._select_unit(domains, pending)
+                pending.discard(unit)
+                stack.append([unit, self._order_values(unit, domains[unit]), 0, None])
+
+            frame = stack[-1]
+            unit, candidates, position, pruned = frame
+            if pruned is not None:
+                # Deshacer la elección anterior de este marco antes de probar la siguiente.
+                self._unplace(unit)
+                self.assigned.pop(unit, None)
+                domains.update(pruned)
+                frame[3] = None
+
+            placed = False
+            while position < len(candidates) and not self._out_of_time():
+                day = candidates[position]
+                position += 1
+                self._place(unit, day)
+                pruned, ok = self._forward_check(unit, domains, pending)
+                if ok:
+                    self.assigned[unit] = day
+                    frame[2], frame[3] = position, pruned
+                    placed = True
+                    break
+                self._unplace(unit)
+                domains.update(pruned)
+            if placed:
+                descend = True
+                continue
+
+            frame[2] = position
+            stack.pop()
+            if self._out_of_time() or self.stats['backtracks'] >= max_backtracks or not stack:
+                # Sin presupuesto para retroceder: la unidad queda sin ubicar y se sigue.
+                self.unplaced[unit] = 'No se encontró una fecha compatible con las demás asignaciones.'
+                descend = True
+                if self._out_of_time():
+                    for other in pending:
+                        self.unplaced[other] = 'Se agotó el tiempo disponible antes de ubicar la materia.'
+                    pending.clear()
+                continue
+            self.stats['backtracks'] += 1
+            pending.add(unit)
+            descend = False
+        self.progress('search', total, total)
+
+    def _affected(self, unit, *days):
+        affected = set(self.units[unit])
+        for other in self.neighbors[unit]:
+            affected.update(self.units[other])
+        for day in days:
+            affected.update(self.context.subjects_by_date.get(day, {}))
+            for offset in (-1, 1):
+                affected.update(self.context.heavy_by_date.get(day + timedelta(days=offset), {}))
+        return [subject_id for subject_id in affected if subject_id in self.subjects]
+
+    def _improve(self, domains):
+        movable = [unit for unit in self.assigned if unit in domains and len(domains[unit]) > 1]
+        if not movable:
+            return
+        stale = 0
+        stale_limit = 10 * len(movable) + 200
+        while stale < stale_limit and not self._out_of_time():
+            self.stats['iterations'] += 1
+            if self.stats['iterations'] % 200 == 0:
+                self.progress('improve', min(stale, stale_limit), stale_limit)
+            stale += 1
+            unit = self.random.choice(movable)
+            current = self.assigned[unit]
+            day = self.random.choice(domains[unit])
+            if day == current:
+                continue
+            affected = self._affected(unit, current, day)
+            hard_before, before = self._evaluate(affected)
+            self._unplace(unit)
+            self._place(unit, day)
+            hard_after, after = self._evaluate(affected)
+            if hard_after > hard_before or after > before or self._evaluate(self.units[unit])[0]:
+                self._unplace(unit)
+                self._place(unit, current)
+                continue
+            self.assigned[unit] = day
+            if after < before:
+                self.stats['improvements'] += 1
+                stale = 0
+        self.progress('improve', stale_limit, stale_limit)
+
+    def solve(self):
+        domains = self._initial_domains()
+        self._search({unit: list(domain) for unit, domain in domains.items()})
+        self._improve(domains)
+        return self.result()
+
+    def result(self):
+        assignments = []
+        unplaced = []
+        for unit, members in enumerate(self.units):
+            for subject_id in members:
+                subject = self.subjects[subject_id]
+                if unit in self.assigned:
+                    assignments.append({
+                        'subject': subject_id,
+                        'subject_name': subject.name,
+                        'date': self.assigned[unit].isoformat(),
+                        'event_id': self.event_ids.get(subject_id),
+                        'pinned': subject_id in self.pinned,
+                    })
+                elif subject_id not in self.pinned:
+                    # En modo reemplazo puede tener un evento previo: apply_schedule lo borra,
+                    # porque el resto se planificó como si esa fecha estuviera libre.
+                    unplaced.append({
+                        'subject': subject_id,
+                        'subject_name': subject.name,
+                        'event_id': self.event_ids.get(subject_id),
+                        'reason': self.unplaced.get(unit, ''),
+                    })
+        assignments.sort(key=lambda item: (item['date'], item['subject_name']))
+        _, soft_cost = self._evaluate(self.subjects)
+        self.stats.update({
+            'units': len(self.units),
+            'seed': self.seed,
+            'elapsed_ms': round((time.monotonic() - self.started) * 1000, 1),
+        })
+        return {
+            'complete': not unplaced,
+            'soft_cost': soft_cost,
+            'assignments': assignments,
+            'unplaced': unplaced,
+            'stats': self.stats,
+        }
+
+
+def auto_schedule(calendar: ExamCalendar, subjects, keep_existing=True, seed=0, time_budget=5.0, progress=None):
+    solver = ScheduleSolver(
+        CalendarContext.load(calendar), subjects,
+        keep_existing=keep_existing, seed=seed, time_budget=time_budget, progress=progress,
+    )
+    return solver.solve()
+
+
+def apply_schedule(calendar: ExamCalendar, assignments, revision=None, unplaced=()):
+    # `revision`: la del calendario al empezar a planificar; si otro editor lo cambió
+    # mientras corría el solver, no se pisan sus cambios (RevisionConflict). Los eventos de
+    # las materias que quedaron sin ubicar (`unplaced` con event_id, modo reemplazo) se borran.
+    with calendar_write(calendar, revision):
+        existing = {e.subject_id: e for e in calendar.events.all()}
+        now = timezone.now()
+        to_update = []
+        to_create = []
+        for item in assignments:
+            event = existing.get(item['subject'])
+            if event is None:
+                to_create.append(ExamEvent(calendar=calendar, subject_id=item['subject'], date=item['date']))
+            elif event.date.isoformat() != item['date']:
+                event.date = item['date']
+                event.updated_at = now
+                to_update.append(event)
+        removed = [
+            existing[item['subject']].id for item in unplaced
+            if item.get('event_id') and item['subject'] in existing
+        ]
+        ExamEvent.objects.bulk_update(to_update, ['date', 'updated_at'])
+        ExamEvent.objects.bulk_create(to_create)
+        ExamEvent.objects.filter(id__in=removed).delete()
+        publish(calendar.id, 'events', [event.id for event in to_update + to_create], delete=removed)
+    return {'created': len(to_create), 'updated': len(to_update), 'removed': len(removed), 'revision': calendar.revision}
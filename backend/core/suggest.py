@@ -0,0 +1,315 @@
+from datetime import timedelta
+import heapq
+import itertools
+import time
+
+from .constraints import CalendarContext, summarize_conflicts
+from .metrics import span
+from .models import ExamCalendar, Rule, Subject
+
+
+class RepairSearch:
+    # Sugerencias para una asignación rechazada: fechas alternativas sin conflictos hard,
+    # ordenadas por el costo soft que agregan, y, si no hay ninguna, las cadenas más cortas de
+    # movimientos de otros eventos ya ubicados que liberan una fecha (búsqueda best-first
+    # acotada en cantidad de movimientos, nodos y tiempo). Cada candidato se aplica sobre el
+    # CalendarContext en memoria, se evalúa y se deshace: la base no se toca.
+
+    def __init__(self, context: CalendarContext, subjects, subject: Subject, limit=5, max_moves=3, time_budget=0.2, max_nodes=5000, branching=3):
+        self.context = context
+        self.subject = subject
+        # La materia a ubicar y todas las ubicadas en el calendario.
+        self.subjects = {**subjects, subject.id: subject}
+        self.limit = limit
+        self.max_moves = max_moves
+        self.max_nodes = max_nodes
+        # Destinos que se prueban por cada unidad bloqueante.
+        self.branching = branching
+        self.started = time.monotonic()
+        self.deadline = self.started + time_budget
+        self.stats = {'nodes': 0, 'expanded': 0}
+        self.exhausted = True
+
+        calendar = context.calendar
+        self.days = [
+            day for day in (calendar.start_date + timedelta(days=i) for i in range((calendar.end_date - calendar.start_date).days + 1))
+            if day.weekday() != 6 and day not in context.blocked_dates
+        ]
+        self.units = {}
+        self.static = {}
+        self.base_soft = {}
+
+    def _out_of_time(self):
+        if time.monotonic() > self.deadline or self.stats['nodes'] >= self.max_nodes:
+            self.exhausted = False
+            return True
+        return False
+
+    def unit_of(self, subject_id):
+        # La materia junto con sus pares SAME_DAY fuertes ya ubicados: se mueven juntos.
+        unit = self.units.get(subject_id)
+        if unit is not None:
+            return unit
+        members = {subject_id}
+        pending = [subject_id]
+        while pending:
+            current = pending.pop()
+            for _, rule in self.context.rules_by_subject.get(current, []):
+                if rule.rule_type != Rule.RuleType.SAME_DAY or rule.severity != Rule.Severity.HARD:
+                    continue
+                other = rule.other(current)[0]
+                if other not in members and (other == self.subject.id or other in self.context.date_by_subject):
+                    members.add(other)
+                    pending.append(other)
+        unit = tuple(sorted(members))
+        for member in unit:
+            self.units[member] = unit
+        return unit
+
+    def static_ok(self, unit, day):
+        # Rango, domingos, feriados y días/fechas permitidos: ningún movimiento los arregla.
+        for subject_id in unit:
+            key = (subject_id, day)
+            ok = self.static.get(key)
+            if ok is None:
+                ok = self.static[key] = not any(
+                    severity == 'HARD' for severity, _ in self.context.static_conflicts(self.subjects[subject_id], day)
+                )
+            if not ok:
+                return False
+        return True
+
+    def apply(self, plan):
+        context = self.context
+        previous = {subject_id: context.date_by_subject.get(subject_id) for subject_id in plan}
+        for subject_id, day in plan.items():
+            subject = self.subjects[subject_id]
+            event_id = previous[subject_id][0] if previous[subject_id] else None
+            context.place(subject_id, day, event_id, subject.is_heavy, subject.semester_group)
+        return previous
+
+    def revert(self, previous):
+        for subject_id, placed in previous.items():
+            if placed is None:
+                self.context.unplace(subject_id)
+            else:
+                subject = self.subjects[subject_id]
+                self.context.place(subject_id, placed[1], placed[0], subject.is_heavy, subject.semester_group)
+
+    def conflicts(self, subject_id):
+        event_id, day = self.context.date_by_subject[subject_id]
+        return self.context.conflicts(self.subjects[subject_id], day, event_id)
+
+    def hard_count(self, unit):
+        return sum(severity == 'HARD' for subject_id in unit for severity, _ in self.conflicts(subject_id))
+
+    def soft_count(self, subject_ids):
+        return sum(
+            len({message for severity, message in self.conflicts(subject_id) if severity == 'SOFT'})
+            for subject_id in subject_ids if subject_id in self.context.date_by_subject
+        )
+
+    def affected(self, plan):
+        # Materias cuyas advertencias pueden cambiar con el plan (con el calendario sin aplicar):
+        # las movidas, sus pares por regla y las ubicadas en los días que se tocan o junto a ellos.
+        context = self.context
+        affected = set(plan)
+        days = set(plan.values())
+        for subject_id in plan:
+            for _, rule in context.rules_by_subject.get(subject_id, []):
+                affected.update((rule.subject_a_id, rule.subject_b_id))
+            placed = context.date_by_subject.get(subject_id)
+            if placed:
+                days.add(placed[1])
+        for day in days:
+            affected.update(context.subjects_by_date.get(day, {}))
+            for offset in (-1, 1):
+                affected.update(context.heavy_by_date.get(day + timedelta(days=offset), {}))
+        return [subject_id for subject_id in affected if subject_id in self.subjects]
+
+    def evaluate(self, plan, units):
+        # Conflictos hard de las unidades movidas ([(unidad, cantidad)]) y, si no hay ninguno,
+        # las advertencias que agrega el plan (negativo si las reduce).
+        self.stats['nodes'] += 1
+        previous = self.apply(plan)
+        try:
+            hard = [(unit, count) for unit in units if (count := self.hard_count(unit))]
+        finally:
+            self.revert(previous)
+        if hard:
+            return hard, None
+        affected = self.affected(plan)
+        for subject_id in affected:
+            if subject_id not in self.base_soft and subject_id in self.context.date_by_subject:
+                self.base_soft[subject_id] = self.soft_count([subject_id])
+        before = sum(self.base_soft.get(subject_id, 0) for subject_id in affected)
+        previous = self.apply(plan)
+        try:
+            return hard, self.soft_count(affected) - before
+        finally:
+            self.revert(previous)
+
+    def blockers(self, unit, fixed):
+        # Unidades ubicadas cuya salida reduce los conflictos hard de `unit` (con el plan aplicado).
+        context = self.context
+        day = context.date_by_subject[unit[0]][1]
+        candidates = set()
+        for subject_id in unit:
+            candidates.update(context.subjects_by_date.get(day, {}))
+            for _, rule in context.rules_by_subject.get(subject_id, []):
+                candidates.update((rule.subject_a_id, rule.subject_b_id))
+        candidates.discard(None)
+        hard = self.hard_count(unit)
+        seen = set(fixed)
+        found = []
+        for candidate in sorted(candidates):
+            if candidate not in context.date_by_subject:
+                continue
+            other = self.unit_of(candidate)
+            if other in seen:
+                continue
+            seen.add(other)
+            previous = {subject_id: context.date_by_subject[subject_id] for subject_id in other}
+            for subject_id in other:
+                context.unplace(subject_id)
+            remaining = self.hard_count(unit)
+            self.revert(previous)
+            if remaining < hard:
+                found.append((other, previous[other[0]][1]))
+        return found
+
+    def destinations(self, unit, current, last):
+        # Días a los que conviene mover una unidad bloqueante (con el plan aplicado): primero los
+        # que no le generan conflictos hard y los más cercanos a su fecha. En el último nivel de
+        # la búsqueda solo sirven los que no dejan conflictos.
+        scored = []
+        for day in self.days:
+            if day == current or not self.static_ok(unit, day):
+                continue
+            previous = self.apply({subject_id: day for subject_id in unit})
+            hard = self.hard_count(unit)
+            self.revert(previous)
+            if not (hard and last):
+                scored.append((hard, abs((day - current).days), day))
+        scored.sort()
+        return [day for *_, day in scored[:self.branching]]
+
+    def move(self, subject_id, day):
+        placed = self.context.date_by_subject.get(subject_id)
+        return {
+            'subject': subject_id,
+            'subject_name': self.subjects[subject_id].name,
+            'event_id': placed[0] if placed else None,
+            'from': placed[1].isoformat() if placed else None,
+            'to': day.isoformat(),
+        }
+
+    def moves(self, unit, day, first=None):
+        # La materia pedida primero; después sus pares.
+        return [self.move(subject_id, day) for subject_id in sorted(unit, key=lambda s: (s != first, s))]
+
+    def direct_dates(self, unit, requested):
+        current = self.context.date_by_subject.get(self.subject.id)
+        found = []
+        for day in self.days:
+            if self._out_of_time():
+                break
+            if day == requested or (current and day == current[1]) or not self.static_ok(unit, day):
+                continue
+            plan = {subject_id: day for subject_id in unit}
+            hard, soft = self.evaluate(plan, [unit])
+            if not hard:
+                found.append((soft, abs((day - requested).days), day))
+        found.sort()
+        dates = []
+        for soft, _, day in found[:self.limit]:
+            previous = self.apply({subject_id: day for subject_id in unit})
+            result = summarize_conflicts(self.conflicts(self.subject.id))
+            self.revert(previous)
+            dates.append({
+                'date': day.isoformat(), 'cost': soft, 'severity': result['severity'], 'message': result['message'],
+                'moves': self.moves(unit, day, self.subject.id),
+            })
+        return dates
+
+    def move_chains(self, unit, requested):
+        # Best-first por (movimientos, conflictos hard restantes, fecha pedida primero, costo):
+        # las cadenas salen de menor a mayor largo. Un nodo sin conflictos es una solución.
+        order = itertools.count()
+        heap = []
+        seen = set()
+        chains = []
+
+        def push(plan, moved, target):
+            key = frozenset(plan.items())
+            if key in seen:
+                return
+            seen.add(key)
+            hard, soft = self.evaluate(plan, [unit, *(other for other, _ in moved)])
+            remaining = sum(count for _, count in hard)
+            heapq.heappush(heap, (len(moved), remaining, target != requested, soft or 0, next(order), plan, moved, target, hard))
+
+        targets = sorted(self.days, key=lambda day: (day != requested, abs((day - requested).days)))
+        for day in targets:
+            if self._out_of_time():
+                break
+            if self.static_ok(unit, day):
+                push({subject_id: day for subject_id in unit}, (), day)
+
+        while heap and len(chains) < self.limit and not self._out_of_time():
+            moves_count, _, _, soft, _, plan, moved, target, hard = heapq.heappop(heap)
+            if not hard:
+                if moved:
+                    chains.append({
+                        'date': target.isoformat(), 'cost': soft, 'length': moves_count,
+                        'moves': self.moves(unit, target, self.subject.id) + [
+                            move for other, day in moved for move in self.moves(other, day)
+                        ],
+                    })
+                continue
+            if moves_count >= self.max_moves:
+                continue
+            self.stats['expanded'] += 1
+            last = moves_count + 1 == self.max_moves
+            previous = self.apply(plan)
+            try:
+                expansions = [
+                    (other, self.destinations(other, current, last))
+                    for other, current in self.blockers(hard[0][0], [unit, *(other for other, _ in moved)])
+                ]
+            finally:
+                self.revert(previous)
+            for other, days in expansions:
+                for day in days:
+                    if self._out_of_time():
+                        break
+                    push({**plan, **{subject_id: day for subject_id in other}}, (*moved, (other, day)), target)
+        return chains
+
+    def suggest(self, requested):
+        unit = self.unit_of(self.subject.id)
+        plan = {subject_id: requested for subject_id in unit}
+        previous = self.apply(plan)
+        result = summarize_conflicts(self.conflicts(self.subject.id))
+        self.revert(previous)
+        # Sin conflictos hard la fecha pedida sirve: no hay nada que reparar.
+        dates = self.direct_dates(unit, requested) if not result['is_valid'] else []
+        chains = [] if dates or result['is_valid'] else self.move_chains(unit, requested)
+        self.stats['elapsed_ms'] = round((time.monotonic() - self.started) * 1000, 1)
+        return {
+            'subject': self.subject.id,
+            'date': requested.isoformat(),
+            'result': result,
+            'dates': dates,
+            'chains': chains,
+            'complete': self.exhausted,
+            'stats': self.stats,
+        }
+
+
+def suggest_repairs(calendar: ExamCalendar, subject: Subject, target_date, limit=5, max_moves=3, time_budget=0.2):
+    with span('context'):
+        context = CalendarContext.load(calendar)
+        subjects = Subject.objects.in_bulk(list(context.date_by_subject))
+    with span('suggest'):
+        return RepairSearch(context, subjects, subject, limit=limit, max_moves=max_moves, time_budget=time_budget).suggest(target_date)
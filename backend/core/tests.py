@@ -0,0 +1,1753 @@
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
+import gzip
+from io import BytesIO, StringIO
+import json
+import os
+from pathlib import Path
+import re
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from openpyxl import Workbook, load_workbook
+from pypdf import PdfReader
+from rest_framework.test import APIClient
+
+from . import feeds, pdf, realtime
+from .audit import audit_calendars
+from .benchmark import compare_results, percentile, run_benchmark
+from .constraints import CalendarContext, summarize_conflicts
+from .export_cache import EXPORTERS, cached_export
+from .exports import EXCEL_HEADER, export_excel_many
+from .imports import import_xlsx
+from .jobs import JobLimitExceeded, claim_jobs, fail_interrupted_jobs, heartbeat, run_job, submit_job
+from .metrics import MERGED_FILE, Registry, _start_time, process_key
+from .models import CalendarBlockedDay, CalendarChange, CalendarVersion, Cohort, ExamCalendar, ExamEvent, Job, Rule, Subject
+from .pdf import build_booklet
+from .revisions import calendar_write
+from .rule_index import RuleIndex, _local, bump_rule_index, calendar_version_key, current_version, rule_index
+from .rules import WEEKDAY_LABELS_ES, WEEKDAY_NAMES
+from .suggest import RepairSearch
+from .services import build_snapshot, validate_exam_assignment
+from .versions import create_version, delete_version, merge_snapshots, snapshot_cache, version_snapshot
+
+# Caché en memoria (el de archivos se comparte con el servidor de desarrollo) y sin volcado
+# de métricas a disco.
+TEST_SETTINGS = {
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'METRICS_DIR': None,
+}
+
+
+@override_settings(**TEST_SETTINGS)
+class CalendarTestCase(TestCase):
+    # Calendario de dos semanas (lunes 2 a sábado 14 de marzo de 2026) con un editor logueado.
+    start = date(2026, 3, 2)
+
+    def setUp(self):
+        cache.clear()
+        _local.clear()
+        snapshot_cache.items.clear()
+        self.user = User.objects.create(username='editor')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.calendar = ExamCalendar.objects.create(
+            name='Finales', period_type=ExamCalendar.PeriodType.F1,
+            start_date=self.start, end_date=self.start + timedelta(days=12), created_by=self.user,
+        )
+
+    def day(self, offset):
+        return self.start + timedelta(days=offset)
+
+    @staticmethod
+    def workbook(*rows):
+        wb = Workbook()
+        for row in rows:
+            wb.active.append(row)
+        out = BytesIO()
+        wb.save(out)
+        out.seek(0)
+        out.name = 'datos.xlsx'
+        return out
+
+    def commit(self):
+        # Como al confirmar la transacción: corre los on_commit pendientes y los descarta
+        # (captureOnCommitCallbacks los deja en la lista y el índice los vería pendientes).
+        callbacks = list(connection.run_on_commit)
+        connection.run_on_commit.clear()
+        for _, callback, _ in callbacks:
+            callback()
+
+    def url(self, path=''):
+        return f'/api/calendars/{self.calendar.id}/{path}'
+
+    def subject(self, name, group=Subject.SemesterGroup.SEM2, **fields):
+        return Subject.objects.create(name=name, semester_group=group, **fields)
+
+    def event(self, subject, offset):
+        return ExamEvent.objects.create(calendar=self.calendar, subject=subject, date=self.day(offset))
+
+    def rule(self, rule_type, subject_a=None, subject_b=None, severity=Rule.Severity.HARD, **params):
+        return Rule.objects.create(
+            calendar=self.calendar, rule_type=rule_type, severity=severity,
+            subject_a=subject_a, subject_b=subject_b, params=params,
+        )
+
+
+class AutoScheduleTests(CalendarTestCase):
+    def test_replace_removes_events_of_unplaced_subjects(self):
+        # C no tiene ninguna fecha posible (solo un domingo); D solo puede ir el día en que
+        # está C y no puede compartirlo con C. Al reemplazar, el evento de C no puede quedar.
+        stuck = self.subject('C', fixed_dates=[self.day(6).isoformat()])
+        fixed = self.subject('D', fixed_dates=[self.day(2).isoformat()])
+        stale = self.event(stuck, 2)
+        self.rule(Rule.RuleType.FORBID_SAME_DAY, stuck, fixed)
+
+        response = self.client.post(self.url('auto_schedule/'), {'keep_existing': False, 'apply': True}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['applied']['removed'], 1)
+        unplaced = {item['subject']: item for item in response.data['unplaced']}
+        self.assertEqual(unplaced[stuck.id]['event_id'], stale.id)
+        self.assertFalse(ExamEvent.objects.filter(id=stale.id).exists())
+        self.assertEqual(ExamEvent.objects.get(subject=fixed).date, self.day(2))
+        self.assertEqual(audit_calendars([self.calendar])['hard'], 0)
+
+    def test_keep_existing_does_not_remove_events(self):
+        stuck = self.subject('C', fixed_dates=[self.day(6).isoformat()])
+        self.event(stuck, 2)
+        self.subject('D')
+
+        response = self.client.post(self.url('auto_schedule/'), {'apply': True}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['applied']['removed'], 0)
+        self.assertTrue(ExamEvent.objects.filter(subject=stuck).exists())
+
+
+class BulkAssignTests(CalendarTestCase):
+    def setUp(self):
+        super().setUp()
+        self.a, self.b, self.c = self.subject('A'), self.subject('B'), self.subject('C')
+        self.placed = self.event(self.a, 1)
+
+    def state(self):
+        self.calendar.refresh_from_db()
+        return self.calendar.revision, sorted(ExamEvent.objects.filter(calendar=self.calendar).values_list('subject_id', 'date'))
+
+    def bulk(self, moves):
+        return self.client.post(self.url('assign_events_bulk/'), {'moves': moves}, format='json')
+
+    def test_one_invalid_item_leaves_the_calendar_unchanged(self):
+        valid = [
+            {'subject': self.a.id, 'date': self.day(2).isoformat(), 'event_id': self.placed.id},
+            {'subject': self.b.id, 'date': self.day(3).isoformat()},
+        ]
+        invalid = {
+            # Domingo: conflicto hard.
+            'sunday': {'subject': self.c.id, 'date': self.day(6).isoformat()},
+            'unknown_subject': {'subject': 999999, 'date': self.day(4).isoformat()},
+            'bad_date': {'subject': self.c.id, 'date': '2026-02-30'},
+            'foreign_event': {'subject': self.c.id, 'date': self.day(4).isoformat(), 'event_id': self.placed.id},
+        }
+        before = self.state()
+        for name, item in invalid.items():
+            with self.subTest(name):
+                response = self.bulk(valid + [item])
+
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.data['committed'])
+                self.assertEqual([r['is_valid'] for r in response.data['results']], [True, True, False])
+                self.assertEqual(response.data['revision'], before[0])
+                self.assertEqual(self.state(), before)
+
+    def test_all_valid_items_are_written_together(self):
+        revision, _ = self.state()
+
+        response = self.bulk([
+            {'subject': self.a.id, 'date': self.day(2).isoformat(), 'event_id': self.placed.id},
+            {'subject': self.b.id, 'date': self.day(3).isoformat()},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['applied'], {'created': 1, 'updated': 1})
+        self.assertEqual(self.state(), (revision + 1, [(self.a.id, self.day(2)), (self.b.id, self.day(3))]))
+
+
+class ExportCacheTests(CalendarTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        override = override_settings(EXPORT_CACHE_DIR=self.directory)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.event(self.subject('A'), 1)
+
+    def test_failed_export_removes_the_temporary_file(self):
+        def broken(calendar, snapshot):
+            raise RuntimeError('fallo al renderizar')
+
+        with mock.patch.dict(EXPORTERS, {'pdf': broken}), self.assertRaises(RuntimeError):
+            cached_export(self.calendar, None, 'pdf')
+
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_not_modified_does_not_render(self):
+        response = self.client.get(self.url('export/pdf/'))
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        # Sin el archivo en caché, solo un 304 calculado antes de exportar evita renderizar.
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+
+        with mock.patch.dict(EXPORTERS, {'pdf': mock.Mock(side_effect=AssertionError('no debe renderizar'))}):
+            response = self.client.get(self.url('export/pdf/'), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    @override_settings(EXPORT_SPOOL_MAX_BYTES=1024)
+    def test_excel_export_contents(self):
+        self.event(self.subject('Álgebra', is_heavy=True), 1)
+        self.event(self.subject('Dibujo', group=Subject.SemesterGroup.SEM4), 3)
+
+        response = self.client.get(self.url('export/excel/'))
+
+        self.assertEqual(response.status_code, 200)
+        # Más grande que EXPORT_SPOOL_MAX_BYTES: el libro se armó en disco y se lee igual.
+        wb = load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)
+        self.assertEqual(wb.sheetnames, ['Exámenes', 'Resumen'])
+        self.assertEqual([list(row) for row in wb['Exámenes'].values], [
+            EXCEL_HEADER,
+            ['Final 1', 'Finales', self.day(1).isoformat(), 'Martes', 'A', 'SEM2', 'No'],
+            ['Final 1', 'Finales', self.day(1).isoformat(), 'Martes', 'Álgebra', 'SEM2', 'Sí'],
+            ['Final 1', 'Finales', self.day(3).isoformat(), 'Jueves', 'Dibujo', 'SEM4', 'No'],
+        ])
+        self.assertEqual([list(row) for row in wb['Resumen'].values], [
+            ['Fecha', 'Cantidad'], [self.day(1).isoformat(), 2], [self.day(3).isoformat(), 1],
+        ])
+
+    def test_period_excel_sheet_titles_are_unique(self):
+        name = 'Calendario con un nombre muy largo: turno [noche]'
+        calendars = [
+            ExamCalendar.objects.create(
+                name=name, period_type=ExamCalendar.PeriodType.F2,
+                start_date=self.day(20), end_date=self.day(30), created_by=self.user,
+            )
+            for _ in range(2)
+        ]
+
+        wb = load_workbook(export_excel_many(calendars), read_only=True)
+
+        self.assertEqual(wb.sheetnames, ['F2 Calendario con un nombre muy', 'F2 Calendario con un nombre m~2', 'Resumen'])
+        self.assertEqual([list(row) for row in wb['Resumen'].values][1:], [['Final 2', name, self.day(20).isoformat(), self.day(30).isoformat(), 0]] * 2)
+
+
+class ImportTests(CalendarTestCase):
+    def test_events_with_static_conflicts_are_row_errors(self):
+        a, b, c, d, e = (self.subject(name) for name in 'ABCDE')
+        self.event(a, 1)
+        self.event(b, 2)
+        CalendarBlockedDay.objects.create(calendar=self.calendar, date=self.day(4))
+        self.subject('F', allowed_weekdays=['Monday'])
+
+        report = import_xlsx(self.workbook(
+            ['Fecha', 'Asignatura'],
+            [self.day(1), 'A'],
+            [self.day(3), 'B'],
+            [self.day(2), 'C'],
+            [self.day(20), 'D'],
+            [self.day(4), 'E'],
+            [self.day(6), 'C'],
+            [self.day(1), 'F'],
+        ), 'events', self.calendar)
+
+        self.assertEqual(
+            {key: report[key] for key in ('rows', 'created', 'updated', 'unchanged', 'error_count')},
+            {'rows': 7, 'created': 1, 'updated': 1, 'unchanged': 1, 'error_count': 4},
+        )
+        self.assertEqual([error['row'] for error in report['errors']], [5, 6, 7, 8])
+        self.assertIn('fuera del rango', report['errors'][0]['error'])
+        self.assertIn('feriado', report['errors'][1]['error'])
+        self.assertIn('domingos', report['errors'][2]['error'])
+        self.assertIn('solo puede rendirse en: Lunes', report['errors'][3]['error'])
+        self.assertEqual(
+            sorted(ExamEvent.objects.filter(calendar=self.calendar).values_list('subject__name', 'date')),
+            [('A', self.day(1)), ('B', self.day(3)), ('C', self.day(2))],
+        )
+
+    def test_unchanged_rows_are_not_counted_as_updated(self):
+        self.subject('Álgebra', code='ALG', is_heavy=True)
+        CalendarBlockedDay.objects.create(calendar=self.calendar, date=self.day(4), reason='Feriado')
+
+        subjects = import_xlsx(self.workbook(
+            ['Asignatura', 'Código', 'Grupo', 'Pesada'],
+            ['Álgebra', 'ALG', 'SEM2', 'Sí'],
+            ['Cálculo', 'CAL', 'SEM2', 'No'],
+        ), 'subjects')
+        blocked = import_xlsx(self.workbook(
+            ['Fecha', 'Motivo'], [self.day(4), 'Feriado'], [self.day(5), 'Paro'],
+        ), 'blocked_days', self.calendar)
+
+        self.assertEqual((subjects['created'], subjects['updated'], subjects['unchanged']), (1, 0, 1))
+        self.assertEqual((blocked['created'], blocked['updated'], blocked['unchanged']), (1, 0, 1))
+
+    def upload(self, kind, workbook, **headers):
+        return self.client.post(self.url(f'import/{kind}/'), {'file': workbook}, format='multipart', **headers)
+
+    def test_calendar_imports_check_the_revision(self):
+        subject = self.subject('A')
+        revision = self.calendar.revision
+        rows = (['Fecha', 'Asignatura'], [self.day(1), 'A'])
+
+        stale = self.upload('events', self.workbook(*rows), HTTP_IF_MATCH=f'"{revision + 1}"')
+        self.assertEqual(stale.status_code, 409)
+        self.assertFalse(ExamEvent.objects.filter(subject=subject).exists())
+
+        response = self.upload('events', self.workbook(*rows), HTTP_IF_MATCH=f'"{revision}"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['revision']), (1, revision + 1))
+        self.assertEqual(response['ETag'], f'"{revision + 1}"')
+
+    def test_import_without_changes_keeps_the_revision(self):
+        self.event(self.subject('A'), 1)
+        CalendarBlockedDay.objects.create(calendar=self.calendar, date=self.day(4), reason='Feriado')
+        revision = self.calendar.revision
+        imports = {
+            'events': (['Fecha', 'Asignatura'], [self.day(1), 'A']),
+            'blocked_days': (['Fecha', 'Motivo'], [self.day(4), 'Feriado']),
+        }
+        for kind, rows in imports.items():
+            with self.subTest(kind):
+                response = self.upload(kind, self.workbook(*rows), HTTP_IF_MATCH=f'"{revision}"')
+
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual((response.data['unchanged'], response.data['revision']), (1, revision))
+                self.calendar.refresh_from_db()
+                self.assertEqual(self.calendar.revision, revision)
+                self.assertFalse(CalendarChange.objects.filter(calendar=self.calendar).exists())
+
+
+class SuggestTests(CalendarTestCase):
+    def setUp(self):
+        super().setUp()
+        # X solo puede rendirse el martes (día 1), donde ya está A y no pueden compartir día.
+        self.x = self.subject('X', fixed_dates=[self.day(1).isoformat()])
+        self.a = self.subject('A')
+        self.event(self.a, 1)
+        self.rule(Rule.RuleType.FORBID_SAME_DAY, self.x, self.a)
+
+    def suggest(self, subject, offset, **params):
+        response = self.client.post(self.url('suggest/'), {'subject': subject.id, 'date': self.day(offset).isoformat(), **params}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def apply(self, moves):
+        response = self.client.post(self.url('assign_events_bulk/'), {'moves': [
+            {'subject': move['subject'], 'date': move['to'], 'event_id': move['event_id']} for move in moves
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_alternative_dates_clear_the_hard_conflict(self):
+        y = self.subject('Y')
+        self.rule(Rule.RuleType.FORBID_SAME_DAY, y, self.a)
+
+        data = self.suggest(y, 1)
+
+        self.assertEqual(data['result']['severity'], 'hard')
+        self.assertEqual(data['chains'], [])
+        self.assertTrue(data['dates'])
+        for suggestion in data['dates']:
+            self.assertNotEqual(suggestion['date'], self.day(1).isoformat())
+            self.assertTrue(validate_exam_assignment(self.calendar, y, suggestion['date'])['is_valid'])
+
+    def test_move_chain_frees_the_requested_date(self):
+        data = self.suggest(self.x, 1)
+
+        self.assertEqual(data['dates'], [])
+        chain = data['chains'][0]
+        self.assertEqual((chain['date'], chain['length']), (self.day(1).isoformat(), 1))
+        self.assertEqual([move['subject'] for move in chain['moves']], [self.x.id, self.a.id])
+        self.apply(chain['moves'])
+        self.assertEqual(audit_calendars([self.calendar])['hard'], 0)
+
+    def test_chains_longer_than_max_moves_are_cut(self):
+        # A solo puede ir el día 1 o el 2, y el 2 está B, que tampoco puede compartir día con A:
+        # liberar el día 1 requiere mover A y B.
+        Subject.objects.filter(id=self.a.id).update(fixed_dates=[self.day(1).isoformat(), self.day(2).isoformat()])
+        b = self.subject('B')
+        self.event(b, 2)
+        self.rule(Rule.RuleType.FORBID_SAME_DAY, self.a, b)
+
+        self.assertEqual(self.suggest(self.x, 1, max_moves=1)['chains'], [])
+        chain = self.suggest(self.x, 1, max_moves=2)['chains'][0]
+        self.assertEqual(chain['length'], 2)
+        self.assertEqual([move['subject'] for move in chain['moves']], [self.x.id, self.a.id, b.id])
+        self.apply(chain['moves'])
+        self.assertEqual(audit_calendars([self.calendar])['hard'], 0)
+
+    def test_search_stops_at_the_budget(self):
+        context = CalendarContext.load(self.calendar)
+        search = RepairSearch(context, Subject.objects.in_bulk(list(context.date_by_subject)), self.x, time_budget=0)
+
+        data = search.suggest(self.day(1))
+
+        self.assertFalse(data['complete'])
+        self.assertEqual((data['dates'], data['chains']), ([], []))
+
+    def test_feasible_date_has_no_suggestions(self):
+        data = self.suggest(self.subject('Z'), 3)
+
+        self.assertEqual(data['result']['severity'], None)
+        self.assertEqual((data['dates'], data['chains']), ([], []))
+        self.assertTrue(data['complete'])
+
+
+class FeasibilityMatrixTests(CalendarTestCase):
+    def etag(self):
+        response = self.client.get(self.url('feasibility_matrix/'))
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_etag_changes_with_semester_group(self):
+        subject = self.subject('A', group=Subject.SemesterGroup.SEM2)
+        self.event(subject, 1)
+        before = self.etag()
+
+        # update() no dispara señales: solo el grupo distingue los dos estados.
+        Subject.objects.filter(id=subject.id).update(semester_group=Subject.SemesterGroup.SEM4)
+
+        self.assertNotEqual(self.etag(), before)
+
+    def test_etag_changes_when_rule_index_is_bumped(self):
+        self.subject('A')
+        self.commit()
+        before = self.etag()
+        self.assertEqual(self.etag(), before)
+
+        bump_rule_index(self.calendar.id)
+        self.commit()
+
+        self.assertNotEqual(self.etag(), before)
+
+    def test_cells_match_validate(self):
+        algebra = self.subject('Álgebra', is_heavy=True)
+        calculo = self.subject('Cálculo', is_heavy=True)
+        fisica = self.subject('Física', allowed_weekdays=['Tuesday', 'Thursday'])
+        quimica = self.subject('Química', fixed_dates=[self.day(3).isoformat()])
+        self.event(algebra, 1)
+        self.event(fisica, 3)
+        CalendarBlockedDay.objects.create(calendar=self.calendar, date=self.day(4))
+        self.rule(Rule.RuleType.HEAVY_NOT_SAME_DAY)
+        self.rule(Rule.RuleType.SAME_DAY, quimica, fisica, severity=Rule.Severity.SOFT)
+        self.rule(Rule.RuleType.PREFER_SAME_DAY, calculo, algebra)
+        subjects = [algebra, calculo, fisica, quimica]
+
+        response = self.client.get(self.url('feasibility_matrix/'))
+
+        self.assertEqual(response.status_code, 200)
+        rows = {row['subject']: row for row in response.data['subjects']}
+        self.assertEqual(set(rows), {subject.id for subject in subjects})
+        context = CalendarContext.load(self.calendar)
+        checked = set()
+        for subject in subjects:
+            row = rows[subject.id]
+            for index, day in enumerate(response.data['dates']):
+                with self.subTest(subject=subject.name, date=day):
+                    expected = context.validate(subject, day, row['event_id'])
+                    self.assertEqual((row['severity'][index], row['message'][index]), (expected['severity'], expected['message']))
+                    checked.add(expected['severity'])
+        self.assertEqual(checked, {None, 'soft', 'hard'})
+
+
+class RuleIndexTests(CalendarTestCase):
+    def test_index_is_cached_inside_a_clean_transaction(self):
+        # TestCase corre cada prueba dentro de una transacción.
+        self.rule(Rule.RuleType.HEAVY_NOT_SAME_DAY)
+        self.commit()
+        first = rule_index(self.calendar)
+
+        self.assertEqual(len(first.rules), 1)
+        self.assertIs(rule_index(self.calendar), first)
+        self.assertIsNotNone(cache.get(first.version))
+
+    def test_pending_changes_bypass_the_cache(self):
+        subject = self.subject('A')
+        self.commit()
+        cached = rule_index(self.calendar)
+
+        with calendar_write(self.calendar):
+            CalendarBlockedDay.objects.create(calendar=self.calendar, date=self.day(2))
+            index = rule_index(self.calendar)
+            result = validate_exam_assignment(self.calendar, subject, self.day(2))
+
+        self.assertIsNot(index, cached)
+        self.assertEqual(index.blocked_dates, {self.day(2)})
+        self.assertNotEqual(index.version, cached.version)
+        self.assertIn('feriado', result['message'])
+        self.assertEqual(list(_local.values()), [cached])
+
+    def test_rolled_back_changes_do_not_mark_the_transaction(self):
+        self.subject('A')
+        self.commit()
+        cached = rule_index(self.calendar)
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            CalendarBlockedDay.objects.create(calendar=self.calendar, date=self.day(2))
+            raise RuntimeError
+
+        self.assertIs(rule_index(self.calendar), cached)
+
+    def test_bump_sets_a_new_version(self):
+        key = calendar_version_key(self.calendar.id)
+        before = current_version(key)
+
+        bump_rule_index(self.calendar.id)
+        self.commit()
+        after = current_version(key)
+        bump_rule_index(self.calendar.id)
+        self.commit()
+
+        self.assertNotEqual(after, before)
+        self.assertNotEqual(current_version(key), after)
+
+
+class QueryCountTests(CalendarTestCase):
+    # La cantidad de queries de cada lectura no depende de cuántos eventos, feriados, reglas
+    # o versiones tenga el calendario: se mide con dos tamaños distintos.
+
+    def grow(self, count):
+        # Agrega `count` materias con evento, un feriado, reglas entre pares, dos versiones y otro
+        # calendario.
+        offset = ExamEvent.objects.filter(calendar=self.calendar).count()
+        previous = None
+        for i in range(offset, offset + count):
+            subject = self.subject(f'M{i}', is_heavy=i % 2 == 0)
+            self.event(subject, i % 6)
+            if previous is not None:
+                self.rule(Rule.RuleType.MIN_GAP_DAYS, previous, subject, severity=Rule.Severity.SOFT, min_days=1)
+            previous = subject
+        other = ExamCalendar.objects.create(
+            name=f'Otro {offset}', period_type=ExamCalendar.PeriodType.F1,
+            start_date=self.start, end_date=self.day(12), created_by=self.user,
+        )
+        ExamEvent.objects.create(calendar=other, subject=previous, date=self.day(0))
+        CalendarBlockedDay.objects.create(calendar=other, date=self.day(1))
+        blocked = CalendarBlockedDay.objects.filter(calendar=self.calendar).count()
+        CalendarBlockedDay.objects.create(calendar=self.calendar, date=self.day(7 + blocked))
+        create_version(self.calendar, f'v{offset}', self.user)
+        # La segunda versión cambia un solo evento: se guarda como delta de la anterior.
+        ExamEvent.objects.filter(subject=previous).update(date=self.day(5))
+        return create_version(self.calendar, f'v{offset}b', self.user)
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(EXPORT_CACHE_DIR=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def assertConstantQueries(self, expected, request, setup=None):
+        # `setup(version)` prepara lo que recibe `request` (por defecto, la última versión).
+        for count in (3, 12):
+            with self.subTest(events=count):
+                version = self.grow(count)
+                argument = setup(version) if setup else version
+                self.commit()
+                cache.clear()
+                _local.clear()
+                snapshot_cache.items.clear()
+                with self.assertNumQueries(expected):
+                    response = request(argument)
+                self.assertIn(response.status_code, (200, 204), getattr(response, 'data', None))
+                if response.streaming:
+                    b''.join(response.streaming_content)
+
+    def events(self):
+        return list(ExamEvent.objects.filter(calendar=self.calendar).order_by('id'))
+
+    def post(self, path, data, **headers):
+        return self.client.post(self.url(path), data, format='json', **headers)
+
+    def upload(self, path, workbook):
+        return self.client.post(path, {'file': workbook}, format='multipart')
+
+    def test_calendar_list(self):
+        self.assertConstantQueries(1, lambda version: self.client.get('/api/calendars/'))
+
+    def test_calendar_list_with_nested_relations(self):
+        self.assertConstantQueries(3, lambda version: self.client.get('/api/calendars/?include=events,blocked_days'))
+
+    def test_calendar_retrieve(self):
+        self.assertConstantQueries(3, lambda version: self.client.get(self.url()))
+
+    def test_calendar_retrieve_with_fields(self):
+        self.assertConstantQueries(2, lambda version: self.client.get(self.url('?fields=id,name,events')))
+
+    def test_validate_assignment(self):
+        subject = self.subject('Nueva')
+        self.assertConstantQueries(5, lambda version: self.client.post(
+            self.url('validate_assignment/'), {'subject': subject.id, 'date': self.day(3).isoformat()}, format='json',
+        ))
+
+    def test_feasibility_matrix(self):
+        self.assertConstantQueries(5, lambda version: self.client.get(self.url('feasibility_matrix/')))
+
+    def test_version_list(self):
+        self.assertConstantQueries(1, lambda version: self.client.get(f'/api/versions/?calendar={self.calendar.id}'))
+
+    def test_version_retrieve(self):
+        self.assertConstantQueries(3, lambda version: self.client.get(f'/api/versions/{version.id}/'))
+
+    def test_version_diff(self):
+        first = self.grow(2)
+        self.assertConstantQueries(6, lambda version: self.client.get(f'/api/versions/{first.id}/diff/{version.id}/'))
+
+    def test_save_version(self):
+        self.assertConstantQueries(15, lambda version: self.client.post(self.url('save_version/'), {'label': 'x'}, format='json'))
+
+    def test_assign_event(self):
+        self.assertConstantQueries(18, lambda subject: self.post(
+            'assign_event/', {'subject': subject.id, 'date': self.day(3).isoformat()},
+        ), setup=lambda version: self.subject(f'Nueva {version.id}'))
+
+    def test_move_event(self):
+        self.assertConstantQueries(14, lambda event: self.post(
+            'assign_event/', {'subject': event.subject_id, 'date': self.day(2).isoformat(), 'event_id': event.id},
+        ), setup=lambda version: self.events()[-1])
+
+    def test_assign_events_bulk(self):
+        def moves(version):
+            # Todos los eventos al día siguiente (lunes a sábado) más una materia nueva.
+            items = [
+                {'subject': event.subject_id, 'date': self.day((event.date - self.start).days % 5 + 1).isoformat(), 'event_id': event.id}
+                for event in self.events()
+            ]
+            return items + [{'subject': self.subject(f'Nueva {version.id}').id, 'date': self.day(0).isoformat()}]
+
+        self.assertConstantQueries(17, lambda items: self.post(
+            'assign_events_bulk/', {'moves': items, 'allow_warnings': True},
+        ), setup=moves)
+
+    def free_day(self):
+        blocked = set(CalendarBlockedDay.objects.filter(calendar=self.calendar).values_list('date', flat=True))
+        return next(self.day(offset) for offset in range(12, 0, -1) if self.day(offset) not in blocked)
+
+    def test_toggle_blocked_day(self):
+        self.assertConstantQueries(12, lambda date: self.post('toggle_blocked_day/', {'date': date.isoformat()}), setup=lambda version: self.free_day())
+
+    def test_remove_event(self):
+        self.assertConstantQueries(9, lambda event: self.client.delete(self.url(f'events/{event.id}/')), setup=lambda version: self.events()[0])
+
+    def test_restore_version(self):
+        def changed(version):
+            # Después de la versión se borra, mueve y agrega un tercio de los eventos cada uno y
+            # se borra, cambia y agrega un feriado: la restauración hace todas las operaciones.
+            CalendarBlockedDay.objects.create(calendar=self.calendar, date=self.free_day())
+            saved = create_version(self.calendar, f'r{version.id}', self.user)
+            events = self.events()
+            ExamEvent.objects.filter(id__in=[event.id for event in events[::3]]).delete()
+            for event in events[1::3]:
+                ExamEvent.objects.filter(id=event.id).update(date=self.day((event.date - self.start).days % 5 + 1))
+            for event in events[2::3]:
+                self.event(self.subject(f'Nueva {event.id}'), 0)
+            first, second = CalendarBlockedDay.objects.filter(calendar=self.calendar).order_by('date')[:2]
+            CalendarBlockedDay.objects.create(calendar=self.calendar, date=self.free_day())
+            first.delete()
+            second.reason = 'Otro motivo'
+            second.save()
+            return saved
+
+        self.assertConstantQueries(27, lambda version: self.post(f'restore_version/{version.id}/', {}), setup=changed)
+
+    def test_export_excel(self):
+        self.assertConstantQueries(6, lambda version: self.client.get(self.url('export/excel/')))
+
+    def test_export_pdf(self):
+        self.assertConstantQueries(7, lambda version: self.client.get(self.url('export/pdf/')))
+
+    def test_audit(self):
+        self.assertConstantQueries(5, lambda version: self.client.get(self.url('audit/')))
+
+    def test_suggest(self):
+        self.assertConstantQueries(6, lambda subject: self.post(
+            'suggest/', {'subject': subject.id, 'date': self.day(6).isoformat()},
+        ), setup=lambda version: self.subject(f'Nueva {version.id}'))
+
+    def test_student_load(self):
+        def cohort(version):
+            # Una cohorte que cursa todas las materias, también las del otro calendario.
+            cohort = Cohort.objects.create(name=f'Cohorte {version.id}', size=30)
+            cohort.subjects.set(Subject.objects.all())
+
+        self.assertConstantQueries(5, lambda argument: self.client.get(self.url('student_load/')), setup=cohort)
+
+    def test_auto_schedule(self):
+        self.assertConstantQueries(14, lambda version: self.post(
+            'auto_schedule/', {'apply': True, 'keep_existing': False, 'time_budget': 0.2},
+        ))
+
+    def test_import_subjects(self):
+        def workbook(version):
+            # Todas las materias con otro valor de "pesada" más una nueva.
+            rows = [[subject.name, 'SEM2', 'No' if subject.is_heavy else 'Sí'] for subject in Subject.objects.all()]
+            return self.workbook(['Asignatura', 'Grupo', 'Pesada'], *rows, [f'Nueva {version.id}', 'SEM4', 'No'])
+
+        self.assertConstantQueries(5, lambda workbook: self.upload('/api/subjects/import/', workbook), setup=workbook)
+
+    def test_import_cohorts(self):
+        def workbook(version):
+            rows = [[f'Cohorte {version.id}', 25, subject.name] for subject in Subject.objects.all()]
+            return self.workbook(['Cohorte', 'Estudiantes', 'Asignatura'], *rows)
+
+        self.assertConstantQueries(7, lambda workbook: self.upload('/api/cohorts/import/', workbook), setup=workbook)
+
+    def test_import_blocked_days(self):
+        def workbook(version):
+            return self.workbook(['Fecha', 'Motivo'], *([self.day(offset), f'Motivo {version.id}'] for offset in range(7, 13)))
+
+        self.assertConstantQueries(9, lambda workbook: self.upload(self.url('import/blocked_days/'), workbook), setup=workbook)
+
+    def test_import_events(self):
+        def workbook(version):
+            rows = [[self.day((event.date - self.start).days % 5 + 1), event.subject.name] for event in self.events()]
+            return self.workbook(['Fecha', 'Asignatura'], *rows, [self.day(0), self.subject(f'Nueva {version.id}').name])
+
+        self.assertConstantQueries(12, lambda workbook: self.upload(self.url('import/events/'), workbook), setup=workbook)
+
+
+def legacy_validation(calendar, subject, target_date, event_id=None):
+    # Validación original, con una query por regla: referencia para CalendarContext en los
+    # tipos de regla que existían entonces.
+    rules = list(
+        Rule.objects.filter(enabled=True).filter(global_rule=True) |
+        Rule.objects.filter(enabled=True, calendar=calendar)
+    )
+    conflicts = []
+    if target_date < calendar.start_date or target_date > calendar.end_date:
+        conflicts.append(('HARD', 'La fecha está fuera del rango del calendario.'))
+    if target_date.weekday() == 6:
+        conflicts.append(('HARD', 'No se permiten exámenes los domingos.'))
+    if calendar.blocked_days.filter(date=target_date).exists():
+        conflicts.append(('HARD', 'El día está marcado como feriado/bloqueado.'))
+    weekday_name = WEEKDAY_NAMES[target_date.weekday()]
+    if subject.allowed_weekdays and weekday_name not in subject.allowed_weekdays:
+        allowed_es = [WEEKDAY_LABELS_ES.get(day, day) for day in subject.allowed_weekdays]
+        conflicts.append(('HARD', f'{subject.name} solo puede rendirse en: {", ".join(allowed_es)}.'))
+    if subject.fixed_dates and target_date.isoformat() not in subject.fixed_dates:
+        conflicts.append(('HARD', f'{subject.name} solo permite fechas específicas.'))
+    same_day_events = (
+        ExamEvent.objects.filter(calendar=calendar, date=target_date).exclude(id=event_id).exclude(subject_id=subject.id)
+    )
+    for rule in rules:
+        if rule.rule_type in (Rule.RuleType.SAME_DAY, Rule.RuleType.PREFER_SAME_DAY) and rule.subject_a_id and rule.subject_b_id:
+            if subject.id in (rule.subject_a_id, rule.subject_b_id):
+                other = rule.subject_b if subject.id == rule.subject_a_id else rule.subject_a
+                if not ExamEvent.objects.filter(calendar=calendar, subject=other, date=target_date).exclude(id=event_id).exists():
+                    if rule.rule_type == Rule.RuleType.SAME_DAY:
+                        conflicts.append((rule.severity, f'Restricción: {subject.name} debe rendirse junto a {other.name} el mismo día.'))
+                    else:
+                        conflicts.append(('SOFT', f'Preferencia: {subject.name} idealmente coincide con {other.name}.'))
+        if rule.rule_type == Rule.RuleType.HEAVY_NOT_SAME_DAY and subject.is_heavy:
+            heavy_adjacent_date = (
+                ExamEvent.objects.filter(calendar=calendar, subject__is_heavy=True)
+                .exclude(id=event_id).exclude(subject_id=subject.id)
+                .filter(date__in=[target_date - timedelta(days=1), target_date + timedelta(days=1)])
+                .exists()
+            )
+            if same_day_events.filter(subject__is_heavy=True).exists():
+                conflicts.append(('SOFT', 'Advertencia: hay más de una materia pesada en la misma fecha.'))
+            if heavy_adjacent_date:
+                conflicts.append(('SOFT', 'Advertencia: hay materias pesadas con solo 1 día de separación.'))
+        if rule.rule_type == Rule.RuleType.SUBJECT_ONLY_WEEKDAYS and rule.subject_a_id == subject.id:
+            allowed_weekdays = rule.params.get('allowed_weekdays') if isinstance(rule.params, dict) else None
+            if isinstance(allowed_weekdays, str):
+                allowed_weekdays = [allowed_weekdays]
+            if allowed_weekdays and weekday_name not in allowed_weekdays:
+                allowed_es = [WEEKDAY_LABELS_ES.get(day, day) for day in allowed_weekdays]
+                conflicts.append((rule.severity, f'{subject.name} solo puede rendirse en: {", ".join(allowed_es)}.'))
+    return summarize_conflicts(conflicts)
+
+
+class AuditTests(CalendarTestCase):
+    def setUp(self):
+        super().setUp()
+        self.algebra = self.subject('Álgebra', is_heavy=True)
+        self.calculo = self.subject('Cálculo', is_heavy=True)
+        self.dibujo = self.subject('Dibujo')
+        self.ingles = self.subject('Inglés', allowed_weekdays=['Monday'])
+        self.event(self.algebra, 1)
+        self.event(self.calculo, 1)
+        self.event(self.dibujo, 2)
+        self.event(self.ingles, 3)
+        self.rule(Rule.RuleType.HEAVY_NOT_SAME_DAY, severity=Rule.Severity.SOFT)
+        # El feriado se carga después de ubicar Dibujo: el evento queda en un día bloqueado.
+        CalendarBlockedDay.objects.create(calendar=self.calendar, date=self.day(2))
+
+    def test_report_matches_validate(self):
+        response = self.client.get(self.url('audit/'))
+
+        self.assertEqual(response.status_code, 200)
+        report = response.data
+        self.assertEqual((report['calendar'], report['events'], report['hard'], report['soft']), (self.calendar.id, 4, 2, 2))
+        self.assertEqual(
+            [(v['subject_name'], v['date'], v['severity']) for v in report['violations']],
+            [
+                ('Álgebra', self.day(1).isoformat(), 'soft'),
+                ('Cálculo', self.day(1).isoformat(), 'soft'),
+                ('Dibujo', self.day(2).isoformat(), 'hard'),
+                ('Inglés', self.day(3).isoformat(), 'hard'),
+            ],
+        )
+        context = CalendarContext.load(self.calendar)
+        subjects = Subject.objects.in_bulk()
+        for violation in report['violations']:
+            with self.subTest(violation['subject_name']):
+                expected = context.validate(subjects[violation['subject']], violation['date'], violation['event_id'])
+                self.assertEqual((violation['severity'], violation['message']), (expected['severity'], expected['message']))
+                self.assertTrue(violation['conflicts'])
+
+    def test_command(self):
+        ExamCalendar.objects.create(
+            name='Sin conflictos', period_type=ExamCalendar.PeriodType.F2,
+            start_date=self.day(20), end_date=self.day(30), created_by=self.user,
+        )
+        out = StringIO()
+        call_command('audit_calendars', '--json', stdout=out)
+        report = json.loads(out.getvalue())
+
+        self.assertEqual([(c['calendar_name'], c['hard'], c['soft']) for c in report['calendars']], [('Finales', 2, 2), ('Sin conflictos', 0, 0)])
+        self.assertEqual((report['events'], report['hard'], report['soft']), (4, 2, 2))
+        with self.assertRaises(CommandError):
+            call_command('audit_calendars', '--fail-on-hard', stdout=StringIO())
+
+        # Sin los eventos con conflictos hard solo quedan advertencias.
+        ExamEvent.objects.filter(subject__in=[self.dibujo, self.ingles]).delete()
+        out = StringIO()
+        call_command('audit_calendars', self.calendar.id, '--fail-on-hard', stdout=out)
+        self.assertIn('Finales (F1): 2 eventos, 0 hard, 2 soft', out.getvalue())
+
+
+class StudentLoadTests(CalendarTestCase):
+    def setUp(self):
+        super().setUp()
+        # Un calendario que se solapa con la segunda semana y otro fuera del rango.
+        self.other = ExamCalendar.objects.create(
+            name='Recuperatorios', period_type=ExamCalendar.PeriodType.F2,
+            start_date=self.day(7), end_date=self.day(18), created_by=self.user,
+        )
+        later = ExamCalendar.objects.create(
+            name='Abril', period_type=ExamCalendar.PeriodType.P1,
+            start_date=self.day(30), end_date=self.day(40), created_by=self.user,
+        )
+        algebra = self.subject('Álgebra', is_heavy=True)
+        calculo = self.subject('Cálculo', is_heavy=True)
+        dibujo = self.subject('Dibujo')
+        ingles = self.subject('Inglés')
+        quimica = self.subject('Química')
+        fisica = self.subject('Física', is_heavy=True)
+        self.event(algebra, 1)
+        self.event(calculo, 2)
+        self.event(quimica, 9)
+        ExamEvent.objects.create(calendar=self.other, subject=dibujo, date=self.day(8))
+        ExamEvent.objects.create(calendar=self.other, subject=ingles, date=self.day(9))
+        ExamEvent.objects.create(calendar=later, subject=fisica, date=self.day(31))
+        # Dos pesadas seguidas; tres exámenes en dos días (uno de otro calendario); sin exámenes.
+        Cohort.objects.create(name='Ingeniería civil', size=30).subjects.set([algebra, calculo, dibujo, fisica])
+        Cohort.objects.create(name='Recursantes', size=10).subjects.set([dibujo, ingles, quimica])
+        Cohort.objects.create(name='Vacía', size=5)
+
+    def test_hotspots_across_overlapping_calendars(self):
+        response = self.client.get(self.url('student_load/'))
+
+        self.assertEqual(response.status_code, 200)
+        data = response.data
+        self.assertEqual([c['id'] for c in data['calendars']], [self.calendar.id, self.other.id])
+        self.assertEqual(
+            [(c['name'], c['exams'], c['heavy'], c['max_in_window'], c['max_heavy_in_window'], c['hotspots']) for c in data['cohorts']],
+            [('Ingeniería civil', 3, 2, 2, 2, 1), ('Recursantes', 3, 0, 3, 0, 1)],
+        )
+        self.assertEqual(
+            [(h['cohort_name'], h['start'], h['end'], h['count'], h['heavy']) for h in data['hotspots']],
+            [
+                ('Ingeniería civil', self.day(1).isoformat(), self.day(2).isoformat(), 2, 2),
+                ('Recursantes', self.day(8).isoformat(), self.day(9).isoformat(), 3, 0),
+            ],
+        )
+        self.assertEqual(
+            [(e['calendar'], e['subject_name']) for e in data['hotspots'][1]['exams']],
+            [(self.other.id, 'Dibujo'), (self.calendar.id, 'Química'), (self.other.id, 'Inglés')],
+        )
+        self.assertEqual(
+            [(d['date'], d['exams'], d['students'], d['heavy_students']) for d in data['daily']],
+            [
+                (self.day(1).isoformat(), 1, 30, 30),
+                (self.day(2).isoformat(), 1, 30, 30),
+                (self.day(8).isoformat(), 1, 40, 0),
+                (self.day(9).isoformat(), 2, 10, 0),
+            ],
+        )
+
+    def test_limits_from_query_params(self):
+        response = self.client.get(self.url('student_load/'), {'window': 1, 'max_exams': 1, 'max_heavy': 1})
+
+        self.assertEqual(response.status_code, 200)
+        # Con ventana de un día solo cuentan los exámenes del mismo día.
+        self.assertEqual(
+            [(h['cohort_name'], h['start'], h['count']) for h in response.data['hotspots']],
+            [('Recursantes', self.day(9).isoformat(), 2)],
+        )
+        self.assertEqual(self.client.get(self.url('student_load/'), {'window': 0}).status_code, 400)
+        self.assertEqual(self.client.get(self.url('student_load/'), {'max_exams': 'dos'}).status_code, 400)
+
+
+class ValidationTests(CalendarTestCase):
+    def test_context_matches_per_rule_queries(self):
+        algebra = self.subject('Álgebra', is_heavy=True)
+        calculo = self.subject('Cálculo', is_heavy=True)
+        fisica = self.subject('Física', is_heavy=True, allowed_weekdays=['Tuesday', 'Thursday'])
+        quimica = self.subject('Química', fixed_dates=[self.day(3).isoformat(), self.day(9).isoformat()])
+        dibujo = self.subject('Dibujo', group=Subject.SemesterGroup.SEM4)
+        ingles = self.subject('Inglés', group=Subject.SemesterGroup.SEM4)
+        subjects = [algebra, calculo, fisica, quimica, dibujo, ingles]
+        self.event(algebra, 1)
+        self.event(calculo, 2)
+        self.event(fisica, 3)
+        self.event(dibujo, 3)
+        CalendarBlockedDay.objects.create(calendar=self.calendar, date=self.day(4))
+        self.rule(Rule.RuleType.SAME_DAY, dibujo, ingles)
+        self.rule(Rule.RuleType.SAME_DAY, quimica, fisica, severity=Rule.Severity.SOFT)
+        self.rule(Rule.RuleType.PREFER_SAME_DAY, algebra, quimica)
+        self.rule(Rule.RuleType.HEAVY_NOT_SAME_DAY)
+        self.rule(Rule.RuleType.SUBJECT_ONLY_WEEKDAYS, ingles, allowed_weekdays=['Monday', 'Wednesday', 'Thursday'])
+        self.rule(Rule.RuleType.SUBJECT_ONLY_WEEKDAYS, calculo, severity=Rule.Severity.SOFT, allowed_weekdays='Friday')
+        Rule.objects.create(global_rule=True, rule_type=Rule.RuleType.PREFER_SAME_DAY, severity=Rule.Severity.SOFT, subject_a=calculo, subject_b=fisica)
+        Rule.objects.create(calendar=self.calendar, enabled=False, rule_type=Rule.RuleType.SAME_DAY, severity=Rule.Severity.HARD, subject_a=algebra, subject_b=ingles)
+        events = {event.subject_id: event.id for event in ExamEvent.objects.filter(calendar=self.calendar)}
+
+        checked = set()
+        for subject in subjects:
+            for offset in range(-1, 14):
+                day = self.day(offset)
+                for event_id in {None, events.get(subject.id)}:
+                    with self.subTest(subject=subject.name, date=day, event_id=event_id):
+                        expected = legacy_validation(self.calendar, subject, day, event_id)
+                        self.assertEqual(validate_exam_assignment(self.calendar, subject, day, event_id), expected)
+                        checked.add(expected['severity'])
+
+        # El fixture cubre los tres resultados posibles.
+        self.assertEqual(checked, {None, 'soft', 'hard'})
+
+
+@override_settings(VERSION_KEYFRAME_INTERVAL=3)
+class VersionStorageTests(CalendarTestCase):
+    # Con un keyframe cada 3 versiones, una cadena de 7 mezcla keyframes y deltas.
+
+    def setUp(self):
+        super().setUp()
+        self.subjects = [self.subject(f'M{i}') for i in range(6)]
+        self.events = {subject.id: self.event(subject, i) for i, subject in enumerate(self.subjects)}
+        self.expected = {}
+        edits = [
+            lambda: None,
+            lambda: ExamEvent.objects.filter(id=self.events[self.subjects[0].id].id).update(date=self.day(8)),
+            lambda: CalendarBlockedDay.objects.create(calendar=self.calendar, date=self.day(10), reason='Feriado'),
+            lambda: ExamEvent.objects.filter(id=self.events[self.subjects[1].id].id).delete(),
+            lambda: self.rule(Rule.RuleType.SAME_DAY, self.subjects[2], self.subjects[3]),
+            lambda: CalendarBlockedDay.objects.filter(calendar=self.calendar).update(reason='Paro'),
+            lambda: self.event(self.subjects[1], 11),
+        ]
+        self.versions = []
+        for i, edit in enumerate(edits):
+            edit()
+            version = create_version(self.calendar, f'v{i}', self.user)
+            self.expected[version.id] = build_snapshot(self.calendar)
+            self.versions.append(version)
+
+    def assertSnapshots(self):
+        # Desde la base y sin memoización: cada versión se reconstruye desde su keyframe.
+        snapshot_cache.items.clear()
+        for version in CalendarVersion.objects.filter(calendar=self.calendar):
+            with self.subTest(version=version.label):
+                self.assertEqual(version_snapshot(version), self.expected[version.id])
+
+    def test_chain_mixes_keyframes_and_deltas(self):
+        stored = list(CalendarVersion.objects.filter(calendar=self.calendar).order_by('version_number').values_list('is_keyframe', 'depth'))
+
+        # v4 agrega una regla: el delta supera la mitad del snapshot y se guarda como keyframe.
+        self.assertEqual(stored, [(True, 0), (False, 1), (False, 2), (True, 0), (True, 0), (False, 1), (False, 2)])
+        self.assertSnapshots()
+
+    def test_delete_version_reparents_children(self):
+        # v1 es delta con un hijo delta (v2); v4 es keyframe con un hijo delta (v5).
+        for index in (1, 4):
+            victim = self.versions[index]
+            child = self.versions[index + 1]
+            delete_version(CalendarVersion.objects.get(id=victim.id))
+            del self.expected[victim.id]
+
+            child.refresh_from_db()
+            self.assertTrue(child.is_keyframe)
+            self.assertEqual(child.depth, 0)
+            self.assertEqual(child.parent_id, self.versions[index - 1].id)
+            self.assertSnapshots()
+
+
+class RestoreVersionTests(CalendarTestCase):
+    def setUp(self):
+        super().setUp()
+        self.subjects = [self.subject(f'M{i}') for i in range(4)]
+        for i, subject in enumerate(self.subjects[:3]):
+            self.event(subject, i)
+        CalendarBlockedDay.objects.create(calendar=self.calendar, date=self.day(8), reason='Feriado')
+        CalendarBlockedDay.objects.create(calendar=self.calendar, date=self.day(9), reason='Paro')
+        self.version = create_version(self.calendar, 'v1', self.user)
+        self.snapshot = build_snapshot(self.calendar)
+        # Después de la versión: un evento borrado, uno movido, uno nuevo y un feriado de cada tipo.
+        m0, m1, _, m3 = self.subjects
+        ExamEvent.objects.filter(subject=m0).delete()
+        ExamEvent.objects.filter(subject=m1).update(date=self.day(4))
+        self.event(m3, 5)
+        CalendarBlockedDay.objects.filter(date=self.day(8)).delete()
+        CalendarBlockedDay.objects.filter(date=self.day(9)).update(reason='Otro')
+        CalendarBlockedDay.objects.create(calendar=self.calendar, date=self.day(10))
+
+    def state(self):
+        self.calendar.refresh_from_db()
+        snapshot = build_snapshot(self.calendar)
+        return self.calendar.revision, self.calendar.head_version_id, snapshot['events'], snapshot['blocked_days']
+
+    def restore(self, **headers):
+        return self.client.post(self.url(f'restore_version/{self.version.id}/'), {}, format='json', **headers)
+
+    def test_restores_events_and_blocked_days_of_the_snapshot(self):
+        revision = self.state()[0]
+
+        response = self.restore()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['events'], {'created': 1, 'updated': 1, 'deleted': 1})
+        self.assertEqual(response.data['blocked_days'], {'created': 1, 'updated': 1, 'deleted': 1})
+        self.assertEqual(response.data['revision'], revision + 1)
+        self.assertEqual(response.data['violations'], [])
+        self.assertEqual(self.state(), (revision + 1, self.version.id, self.snapshot['events'], self.snapshot['blocked_days']))
+
+    def test_failure_rolls_back_the_calendar(self):
+        before = self.state()
+
+        with mock.patch('core.versions.set_head', side_effect=RuntimeError('fallo')), self.assertRaises(RuntimeError):
+            self.restore()
+
+        self.assertEqual(self.state(), before)
+
+    def test_stale_revision_leaves_the_calendar_untouched(self):
+        before = self.state()
+
+        response = self.restore(HTTP_IF_MATCH=f'"{before[0] - 1}"')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.state(), before)
+
+    def test_reports_hard_violations_of_the_restored_state(self):
+        # La regla se agrega después de guardar la versión: M0 y M1 no pueden ir seguidas.
+        m0, m1 = self.subjects[:2]
+        self.rule(Rule.RuleType.MIN_GAP_DAYS, m0, m1, min_days=2)
+
+        response = self.restore()
+
+        self.assertEqual(response.status_code, 200)
+        violations = {item['subject']: item for item in response.data['violations']}
+        self.assertEqual(set(violations), {m0.id, m1.id})
+        self.assertTrue(all(item['severity'] == 'hard' and not item['is_valid'] for item in violations.values()))
+
+
+class MergeSnapshotTests(SimpleTestCase):
+    base = {
+        'events': [{'subject_id': 1, 'date': '2026-03-02'}, {'subject_id': 2, 'date': '2026-03-03'}],
+        'blocked_days': [{'date': '2026-03-10', 'reason': 'Feriado'}],
+        'rules': [],
+    }
+
+    def edit(self, events=None, blocked_days=None):
+        return {
+            'events': events if events is not None else self.base['events'],
+            'blocked_days': blocked_days if blocked_days is not None else self.base['blocked_days'],
+            'rules': [],
+        }
+
+    def test_non_conflicting_edits_are_combined(self):
+        # Nosotros movemos la materia 1; ellos quitan la 2, agregan la 3 y un feriado.
+        ours = self.edit(events=[{'subject_id': 1, 'date': '2026-03-05'}, {'subject_id': 2, 'date': '2026-03-03'}])
+        theirs = self.edit(
+            events=[{'subject_id': 1, 'date': '2026-03-02'}, {'subject_id': 3, 'date': '2026-03-06'}],
+            blocked_days=[{'date': '2026-03-10', 'reason': 'Feriado'}, {'date': '2026-03-11', 'reason': 'Paro'}],
+        )
+
+        for strategy in ('ours', 'theirs'):
+            merged, conflicts = merge_snapshots(self.base, ours, theirs, strategy)
+            self.assertEqual(conflicts, [])
+            self.assertEqual(merged['events'], [{'subject_id': 1, 'date': '2026-03-05'}, {'subject_id': 3, 'date': '2026-03-06'}])
+            self.assertEqual(merged['blocked_days'], theirs['blocked_days'])
+
+    def test_conflicting_edit_is_reported_and_resolved_by_strategy(self):
+        # Los dos mueven la materia 2 a fechas distintas; la materia 1 solo la mueven ellos.
+        ours = self.edit(events=[{'subject_id': 1, 'date': '2026-03-02'}, {'subject_id': 2, 'date': '2026-03-04'}])
+        theirs = self.edit(events=[{'subject_id': 1, 'date': '2026-03-09'}, {'subject_id': 2, 'date': '2026-03-07'}])
+
+        merged, conflicts = merge_snapshots(self.base, ours, theirs, 'ours')
+        self.assertEqual(conflicts, [{
+            'type': 'event', 'key': 2,
+            'base': {'subject_id': 2, 'date': '2026-03-03'},
+            'ours': {'subject_id': 2, 'date': '2026-03-04'},
+            'theirs': {'subject_id': 2, 'date': '2026-03-07'},
+        }])
+        self.assertEqual(merged['events'], [{'subject_id': 1, 'date': '2026-03-09'}, {'subject_id': 2, 'date': '2026-03-04'}])
+
+        merged, conflicts = merge_snapshots(self.base, ours, theirs, 'theirs')
+        self.assertEqual(len(conflicts), 1)
+        self.assertEqual(merged['events'], theirs['events'])
+
+    def test_edit_against_delete_is_a_conflict(self):
+        ours = self.edit(events=[{'subject_id': 1, 'date': '2026-03-02'}])
+        theirs = self.edit(events=[{'subject_id': 1, 'date': '2026-03-02'}, {'subject_id': 2, 'date': '2026-03-12'}])
+
+        merged, conflicts = merge_snapshots(self.base, ours, theirs, 'ours')
+
+        self.assertEqual([(c['type'], c['key'], c['ours']) for c in conflicts], [('event', 2, None)])
+        self.assertEqual(merged['events'], [{'subject_id': 1, 'date': '2026-03-02'}])
+
+
+class MergeEndpointTests(CalendarTestCase):
+    def test_merge_branches_into_a_new_version(self):
+        a, b = self.subject('A'), self.subject('B')
+        self.event(a, 1)
+        self.event(b, 2)
+        base = create_version(self.calendar, 'base', self.user)
+        ExamEvent.objects.filter(subject=a).update(date=self.day(3))
+        ours = create_version(self.calendar, 'nuestra', self.user)
+        # La otra rama parte de la misma base y mueve solo B.
+        events = [{'subject_id': a.id, 'date': self.day(1).isoformat()}, {'subject_id': b.id, 'date': self.day(5).isoformat()}]
+        theirs = create_version(self.calendar, 'de ellos', self.user, snapshot={**base.snapshot, 'events': events}, parent=base)
+
+        response = self.client.post(f'/api/versions/{ours.id}/merge/', {'other': theirs.id}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['ancestor'], base.id)
+        self.assertEqual(response.data['conflicts'], [])
+        merged = CalendarVersion.objects.get(id=response.data['version']['id'])
+        self.assertEqual(merged.parent_id, ours.id)
+        self.assertEqual(
+            version_snapshot(merged)['events'],
+            [{'subject_id': a.id, 'date': self.day(3).isoformat()}, {'subject_id': b.id, 'date': self.day(5).isoformat()}],
+        )
+
+    def test_missing_or_foreign_other_version(self):
+        ours = create_version(self.calendar, 'nuestra', self.user)
+        other_calendar = ExamCalendar.objects.create(
+            name='Otro', period_type=ExamCalendar.PeriodType.F1, start_date=self.start, end_date=self.day(12), created_by=self.user,
+        )
+        foreign = create_version(other_calendar, 'ajena', self.user)
+
+        self.assertEqual(self.client.post(f'/api/versions/{ours.id}/merge/', {}, format='json').status_code, 400)
+        for other in (foreign.id, 999999, 'x'):
+            with self.subTest(other=other):
+                response = self.client.post(f'/api/versions/{ours.id}/merge/', {'other': other}, format='json')
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(self.client.get(f'/api/versions/{ours.id}/diff/{other}/').status_code, 404)
+        self.assertEqual(CalendarVersion.objects.count(), 2)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN es de SQLite')
+class QueryPlanTests(CalendarTestCase):
+    # Los listados filtrados y las páginas siguientes del cursor usan los índices de
+    # 0006_list_indexes (sin recorrer la tabla ni ordenar con un B-tree temporal).
+
+    def setUp(self):
+        super().setUp()
+        for i in range(30):
+            subject = self.subject(f'M{i:02}', group=Subject.SemesterGroup.SEM2 if i % 2 else Subject.SemesterGroup.SEM4)
+            self.event(subject, i % 12)
+            self.rule(Rule.RuleType.HEAVY_NOT_SAME_DAY, subject)
+        for i in range(6):
+            create_version(self.calendar, f'v{i}', self.user)
+
+    def plans(self, path):
+        # Plan de cada SELECT que ejecuta el request, por tabla consultada.
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                if query['sql'].startswith('SELECT'):
+                    cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                    plans.append((query['sql'], ' | '.join(row[-1] for row in cursor.fetchall())))
+        return response, plans
+
+    def assertUsesIndex(self, path, table, *indexes):
+        # Primera página y la siguiente (con la condición del cursor): alguno de `indexes`.
+        response, plans = self.plans(path)
+        next_url = response.data['next']
+        self.assertIsNotNone(next_url)
+        _, next_plans = self.plans(next_url.split('testserver', 1)[1])
+        for sql, plan in plans + next_plans:
+            if f'FROM "{table}"' in sql:
+                self.assertTrue(any(f'USING INDEX {index} ' in plan for index in indexes), plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_subject_list_by_group(self):
+        self.assertUsesIndex('/api/subjects/?semester_group=SEM2&page_size=5', 'core_subject', 'core_subject_group_name')
+
+    def test_version_list_by_calendar(self):
+        # La restricción única (calendar, version_number) cubre el mismo orden; SQLite elige
+        # cualquiera de los dos.
+        self.assertUsesIndex(
+            f'/api/versions/?calendar={self.calendar.id}&page_size=2', 'core_calendarversion',
+            'core_version_calendar_number', 'core_calendarversion_calendar_id_version_number_62df1990_uniq',
+        )
+
+    def test_rule_index_queries(self):
+        sql, params = RuleIndex.rules_queryset(self.calendar).query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' | '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('core_rule_enabled_global', plan)
+        self.assertIn('core_rule_calendar_enabled', plan)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'PRAGMAs de SQLite')
+class SqlitePragmaTests(TestCase):
+    # Valores que devuelve SQLite al leer cada PRAGMA de settings.SQLITE_PRAGMAS.
+    expected = {'journal_mode': 'wal', 'synchronous': 1, 'cache_size': -32000, 'temp_store': 2}
+
+    def pragmas(self, conn):
+        with conn.cursor() as cursor:
+            return {name: cursor.execute(f'PRAGMA {name}').fetchone()[0] for name in settings.SQLITE_PRAGMAS}
+
+    def test_connection_uses_profile(self):
+        pragmas = self.pragmas(connection)
+        # mmap_size no se compara: SQLite lo acota según cómo se compiló.
+        del pragmas['mmap_size']
+        self.assertEqual(pragmas, {**self.expected, 'busy_timeout': settings.SQLITE_PRAGMAS['busy_timeout']})
+
+    def test_new_connections_apply_current_settings(self):
+        found = {}
+
+        def read():
+            # Otro hilo abre su propia conexión: connection_created aplica el perfil.
+            try:
+                found.update(self.pragmas(connections['default']))
+            finally:
+                connections['default'].close()
+
+        with override_settings(SQLITE_PRAGMAS={**settings.SQLITE_PRAGMAS, 'busy_timeout': 1234}):
+            thread = threading.Thread(target=read)
+            thread.start()
+            thread.join()
+
+        self.assertEqual(found['busy_timeout'], 1234)
+        self.assertEqual(found['journal_mode'], 'wal')
+
+
+@override_settings(**TEST_SETTINGS)
+class ConcurrentWriteTests(TransactionTestCase):
+    # Sin transacción envolvente: cada editor escribe desde su hilo y conexión, y los cambios
+    # se registran al confirmar como en producción.
+
+    def setUp(self):
+        cache.clear()
+        _local.clear()
+        self.user = User.objects.create(username='editor')
+        start = date(2026, 3, 2)
+        self.calendar = ExamCalendar.objects.create(
+            name='Finales', period_type=ExamCalendar.PeriodType.F1,
+            start_date=start, end_date=start + timedelta(days=12), created_by=self.user,
+        )
+        self.subjects = [Subject.objects.create(name=f'M{i}', semester_group=Subject.SemesterGroup.SEM2) for i in range(2)]
+        self.days = [start + timedelta(days=i) for i in (1, 3)]
+
+    def assign(self, subject, day, revision):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        return client.post(
+            f'/api/calendars/{self.calendar.id}/assign_event/', {'subject': subject.id, 'date': day.isoformat()},
+            format='json', HTTP_IF_MATCH=f'"{revision}"',
+        )
+
+    def test_same_revision_one_wins_and_the_other_gets_the_changes(self):
+        revision = self.calendar.revision
+        barrier = threading.Barrier(2)
+        responses = [None, None]
+
+        def writer(index):
+            try:
+                barrier.wait()
+                responses[index] = self.assign(self.subjects[index], self.days[index], revision)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=writer, args=(index,)) for index in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(response.status_code for response in responses), [200, 409])
+        winner = next(response for response in responses if response.status_code == 200)
+        loser = next(response for response in responses if response.status_code == 409)
+        self.assertEqual(winner.data['revision'], revision + 1)
+        self.assertEqual(loser.data['revision'], revision + 1)
+        self.assertEqual(loser['ETag'], f'"{revision + 1}"')
+        # El perdedor recibe el evento del ganador para aplicarlo y reintentar.
+        self.assertEqual([change['kind'] for change in loser.data['changes']], ['events'])
+        self.assertEqual(loser.data['changes'][0]['upsert'][0]['id'], winner.data['id'])
+        self.assertEqual(ExamEvent.objects.filter(calendar=self.calendar).count(), 1)
+
+    @override_settings(JOBS_MAX_PER_CALENDAR=2)
+    def test_concurrent_job_submissions_respect_the_limit(self):
+        barrier = threading.Barrier(4)
+        outcomes = []
+
+        def submit():
+            try:
+                barrier.wait()
+                submit_job(self.calendar, Job.Kind.EXPORT_PDF, {}, self.user)
+                outcomes.append('queued')
+            except JobLimitExceeded:
+                outcomes.append('limit')
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=submit) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(outcomes), ['limit', 'limit', 'queued', 'queued'])
+        self.assertEqual(Job.objects.filter(calendar=self.calendar).count(), 2)
+
+    def test_revision_increases_with_each_write(self):
+        revisions = [self.calendar.revision]
+        for subject, day in zip(self.subjects, self.days):
+            response = self.assign(subject, day, revisions[-1])
+            self.assertEqual(response.status_code, 200)
+            revisions.append(response.data['revision'])
+        stale = self.assign(self.subjects[0], self.days[1], revisions[0])
+
+        self.assertEqual(revisions, [revisions[0], revisions[0] + 1, revisions[0] + 2])
+        self.assertEqual(stale.status_code, 409)
+        self.assertEqual(stale.data['revision'], revisions[-1])
+        self.assertEqual(len(stale.data['changes']), 2)
+        self.calendar.refresh_from_db()
+        self.assertEqual(self.calendar.revision, revisions[-1])
+
+
+class PublicFeedTests(CalendarTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        override = override_settings(PUBLISH_DIR=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        feeds._published.clear()
+        self.event(self.subject('Álgebra', code='ALG'), 1)
+        self.event(self.subject('Física', group=Subject.SemesterGroup.SEM4), 2)
+        self.version = create_version(self.calendar, 'Publicada', self.user)
+
+    def publish(self):
+        response = self.client.post(f'/api/versions/{self.version.id}/publish/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def feed(self, name, **headers):
+        return self.client.get(f'/api/public/calendars/{self.calendar.id}/{name}', **headers)
+
+    def test_publish_writes_json_and_ics(self):
+        data = self.publish()
+
+        self.assertEqual(data['exams'], 2)
+        self.assertIn('calendar.ics', data['feeds'])
+        calendar = self.feed('calendar.json')
+        self.assertEqual(calendar.status_code, 200)
+        self.assertEqual([exam['subject'] for exam in json.loads(calendar.content)['exams']], ['Álgebra', 'Física'])
+        group = json.loads(self.feed('sem4.json').content)
+        self.assertEqual([exam['subject'] for exam in group['exams']], ['Física'])
+        ics = self.feed('calendar.ics')
+        self.assertEqual(ics['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertEqual(ics.content.count(b'BEGIN:VEVENT'), 2)
+        self.assertIn('SUMMARY:Examen: Álgebra'.encode(), ics.content)
+
+    def test_unknown_feed_is_not_found(self):
+        self.assertEqual(self.feed('calendar.json').status_code, 404)
+        self.publish()
+        self.assertEqual(self.feed('otro.json').status_code, 404)
+
+    def test_conditional_requests_are_not_modified(self):
+        self.publish()
+        response = self.feed('calendar.json')
+
+        self.assertEqual(self.feed('calendar.json', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.feed('calendar.json', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+    def test_gzip_variant_has_its_own_etag(self):
+        self.publish()
+        plain = self.feed('calendar.ics')
+        compressed = self.feed('calendar.ics', HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertNotEqual(compressed['ETag'], plain['ETag'])
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertEqual(self.feed('calendar.ics', HTTP_IF_NONE_MATCH=plain['ETag'], HTTP_ACCEPT_ENCODING='gzip').status_code, 200)
+
+    def test_old_publications_are_pruned(self):
+        for _ in range(3):
+            self.publish()
+
+        folders = [path.name for path in (self.directory / str(self.calendar.id)).iterdir() if path.is_dir()]
+        current = json.loads((self.directory / str(self.calendar.id) / 'current.json').read_text())['folder']
+        # Queda la publicación actual y la anterior (descargas en curso).
+        self.assertEqual(len(folders), 2)
+        self.assertIn(current, folders)
+
+
+@override_settings(REALTIME_POLL_INTERVAL=0.05)
+class RealtimeTests(CalendarTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.session = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        # close_old_connections cerraría la conexión de la transacción de la prueba.
+        patcher = mock.patch('core.realtime.close_old_connections')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def scope(self, origin='http://testserver', cookie=None, query=b''):
+        headers = [(b'host', b'testserver'), (b'origin', origin.encode())]
+        cookie = f'{settings.SESSION_COOKIE_NAME}={self.session}' if cookie is None else cookie
+        if cookie:
+            headers.append((b'cookie', cookie.encode()))
+        return {'type': 'websocket', 'path': f'/ws/calendars/{self.calendar.id}/', 'query_string': query, 'headers': headers}
+
+    def test_authorization(self):
+        cases = {
+            'valid': (self.scope(), True),
+            'bad_origin': (self.scope(origin='https://otro.example'), False),
+            'no_session': (self.scope(cookie=''), False),
+            'unknown_session': (self.scope(cookie=f'{settings.SESSION_COOKIE_NAME}=inexistente'), False),
+            'malformed_cookie': (self.scope(cookie=',='), False),
+        }
+        for name, (scope, allowed) in cases.items():
+            with self.subTest(name):
+                self.assertIs(realtime._authorize(scope, self.calendar.id), allowed)
+        self.assertFalse(realtime._authorize(self.scope(), 999999))
+
+    async def connect(self, scope):
+        # Socket contra colas en memoria: devuelve (mensajes enviados, cola de entrada, tarea).
+        incoming = asyncio.Queue()
+        sent = asyncio.Queue()
+        await incoming.put({'type': 'websocket.connect'})
+        task = asyncio.create_task(realtime.calendar_socket(scope, incoming.get, sent.put))
+        return sent, incoming, task
+
+    async def next_text(self, sent):
+        event = await asyncio.wait_for(sent.get(), 2)
+        self.assertEqual(event['type'], 'websocket.send')
+        return json.loads(event['text'])
+
+    async def test_socket_receives_published_changes(self):
+        subject = await sync_to_async(self.subject)('A')
+        with mock.patch.object(realtime, 'hub', realtime.ChangeHub()):
+            sent, incoming, task = await self.connect(self.scope())
+            self.assertEqual((await sent.get())['type'], 'websocket.accept')
+            hello = await self.next_text(sent)
+            self.assertEqual(hello['kind'], 'hello')
+
+            event = await sync_to_async(self.event)(subject, 1)
+            await sync_to_async(realtime.publish)(self.calendar.id, 'events', [event.id])
+            change = await self.next_text(sent)
+
+            self.assertEqual((change['kind'], change['upsert'][0]['id']), ('events', event.id))
+            self.assertGreater(change['id'], hello['id'])
+            await incoming.put({'type': 'websocket.disconnect'})
+            await task
+            self.assertEqual(realtime.hub.subscribers, {})
+
+    async def test_reconnect_replays_missed_changes(self):
+        await sync_to_async(realtime.publish)(self.calendar.id, 'reload')
+        last = await CalendarChange.objects.alatest('id')
+        await sync_to_async(realtime.publish)(self.calendar.id, 'blocked_days', delete=[self.day(3)])
+
+        with mock.patch.object(realtime, 'hub', realtime.ChangeHub()):
+            sent, incoming, task = await self.connect(self.scope(query=f'after={last.id}'.encode()))
+            self.assertEqual((await sent.get())['type'], 'websocket.accept')
+            missed = await self.next_text(sent)
+            hello = await self.next_text(sent)
+            await incoming.put({'type': 'websocket.disconnect'})
+            await task
+
+        self.assertEqual((missed['kind'], missed['delete']), ('blocked_days', [self.day(3).isoformat()]))
+        self.assertEqual((hello['kind'], hello['id']), ('hello', missed['id']))
+
+    async def test_rejected_socket_is_closed(self):
+        sent, _, task = await self.connect(self.scope(origin='https://otro.example'))
+        await task
+
+        self.assertEqual(await sent.get(), {'type': 'websocket.close', 'code': 4403})
+
+
+class JobTests(CalendarTestCase):
+    def job(self, kind, **params):
+        return Job.objects.create(calendar=self.calendar, kind=kind, params=params, created_by=self.user)
+
+    @override_settings(SOLVER_MAX_TIME_BUDGET=2.0)
+    def test_auto_schedule_time_budget_is_clamped(self):
+        for requested, used in ((3600, 2.0), (0, 0.1)):
+            with self.subTest(requested=requested), mock.patch('core.jobs.auto_schedule', return_value={'assignments': []}) as solver:
+                job = self.job(Job.Kind.AUTO_SCHEDULE, time_budget=requested)
+
+                self.assertTrue(run_job(job.id))
+                self.assertEqual(solver.call_args.kwargs['time_budget'], used)
+
+    def test_claimed_jobs_record_their_worker(self):
+        job = self.job(Job.Kind.EXPORT_PDF)
+
+        self.assertEqual(claim_jobs(1, 'host:1'), [job.id])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), (Job.Status.RUNNING, 'host:1'))
+        self.assertIsNotNone(job.heartbeat_at)
+
+    @override_settings(JOBS_HEARTBEAT_TIMEOUT=60)
+    def test_only_jobs_of_silent_workers_are_failed(self):
+        now = timezone.now()
+        alive = self.job(Job.Kind.EXPORT_PDF)
+        silent = self.job(Job.Kind.EXPORT_PDF)
+        unknown = self.job(Job.Kind.EXPORT_PDF)
+        Job.objects.filter(id=alive.id).update(status=Job.Status.RUNNING, worker='a:1', heartbeat_at=now - timedelta(seconds=5))
+        Job.objects.filter(id=silent.id).update(status=Job.Status.RUNNING, worker='b:2', heartbeat_at=now - timedelta(seconds=300))
+        Job.objects.filter(id=unknown.id).update(status=Job.Status.RUNNING)
+
+        self.assertEqual(fail_interrupted_jobs(), 2)
+        self.assertEqual(
+            dict(Job.objects.values_list('id', 'status')),
+            {alive.id: Job.Status.RUNNING, silent.id: Job.Status.FAILED, unknown.id: Job.Status.FAILED},
+        )
+
+        # La señal de vida mantiene el trabajo fuera del corte.
+        Job.objects.filter(id=alive.id).update(heartbeat_at=now - timedelta(seconds=300))
+        heartbeat([alive.id])
+        self.assertEqual(fail_interrupted_jobs(), 0)
+
+    def test_download_of_a_removed_result_file_is_gone(self):
+        job = self.job(Job.Kind.EXPORT_PDF)
+        Job.objects.filter(id=job.id).update(status=Job.Status.DONE, result_file='/nonexistent/resultado.pdf', result_name='resultado.pdf')
+
+        response = self.client.get(f'/api/jobs/{job.id}/download/')
+
+        self.assertEqual(response.status_code, 410)
+
+
+class BookletTests(SimpleTestCase):
+    def section(self, index):
+        # Dos meses: una página por mes.
+        return {
+            'calendar_id': index, 'calendar': f'Calendario {index}', 'period': 'Finales 1', 'group': '2do semestre',
+            'count': 1, 'title': f'Calendario {index}', 'subtitle': 'Rango', 'start': '2026-03-02', 'end': '2026-04-10',
+            'days': {'2026-03-03': ['Álgebra']}, 'blocked': {},
+        }
+
+    def test_pages_are_numbered_across_sections(self):
+        reader = PdfReader(build_booklet('Cuadernillo', '', [self.section(i) for i in range(3)]))
+
+        self.assertEqual(len(reader.pages), 7)
+        numbers = [re.findall(r'p\. (\d+)', page.extract_text()) for page in reader.pages]
+        self.assertEqual(numbers, [[str(number)] for number in range(1, 8)])
+        # Los marcadores apuntan a la primera página de cada sección (p. 2, 4 y 6).
+        starts = [reader.get_destination_page_number(item) for item in reader.outline if not isinstance(item, list)]
+        self.assertEqual(starts, [1, 3, 5])
+
+    def test_large_booklets_share_one_bounded_pool(self):
+        pool = mock.Mock()
+        pool.map.side_effect = lambda func, items, chunksize: map(func, items)
+        with mock.patch.object(pdf, '_pool', None), mock.patch.object(pdf.os, 'cpu_count', return_value=3), \
+                mock.patch.object(pdf, 'ProcessPoolExecutor', return_value=pool) as executor, mock.patch.object(pdf.atexit, 'register'):
+            for _ in range(2):
+                reader = PdfReader(build_booklet('Cuadernillo', '', [self.section(i) for i in range(pdf.PARALLEL_MIN_SECTIONS)], workers=8))
+                self.assertEqual(len(reader.pages), 1 + 2 * pdf.PARALLEL_MIN_SECTIONS)
+
+        # Un solo pool para los dos cuadernillos, acotado por los CPU disponibles.
+        executor.assert_called_once()
+        self.assertEqual(executor.call_args.kwargs['max_workers'], 3)
+        self.assertEqual(pool.map.call_count, 2)
+
+    def test_broken_pool_is_discarded(self):
+        pool = mock.Mock()
+        pool.map.side_effect = BrokenProcessPool()
+        sections = [self.section(i) for i in range(pdf.PARALLEL_MIN_SECTIONS)]
+        with mock.patch.object(pdf, '_pool', pool), mock.patch.object(pdf.os, 'cpu_count', return_value=2):
+            rendered = pdf.render_sections(sections, workers=2)
+
+            self.assertEqual(len(rendered), len(sections))
+            self.assertIsNone(pdf._pool)
+        pool.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+
+
+class MetricsRegistryTests(SimpleTestCase):
+    labels = (('view', 'calendar-list'), ('method', 'GET'))
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = Path(self.directory.name)
+        settings = override_settings(METRICS_DIR=self.directory.name, METRICS_STALE_SECONDS=60)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def worker(self, key, requests, age=0):
+        # Archivo volcado por otro proceso, escrito hace `age` segundos.
+        registry = Registry()
+        registry.inc('http_requests_total', self.labels, requests)
+        registry.observe('http_request_duration_seconds', self.labels, 0.02)
+        with mock.patch('core.metrics.process_key', return_value=key):
+            registry.flush()
+        path = self.path / f'{key}.json'
+        written = time.time() - age
+        os.utime(path, (written, written))
+        return path
+
+    def total(self):
+        counters, histograms = Registry().collect()
+        return counters.get(('http_requests_total', self.labels), 0), sum(
+            histograms.get(('http_request_duration_seconds', self.labels), [0])[:-1]
+        )
+
+    def test_flush_file_is_keyed_by_pid_and_start_time(self):
+        Registry().flush()
+
+        self.assertEqual([path.name for path in self.path.glob('*.json')], [f'{process_key()}.json'])
+        self.assertTrue(process_key().startswith(f'{os.getpid()}-'))
+
+    def test_dead_processes_are_folded_and_totals_never_decrease(self):
+        self.worker('999999999-1', 3, age=120)
+        self.worker('999999998-1', 2)
+        self.assertEqual(self.total(), (5, 2))
+        self.assertFalse((self.path / '999999999-1.json').exists())
+        self.assertTrue((self.path / MERGED_FILE).exists())
+
+        # Un pid reutilizado con otro inicio es otro archivo; el del proceso anterior se suma.
+        self.worker('999999998-1', 2, age=120)
+        self.worker('999999998-2', 4)
+        self.assertEqual(self.total(), (9, 3))
+        self.assertEqual(self.total(), (9, 3))
+        self.assertEqual(sorted(path.name for path in self.path.glob('*.json')), ['999999998-2.json', MERGED_FILE])
+
+    def test_stale_file_of_live_process_is_not_folded(self):
+        parent = f'{os.getppid()}-{_start_time(os.getppid())}'
+        path = self.worker(parent, 4, age=120)
+
+        self.assertEqual(self.total(), (4, 1))
+        self.assertTrue(path.exists())
+
+    def test_interrupted_fold_is_not_counted_twice(self):
+        # Se cortó entre escribir merged.json y borrar el archivo del proceso muerto.
+        path = self.worker('999999999-1', 3, age=120)
+        Registry().fold(self.path, [path])
+        self.worker('999999999-1', 3, age=120)
+
+        self.assertEqual(self.total(), (3, 1))
+        self.assertFalse(path.exists())
+
+
+
+class BenchmarkTests(SimpleTestCase):
+    def test_percentile(self):
+        values = list(range(100, 0, -1))
+
+        self.assertEqual(percentile([], 0.5), 0.0)
+        self.assertEqual(percentile([7], 0.99), 7)
+        self.assertEqual([percentile(values, p) for p in (0, 0.5, 0.95, 1)], [1, 51, 95, 100])
+
+    def test_compare_results(self):
+        baseline = {'operations': {
+            'retrieve': {'p50_ms': 10.0, 'p95_ms': 0.5, 'queries': 5, 'peak_kib': 100.0},
+            'export_pdf': {'p50_ms': 10.0},
+        }}
+        current = {'operations': {
+            # p50 dentro del 25 %; p95 sube más del 25 % pero menos que el margen absoluto.
+            'retrieve': {'p50_ms': 12.5, 'p95_ms': 2.4, 'queries': 5, 'peak_kib': 163.0},
+            'export_pdf': {'p50_ms': 9.0, 'queries': 50},
+            'save_version': {'p50_ms': 99.0},
+        }}
+        self.assertEqual(compare_results(current, baseline), [])
+
+        current['operations']['retrieve'].update(p50_ms=12.6, queries=6)
+        regressions = compare_results(current, baseline)
+
+        self.assertEqual(regressions, [
+            {'operation': 'retrieve', 'metric': 'p50_ms', 'baseline': 10.0, 'current': 12.6},
+            {'operation': 'retrieve', 'metric': 'queries', 'baseline': 5, 'current': 6},
+        ])
+        self.assertEqual(compare_results(current, baseline, tolerance=0.5), regressions[1:])
+
+
+@override_settings(**TEST_SETTINGS)
+class SeedScaleTests(TestCase):
+    options = {
+        'subjects': 12, 'calendars_per_period': 2, 'year': 2030, 'rules_per_calendar': 3,
+        'global_rules': 2, 'blocked_days': 1, 'fill': 0.5, 'versions': 4, 'seed': 3,
+    }
+
+    def seed(self, **options):
+        call_command('seed_scale', **self.options, **options, stdout=StringIO())
+        return sorted(ExamEvent.objects.values_list('calendar__name', 'subject__code', 'date'))
+
+    def test_generates_reproducible_data(self):
+        events = self.seed()
+
+        # 4 periodos x 2 calendarios, cada uno con la mitad de sus 6 materias ubicadas.
+        self.assertEqual(ExamCalendar.objects.count(), 8)
+        self.assertEqual(Subject.objects.count(), 12)
+        self.assertEqual(len(events), 24)
+        self.assertEqual(Rule.objects.filter(global_rule=False).count(), 8 * (2 + 3))
+        self.assertEqual(Rule.objects.filter(global_rule=True).count(), 2)
+        self.assertEqual(CalendarBlockedDay.objects.count(), 8)
+        self.assertEqual(CalendarVersion.objects.count(), 4)
+
+        self.assertEqual(self.seed(clear=True), events)
+        self.assertEqual(ExamCalendar.objects.count(), 8)
+
+    def test_benchmark_runs_on_seeded_data(self):
+        self.seed()
+        calendar = ExamCalendar.objects.order_by('id').first()
+        before = sorted(calendar.events.values_list('subject_id', 'date'))
+        versions = CalendarVersion.objects.count()
+
+        results = run_benchmark(
+            calendar, User.objects.get(), ['validate_assignment', 'assign_event', 'retrieve'], iterations=2, warmup=0,
+        )
+
+        self.assertEqual(list(results['operations']), ['validate_assignment', 'assign_event', 'retrieve'])
+        self.assertTrue(all(metrics['iterations'] == 2 and metrics['queries'] > 0 for metrics in results['operations'].values()))
+        self.assertEqual(results['dataset']['events'], 3)
+        # Al terminar el calendario vuelve a su estado y no quedan versiones nuevas.
+        self.assertEqual(sorted(calendar.events.values_list('subject_id', 'date')), before)
+        self.assertEqual(CalendarVersion.objects.count(), versions)
@@ -0,0 +1,354 @@
+from collections import OrderedDict
+from heapq import merge
+from itertools import groupby
+import json
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .constraints import CalendarContext, parse_date
+from .models import CalendarBlockedDay, CalendarVersion, ExamCalendar, ExamEvent, Subject
+from .realtime import publish
+from .revisions import calendar_write
+from .rule_index import bump_rule_index, rule_index
+from .services import build_snapshot
+
+
+def compute_delta(parent, snapshot):
+    # Ambos snapshots vienen ordenados (eventos por materia, feriados por fecha).
+    parent_events = {e['subject_id']: e['date'] for e in parent.get('events', [])}
+    events = {e['subject_id']: e['date'] for e in snapshot.get('events', [])}
+    parent_blocked = {b['date']: b.get('reason') for b in parent.get('blocked_days', [])}
+    blocked = {b['date']: b.get('reason') for b in snapshot.get('blocked_days', [])}
+    delta = {
+        'events': {
+            'upsert': [
+                {'subject_id': subject_id, 'date': day}
+                for subject_id, day in events.items() if parent_events.get(subject_id) != day
+            ],
+            'remove': [subject_id for subject_id in parent_events if subject_id not in events],
+        },
+        'blocked_days': {
+            'upsert': [
+                {'date': day, 'reason': reason}
+                for day, reason in blocked.items() if day not in parent_blocked or parent_blocked[day] != reason
+            ],
+            'remove': [day for day in parent_blocked if day not in blocked],
+        },
+    }
+    if parent.get('rules', []) != snapshot.get('rules', []):
+        delta['rules'] = snapshot.get('rules', [])
+    return delta
+
+
+def apply_delta(parent, delta):
+    # No modifica `parent`: los snapshots memoizados se comparten entre llamadas.
+    events = {e['subject_id']: e for e in parent.get('events', [])}
+    for subject_id in delta['events']['remove']:
+        events.pop(subject_id, None)
+    for event in delta['events']['upsert']:
+        events[event['subject_id']] = event
+    blocked = {b['date']: b for b in parent.get('blocked_days', [])}
+    for day in delta['blocked_days']['remove']:
+        blocked.pop(day, None)
+    for blocked_day in delta['blocked_days']['upsert']:
+        blocked[blocked_day['date']] = blocked_day
+    return {
+        'events': [events[subject_id] for subject_id in sorted(events)],
+        'blocked_days': [blocked[day] for day in sorted(blocked)],
+        'rules': delta['rules'] if 'rules' in delta else parent.get('rules', []),
+    }
+
+
+class SnapshotCache:
+    # Memoización LRU de snapshots reconstruidos; las versiones son inmutables.
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, version_id):
+        with self.lock:
+            snapshot = self.items.get(version_id)
+            if snapshot is not None:
+                self.items.move_to_end(version_id)
+            return snapshot
+
+    def set(self, version_id, snapshot):
+        with self.lock:
+            self.items[version_id] = snapshot
+            self.items.move_to_end(version_id)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+    def discard(self, version_id):
+        with self.lock:
+            self.items.pop(version_id, None)
+
+
+snapshot_cache = SnapshotCache(settings.VERSION_SNAPSHOT_CACHE_SIZE)
+
+
+def version_snapshot(version: CalendarVersion):
+    cached = snapshot_cache.get(version.id)
+    if cached is not None:
+        return cached
+    if version.is_keyframe:
+        snapshot_cache.set(version.id, version.snapshot)
+        return version.snapshot
+
+    # Se recorre la cadena hasta el keyframe (o un snapshot ya memoizado) con dos queries.
+    parents = dict(CalendarVersion.objects.filter(calendar_id=version.calendar_id).values_list('id', 'parent_id'))
+    chain = []
+    base = None
+    current = version.id
+    while current is not None:
+        base = snapshot_cache.get(current)
+        if base is not None:
+            break
+        chain.append(current)
+        current = parents.get(current)
+    rows = CalendarVersion.objects.in_bulk(chain)
+    chain.reverse()
+    for version_id in chain:
+        row = rows[version_id]
+        if row.is_keyframe:
+            base = row.snapshot
+        else:
+            base = apply_delta(base, row.delta)
+        snapshot_cache.set(version_id, base)
+    return base
+
+
+def create_version(calendar: ExamCalendar, label, user, snapshot=None, parent=None):
+    # Sin snapshot explícito se versiona el estado actual y la nueva versión pasa a ser la cabeza.
+    live = snapshot is None
+    if live:
+        snapshot = build_snapshot(calendar)
+    with transaction.atomic():
+        current = calendar.versions.aggregate(Max('version_number')).get('version_number__max') or 0
+        if parent is None and calendar.head_version_id:
+            parent = calendar.versions.filter(id=calendar.head_version_id).first()
+        if parent is None and current:
+            parent = calendar.versions.filter(version_number=current).first()
+        fields = {'is_keyframe': True, 'depth': 0, 'snapshot': snapshot, 'delta': None}
+        if parent is not None and parent.depth + 1 < settings.VERSION_KEYFRAME_INTERVAL:
+            delta = compute_delta(version_snapshot(parent), snapshot)
+            # Un delta casi tan grande como el snapshot no aporta: se guarda un keyframe.
+            if len(json.dumps(delta)) < len(json.dumps(snapshot)) // 2:
+                fields = {'is_keyframe': False, 'depth': parent.depth + 1, 'snapshot': {}, 'delta': delta}
+        version = CalendarVersion.objects.create(
+            calendar=calendar,
+            version_number=current + 1,
+            label=label,
+            parent=parent,
+            created_by=user,
+            **fields,
+        )
+        if live:
+            set_head(calendar, version)
+        publish(calendar.id, 'versions', [version.id])
+    snapshot_cache.set(version.id, snapshot)
+    return version
+
+
+def delete_version(version: CalendarVersion):
+    version_id = version.id
+    with transaction.atomic():
+        children = list(version.children.all())
+        # Los hijos pasan a ser keyframes para no depender de la versión eliminada.
+        for child in children:
+            child.snapshot = version_snapshot(child)
+            child.is_keyframe = True
+            child.depth = 0
+            child.delta = None
+            child.parent = version.parent
+            child.save(update_fields=['snapshot', 'is_keyframe', 'depth', 'delta', 'parent'])
+        version.delete()
+        publish(version.calendar_id, 'versions', [child.id for child in children], [version_id])
+    snapshot_cache.discard(version_id)
+
+
+def set_head(calendar: ExamCalendar, version: CalendarVersion):
+    calendar.head_version = version
+    ExamCalendar.objects.filter(id=calendar.id).update(head_version=version)
+
+
+def restore_version(calendar: ExamCalendar, version: CalendarVersion, revision=None):
+    # Aplica solo la diferencia entre el estado actual y el snapshot, en una transacción.
+    snapshot = version_snapshot(version)
+    target_events = {e['subject_id']: parse_date(e['date']) for e in snapshot.get('events', [])}
+    subjects = Subject.objects.in_bulk(list(target_events))
+    skipped = sorted(subject_id for subject_id in target_events if subject_id not in subjects)
+    for subject_id in skipped:
+        target_events.pop(subject_id)
+    target_blocked = {
+        parse_date(b['date']): b.get('reason', 'FERIADO/BLOQUEADO') for b in snapshot.get('blocked_days', [])
+    }
+    now = timezone.now()
+
+    with calendar_write(calendar, revision):
+        events = {e.subject_id: e for e in calendar.events.all()}
+        delete_events = [e.id for subject_id, e in events.items() if subject_id not in target_events]
+        update_events = []
+        create_events = []
+        for subject_id, day in target_events.items():
+            event = events.get(subject_id)
+            if event is None:
+                create_events.append(ExamEvent(calendar=calendar, subject_id=subject_id, date=day))
+            elif event.date != day:
+                event.date = day
+                event.updated_at = now
+                update_events.append(event)
+
+        blocked = {b.date: b for b in calendar.blocked_days.all()}
+        delete_blocked = [b.id for day, b in blocked.items() if day not in target_blocked]
+        deleted_dates = [day for day in blocked if day not in target_blocked]
+        update_blocked = []
+        create_blocked = []
+        for day, reason in target_blocked.items():
+            blocked_day = blocked.get(day)
+            if blocked_day is None:
+                create_blocked.append(CalendarBlockedDay(calendar=calendar, date=day, reason=reason))
+            elif blocked_day.reason != reason:
+                blocked_day.reason = reason
+                update_blocked.append(blocked_day)
+
+        ExamEvent.objects.filter(id__in=delete_events).delete()
+        ExamEvent.objects.bulk_update(update_events, ['date', 'updated_at'])
+        ExamEvent.objects.bulk_create(create_events)
+        CalendarBlockedDay.objects.filter(id__in=delete_blocked).delete()
+        CalendarBlockedDay.objects.bulk_update(update_blocked, ['reason'])
+        CalendarBlockedDay.objects.bulk_create(create_blocked)
+        # bulk_create/bulk_update no emiten señales: se invalida el índice de reglas a mano.
+        bump_rule_index(calendar.id)
+        set_head(calendar, version)
+        publish(calendar.id, 'events', [e.id for e in update_events + create_events], delete_events)
+        publish(calendar.id, 'blocked_days', [b.id for b in update_blocked + create_blocked], deleted_dates)
+
+    # El estado restaurado se conoce en memoria: se valida sin volver a leer eventos ni feriados.
+    restored = [e for subject_id, e in events.items() if subject_id in target_events] + create_events
+    context = CalendarContext(
+        calendar,
+        [(e.id, e.subject_id, e.date, subjects[e.subject_id].is_heavy, subjects[e.subject_id].semester_group) for e in restored],
+        rule_index(calendar),
+        target_blocked,
+    )
+    return {
+        'detail': 'Versión restaurada',
+        'revision': calendar.revision,
+        'events': {'created': len(create_events), 'updated': len(update_events), 'deleted': len(delete_events)},
+        'blocked_days': {'created': len(create_blocked), 'updated': len(update_blocked), 'deleted': len(delete_blocked)},
+        'skipped_subjects': skipped,
+        'violations': context.validate_events(subjects),
+    }
+
+
+def _tagged(key, index, sequence):
+    for item in sorted(sequence, key=key):
+        yield key(item), index, item
+
+
+def _align(key, *sequences):
+    # Merge-join de listas ordenadas por `key`: produce (clave, [elemento o None por lista]).
+    tagged = [_tagged(key, index, sequence) for index, sequence in enumerate(sequences)]
+    for value, group in groupby(merge(*tagged, key=lambda entry: entry[:2]), key=lambda entry: entry[0]):
+        row = [None] * len(sequences)
+        for _, index, item in group:
+            row[index] = item
+        yield value, row
+
+
+def _event_key(event):
+    return event['subject_id']
+
+
+def _blocked_key(blocked_day):
+    return blocked_day['date']
+
+
+def _rule_key(rule):
+    return rule['id']
+
+
+def diff_snapshots(a, b):
+    events = {'moved': [], 'added': [], 'removed': []}
+    for subject_id, (old, new) in _align(_event_key, a.get('events', []), b.get('events', [])):
+        if old is None:
+            events['added'].append({'subject_id': subject_id, 'date': new['date']})
+        elif new is None:
+            events['removed'].append({'subject_id': subject_id, 'date': old['date']})
+        elif old['date'] != new['date']:
+            events['moved'].append({'subject_id': subject_id, 'from': old['date'], 'to': new['date']})
+
+    blocked_days = {'added': [], 'removed': [], 'changed': []}
+    for day, (old, new) in _align(_blocked_key, a.get('blocked_days', []), b.get('blocked_days', [])):
+        if old is None:
+            blocked_days['added'].append(new)
+        elif new is None:
+            blocked_days['removed'].append(old)
+        elif old.get('reason') != new.get('reason'):
+            blocked_days['changed'].append({'date': day, 'from': old.get('reason'), 'to': new.get('reason')})
+
+    rules = {'added': [], 'removed': [], 'changed': []}
+    for _, (old, new) in _align(_rule_key, a.get('rules', []), b.get('rules', [])):
+        if old is None:
+            rules['added'].append(new)
+        elif new is None:
+            rules['removed'].append(old)
+        elif old != new:
+            rules['changed'].append({'from': old, 'to': new})
+    return {'events': events, 'blocked_days': blocked_days, 'rules': rules}
+
+
+def common_ancestor(a: CalendarVersion, b: CalendarVersion):
+    parents = dict(CalendarVersion.objects.filter(calendar_id=a.calendar_id).values_list('id', 'parent_id'))
+    ancestors = set()
+    current = a.id
+    while current is not None:
+        ancestors.add(current)
+        current = parents.get(current)
+    current = b.id
+    while current is not None:
+        if current in ancestors:
+            return CalendarVersion.objects.get(id=current)
+        current = parents.get(current)
+    return None
+
+
+def _merge_section(kind, key, base, ours, theirs, strategy, conflicts):
+    merged = []
+    for value, (b, o, t) in _align(key, base, ours, theirs):
+        if o == t:
+            chosen = o
+        elif o == b:
+            chosen = t
+        elif t == b:
+            chosen = o
+        else:
+            conflicts.append({'type': kind, 'key': value, 'base': b, 'ours': o, 'theirs': t})
+            chosen = o if strategy == 'ours' else t
+        if chosen is not None:
+            merged.append(chosen)
+    return merged
+
+
+def merge_snapshots(base, ours, theirs, strategy='ours'):
+    # Merge de tres vías: un lado gana si el otro no cambió respecto del ancestro común.
+    conflicts = []
+    merged = {
+        'events': _merge_section(
+            'event', _event_key, base.get('events', []), ours.get('events', []), theirs.get('events', []), strategy, conflicts,
+        ),
+        'blocked_days': _merge_section(
+            'blocked_day', _blocked_key, base.get('blocked_days', []), ours.get('blocked_days', []),
+            theirs.get('blocked_days', []), strategy, conflicts,
+        ),
+        'rules': _merge_section(
+            'rule', _rule_key, base.get('rules', []), ours.get('rules', []), theirs.get('rules', []), strategy, conflicts,
+        ),
+    }
+    return merged, conflicts
@@ -1,27 +1,145 @@
+import gzip
+import re
+
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import Group
-from django.db import IntegrityError
-from django.db.models import Max
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, Q
 from django.db.models.deletion import ProtectedError
-from django.http import FileResponse
+from django.http import FileResponse, Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
 from django.utils.decorators import method_decorator
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date, parse_etags, quote_etag
 from django.views.decorators.csrf import ensure_csrf_cookie
-from rest_framework import permissions, status, viewsets
+from django.views.decorators.http import require_safe
+from rest_framework import mixins, permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .exports import export_excel, export_pdf
-from .models import CalendarBlockedDay, CalendarVersion, ExamCalendar, ExamEvent, Rule, Subject
+from .audit import audit_calendars
+from .constraints import CalendarContext, parse_date, parse_event_id
+from .export_cache import cached_export, export_key
+from .exports import export_excel_many, export_pdf_booklet
+from .feeds import CONTENT_TYPES, published, publish_version, read_feed
+from .imports import ImportFileError, import_xlsx
+from .jobs import JobLimitExceeded, submit_job
+from .load import student_load
+from .metrics import render_metrics
+from .pagination import ListCursorPagination
+from .realtime import publish
+from .revisions import RevisionConflict, calendar_write, changes_since, current_revision
+from .models import CalendarBlockedDay, CalendarVersion, Cohort, ExamCalendar, ExamEvent, Job, Rule, Subject
+from .solver import apply_schedule, auto_schedule
+from .suggest import suggest_repairs
+from .versions import (
+    common_ancestor,
+    create_version,
+    delete_version,
+    diff_snapshots,
+    merge_snapshots,
+    restore_version,
+    version_snapshot,
+)
 from .serializers import (
+    CalendarVersionDetailSerializer,
     CalendarVersionSerializer,
+    CohortSerializer,
     ExamCalendarSerializer,
     ExamEventSerializer,
+    JobSerializer,
     RuleSerializer,
     SubjectSerializer,
     UserSerializer,
 )
-from .services import build_snapshot, validate_exam_assignment
+from .services import apply_bulk_assignment, assign_exam_event, plan_bulk_assignment, validate_exam_assignment
+
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+
+def as_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'si', 'sí')
+    return bool(value)
+
+
+def filter_subjects(params):
+    subjects = Subject.objects.all().order_by('name')
+    if params.get('semester_group'):
+        subjects = subjects.filter(semester_group=params['semester_group'])
+    if params.get('subjects'):
+        ids = params['subjects']
+        if isinstance(ids, str):
+            ids = ids.split(',')
+        subjects = subjects.filter(id__in=[x for x in ids if str(x).strip().isdigit()])
+    return list(subjects)
+
+
+def split_param(value):
+    return [part.strip() for part in (value or '').split(',') if part.strip()]
+
+
+def filter_params(queryset, params, filters):
+    # `filters`: {parámetro: (lookup, conversor)}; los parámetros ausentes se ignoran.
+    for param, (lookup, convert) in filters.items():
+        value = params.get(param)
+        if value in (None, ''):
+            continue
+        try:
+            value = convert(value)
+        except ValueError:
+            raise ValidationError({param: 'Valor inválido.'})
+        queryset = queryset.filter(**{lookup: value})
+    return queryset
+
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get('If-None-Match')
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    return '*' in etags or etag in etags
+
+
+def expected_revision(request):
+    # Revisión que vio el cliente: If-Match: "<revisión>" o `revision` en el cuerpo. Sin
+    # ninguna (o con If-Match: *) la escritura no se condiciona.
+    value = request.data.get('revision') if hasattr(request.data, 'get') else None
+    if request.headers.get('If-Match'):
+        etags = parse_etags(request.headers['If-Match'])
+        if '*' in etags:
+            return None
+        value = etags[0].removeprefix('W/').strip('"') if etags else ''
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValidationError({'revision': 'Valor inválido.'})
+
+
+def revision_headers(calendar):
+    return {'ETag': quote_etag(str(calendar.revision))}
+
+
+def import_response(request, kind, calendar=None):
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({'detail': 'Debe adjuntar un archivo .xlsx en el campo "file".'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        report = import_xlsx(
+            upload, kind, calendar,
+            sheet=request.data.get('sheet') or None,
+            dry_run=as_bool(request.data.get('dry_run', False)),
+            revision=expected_revision(request) if calendar else None,
+        )
+    except ImportFileError as exc:
+        return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(report, headers=revision_headers(calendar) if calendar and 'revision' in report else None)
 
 
 @method_decorator(ensure_csrf_cookie, name='dispatch')
@@ -48,9 +166,59 @@ class MeView(APIView):
         return Response(UserSerializer(request.user).data)
 
 
+def metrics(request):
+    # Vista de Django sin DRF: la consulta Prometheus, no un usuario. Con METRICS_TOKEN exige
+    # "Authorization: Bearer <token>".
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if settings.METRICS_TOKEN and not constant_time_compare(
+        request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}',
+    ):
+        return HttpResponse('No autorizado', status=401, content_type='text/plain; charset=utf-8')
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@require_safe
+def public_feed(request, calendar_id, feed):
+    # Feeds publicados (core/feeds.py), sin autenticación ni ORM: metadatos y archivos
+    # precomprimidos del disco, con caché HTTP y 304.
+    meta = published(calendar_id)
+    info = meta and meta['feeds'].get(feed)
+    if info is None:
+        raise Http404
+    body = read_feed(calendar_id, meta, feed)
+    if body is None:
+        raise Http404
+    compressed = ACCEPTS_GZIP.search(request.headers.get('Accept-Encoding', '')) is not None
+    etag = quote_etag(info['etag'] + ('-gz' if compressed else ''))
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(meta['published_at']),
+        'Cache-Control': f'public, max-age={settings.PUBLIC_FEED_MAX_AGE}',
+        'Vary': 'Accept-Encoding',
+        'Access-Control-Allow-Origin': '*',
+    }
+    response = get_conditional_response(request, etag=etag, last_modified=meta['published_at'])
+    if response is None:
+        response = HttpResponse(body if compressed else gzip.decompress(body), content_type=CONTENT_TYPES[feed.rsplit('.', 1)[1]])
+        if compressed:
+            response['Content-Encoding'] = 'gzip'
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
 class SubjectViewSet(viewsets.ModelViewSet):
     queryset = Subject.objects.all().order_by('name')
     serializer_class = SubjectSerializer
+    pagination_class = ListCursorPagination
+    cursor_ordering = ('name', 'id')
+
+    def get_queryset(self):
+        return filter_params(super().get_queryset(), self.request.query_params, {
+            'semester_group': ('semester_group', str),
+            'is_heavy': ('is_heavy', as_bool),
+        })
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -63,24 +231,226 @@ class SubjectViewSet(viewsets.ModelViewSet):
             )
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_xlsx(self, request):
+        return import_response(request, 'subjects')
+
+
+class CohortViewSet(viewsets.ModelViewSet):
+    queryset = Cohort.objects.prefetch_related('subjects').order_by('name')
+    serializer_class = CohortSerializer
+    pagination_class = ListCursorPagination
+    cursor_ordering = ('name', 'id')
+
+    def get_queryset(self):
+        return filter_params(super().get_queryset(), self.request.query_params, {
+            'subject': ('subjects', int),
+        })
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_xlsx(self, request):
+        return import_response(request, 'cohorts')
+
 
 class RuleViewSet(viewsets.ModelViewSet):
     queryset = Rule.objects.all().order_by('-id')
     serializer_class = RuleSerializer
+    pagination_class = ListCursorPagination
+
+    def get_queryset(self):
+        params = self.request.query_params
+        queryset = filter_params(super().get_queryset(), params, {
+            'calendar': ('calendar_id', int),
+            'rule_type': ('rule_type', str),
+            'enabled': ('enabled', as_bool),
+            'global_rule': ('global_rule', as_bool),
+        })
+        if params.get('for_calendar'):
+            # Reglas que aplican a un calendario: las propias más las globales.
+            if not params['for_calendar'].isdigit():
+                raise ValidationError({'for_calendar': 'Valor inválido.'})
+            queryset = queryset.filter(Q(global_rule=True) | Q(calendar_id=int(params['for_calendar'])))
+        return queryset
+
+    @staticmethod
+    def audience(rule):
+        # Las reglas globales llegan a todos los calendarios abiertos.
+        return None if rule.global_rule else rule.calendar_id
+
+    def perform_create(self, serializer):
+        rule = serializer.save()
+        publish(self.audience(rule), 'rules', [rule.id])
+
+    def perform_update(self, serializer):
+        previous = self.audience(serializer.instance)
+        rule = serializer.save()
+        if previous != self.audience(rule):
+            publish(previous, 'rules', delete=[rule.id])
+        publish(self.audience(rule), 'rules', [rule.id])
+
+    def perform_destroy(self, instance):
+        audience = self.audience(instance)
+        rule_id = instance.id
+        instance.delete()
+        publish(audience, 'rules', delete=[rule_id])
 
 
 class CalendarVersionViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = CalendarVersion.objects.select_related('calendar').all()
+    queryset = CalendarVersion.objects.defer('snapshot', 'delta')
     serializer_class = CalendarVersionSerializer
+    pagination_class = ListCursorPagination
+    cursor_ordering = ('-version_number', '-id')
+
+    def get_queryset(self):
+        if self.action != 'list':
+            return CalendarVersion.objects.all()
+        return filter_params(super().get_queryset(), self.request.query_params, {
+            'calendar': ('calendar_id', int),
+        })
+
+    def get_serializer_class(self):
+        if self.action == 'retrieve':
+            return CalendarVersionDetailSerializer
+        return super().get_serializer_class()
+
+    @staticmethod
+    def other_version(version, other_id):
+        # Otra versión del mismo calendario: 404 si no existe o es de otro calendario.
+        return get_object_or_404(CalendarVersion, id=parse_event_id(other_id), calendar_id=version.calendar_id)
+
+    @action(detail=True, methods=['get'], url_path='diff/(?P<other_id>[^/.]+)')
+    def diff(self, request, pk=None, other_id=None):
+        version = self.get_object()
+        other = self.other_version(version, other_id)
+        data = diff_snapshots(version_snapshot(version), version_snapshot(other))
+        return Response({'from_version': version.id, 'to_version': other.id, **data})
+
+    @action(detail=True, methods=['post'])
+    def publish(self, request, pk=None):
+        # Genera los feeds públicos (JSON e iCalendar) del calendario a partir de esta versión.
+        return Response(publish_version(self.get_object()))
+
+    @action(detail=True, methods=['post'])
+    def merge(self, request, pk=None):
+        ours = self.get_object()
+        if request.data.get('other') in (None, ''):
+            return Response({'detail': 'Falta la versión a combinar ("other").'}, status=status.HTTP_400_BAD_REQUEST)
+        theirs = self.other_version(ours, request.data['other'])
+        strategy = request.data.get('strategy', 'ours')
+        if strategy not in ('ours', 'theirs'):
+            return Response({'detail': 'strategy debe ser "ours" o "theirs".'}, status=status.HTTP_400_BAD_REQUEST)
+        ancestor = common_ancestor(ours, theirs)
+        base = version_snapshot(ancestor) if ancestor else {}
+        merged, conflicts = merge_snapshots(base, version_snapshot(ours), version_snapshot(theirs), strategy)
+        data = {'ancestor': ancestor.id if ancestor else None, 'conflicts': conflicts, 'version': None}
+        if as_bool(request.data.get('dry_run')):
+            data['snapshot'] = merged
+            return Response(data)
+        label = request.data.get('label') or f'Merge v{ours.version_number} + v{theirs.version_number}'
+        version = create_version(ours.calendar, label, request.user, snapshot=merged, parent=ours)
+        data['version'] = CalendarVersionSerializer(version).data
+        return Response(data)
+
+
+class JobViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    pagination_class = ListCursorPagination
+
+    def get_queryset(self):
+        return filter_params(super().get_queryset(), self.request.query_params, {
+            'calendar': ('calendar_id', int),
+            'status': ('status', str),
+        })
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            job = submit_job(data['calendar'], data['kind'], data.get('params'), request.user)
+        except JobLimitExceeded as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        return Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != Job.Status.DONE or not job.result_file:
+            return Response({'detail': 'El trabajo no tiene un archivo disponible.'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            content = open(job.result_file, 'rb')
+        except FileNotFoundError:
+            return Response({'detail': 'El archivo del trabajo ya no está disponible.'}, status=status.HTTP_410_GONE)
+        return FileResponse(content, as_attachment=True, filename=job.result_name)
 
 
 class ExamCalendarViewSet(viewsets.ModelViewSet):
     queryset = ExamCalendar.objects.all().order_by('-created_at')
     serializer_class = ExamCalendarSerializer
+    pagination_class = ListCursorPagination
+    cursor_ordering = ('-created_at', '-id')
+    nested_fields = ('events', 'blocked_days')
+    read_actions = ('list', 'retrieve', 'create', 'update', 'partial_update')
+
+    def serialized_fields(self):
+        # El listado es compacto (sin eventos ni feriados) salvo ?include=events,blocked_days;
+        # ?fields=id,name,... restringe la respuesta en listado y detalle.
+        params = self.request.query_params
+        if self.action not in ('list', 'retrieve'):
+            return None
+        fields = split_param(params.get('fields'))
+        include = [name for name in split_param(params.get('include')) if name in self.nested_fields]
+        if not fields and self.action == 'retrieve':
+            return None
+        if not fields:
+            fields = [name for name in ExamCalendarSerializer().fields if name not in self.nested_fields]
+        return set(fields) | set(include)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in self.read_actions:
+            # Las acciones propias solo usan el calendario; no precargan relaciones.
+            return queryset
+        fields = self.serialized_fields()
+        if fields is None or 'events' in fields:
+            queryset = queryset.prefetch_related(Prefetch('events', queryset=ExamEvent.objects.select_related('subject')))
+        if fields is None or 'blocked_days' in fields:
+            queryset = queryset.prefetch_related('blocked_days')
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.serialized_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, RevisionConflict):
+            # 409 con lo que cambió desde la revisión del cliente, para que lo aplique y reintente.
+            revision = current_revision(exc.calendar.id)
+            return Response(
+                {'detail': str(exc), 'revision': revision, 'changes': changes_since(exc.calendar.id, exc.expected)},
+                status=status.HTTP_409_CONFLICT,
+                headers={'ETag': quote_etag(str(revision))},
+            )
+        return super().handle_exception(exc)
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
+    def perform_update(self, serializer):
+        with calendar_write(serializer.instance, expected_revision(self.request)):
+            serializer.save()
+
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        instance = self.get_object()
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        # Se relee con las precargas: serializar sobre la instancia recién guardada
+        # consultaría la materia de cada evento por separado.
+        return Response(self.get_serializer(self.get_queryset().get(pk=instance.pk)).data, headers=revision_headers(instance))
+
     @action(detail=True, methods=['post'])
     def validate_assignment(self, request, pk=None):
         calendar = self.get_object()
@@ -88,94 +458,215 @@ class ExamCalendarViewSet(viewsets.ModelViewSet):
         result = validate_exam_assignment(calendar, subject, request.data['date'], request.data.get('event_id'))
         return Response(result)
 
+    @action(detail=True, methods=['post'])
+    def suggest(self, request, pk=None):
+        # Alternativas para una asignación rechazada: fechas libres y cadenas de movimientos.
+        calendar = self.get_object()
+        subject = Subject.objects.filter(id=parse_event_id(request.data.get('subject'))).first()
+        try:
+            target_date = parse_date(str(request.data.get('date', '')))
+            limit = min(int(request.data.get('limit', 5)), 20)
+            max_moves = min(int(request.data.get('max_moves', settings.SUGGEST_MAX_MOVES)), 4)
+        except (TypeError, ValueError):
+            target_date = limit = max_moves = None
+        if subject is None or target_date is None or limit < 1 or max_moves < 1:
+            return Response({'detail': 'Materia, fecha, limit o max_moves inválidos.'}, status=status.HTTP_400_BAD_REQUEST)
+        data = suggest_repairs(calendar, subject, target_date, limit, max_moves, settings.SUGGEST_TIME_BUDGET)
+        return Response({**data, 'revision': calendar.revision}, headers=revision_headers(calendar))
+
+    @action(detail=True, methods=['get'])
+    def feasibility_matrix(self, request, pk=None):
+        calendar = self.get_object()
+        subjects = filter_subjects(request.query_params)
+        context = CalendarContext.load(calendar)
+        etag = quote_etag(context.fingerprint(subjects))
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        data = context.feasibility_matrix(subjects, calendar.start_date, calendar.end_date)
+        return Response(data, headers={'ETag': etag})
+
+    @action(detail=True, methods=['get'])
+    def audit(self, request, pk=None):
+        # Revalida todos los eventos ya ubicados contra las reglas y feriados actuales.
+        report = audit_calendars([self.get_object()])
+        return Response({**report['calendars'][0], 'elapsed_ms': report['elapsed_ms']})
+
+    @action(detail=True, methods=['get'])
+    def student_load(self, request, pk=None):
+        # Carga por cohorte en todos los calendarios que se solapan con este.
+        calendar = self.get_object()
+        params = request.query_params
+        try:
+            window = int(params.get('window', 2))
+            max_exams = int(params.get('max_exams', 2))
+            max_heavy = int(params.get('max_heavy', 1))
+        except ValueError:
+            return Response({'detail': 'window, max_exams y max_heavy deben ser enteros.'}, status=status.HTTP_400_BAD_REQUEST)
+        if window < 1:
+            return Response({'detail': 'window debe ser al menos 1 día.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(student_load(calendar, window=window, max_exams=max_exams, max_heavy=max_heavy))
+
+    @action(detail=True, methods=['post'])
+    def auto_schedule(self, request, pk=None):
+        calendar = self.get_object()
+        try:
+            time_budget = float(request.data.get('time_budget', settings.SOLVER_TIME_BUDGET))
+            seed = int(request.data.get('seed', 0))
+        except (TypeError, ValueError):
+            return Response({'detail': 'time_budget y seed deben ser numéricos.'}, status=status.HTTP_400_BAD_REQUEST)
+        # Sin If-Match se exige la revisión con la que empezó el solver.
+        revision = expected_revision(request)
+        revision = calendar.revision if revision is None else revision
+        result = auto_schedule(
+            calendar,
+            filter_subjects(request.data),
+            keep_existing=as_bool(request.data.get('keep_existing', True)),
+            seed=seed,
+            time_budget=max(0.1, min(time_budget, settings.SOLVER_MAX_TIME_BUDGET)),
+        )
+        if not as_bool(request.data.get('apply')):
+            result['applied'] = None
+            return Response(result)
+        result['applied'] = apply_schedule(calendar, result['assignments'], revision, result['unplaced'])
+        return Response(result, headers=revision_headers(calendar))
+
     @action(detail=True, methods=['post'])
     def assign_event(self, request, pk=None):
         calendar = self.get_object()
         subject = Subject.objects.get(id=request.data['subject'])
-        target_date = request.data['date']
-        event = None
-        if request.data.get('event_id'):
-            event = ExamEvent.objects.get(id=request.data['event_id'], calendar=calendar)
-            result = validate_exam_assignment(calendar, subject, target_date, event.id)
-        else:
-            result = validate_exam_assignment(calendar, subject, target_date)
-
-        if not result['is_valid']:
+        event, result = assign_exam_event(
+            calendar, subject, request.data['date'], request.data.get('event_id') or None, expected_revision(request),
+        )
+        if event is None:
             return Response(result, status=status.HTTP_400_BAD_REQUEST)
-
-        if event:
-            event.date = target_date
-            event.save()
-        else:
-            event, _ = ExamEvent.objects.update_or_create(calendar=calendar, subject=subject, defaults={'date': target_date})
         data = ExamEventSerializer(event).data
         data['warning'] = result if result['severity'] == 'soft' else None
-        return Response(data)
+        data['revision'] = calendar.revision
+        return Response(data, headers=revision_headers(calendar))
+
+    @action(detail=True, methods=['post'])
+    def assign_events_bulk(self, request, pk=None):
+        calendar = self.get_object()
+        moves = request.data.get('moves')
+        if not isinstance(moves, list) or not moves:
+            return Response({'detail': 'Se espera una lista "moves" no vacía.'}, status=status.HTTP_400_BAD_REQUEST)
+        # Validación y escritura en la misma transacción corta (ver core/revisions.py).
+        with calendar_write(calendar, expected_revision(request)):
+            results = plan_bulk_assignment(calendar, [m if isinstance(m, dict) else {} for m in moves])
+            has_hard = any(not item['is_valid'] for item in results)
+            has_soft = any(item['severity'] == 'soft' for item in results)
+            data = {'committed': False, 'applied': None, 'results': results}
+            if has_hard:
+                response_status = status.HTTP_400_BAD_REQUEST
+            elif has_soft and not as_bool(request.data.get('allow_warnings')):
+                response_status = status.HTTP_409_CONFLICT
+            else:
+                response_status = status.HTTP_200_OK
+            if response_status != status.HTTP_200_OK or as_bool(request.data.get('dry_run')):
+                transaction.set_rollback(True)
+            else:
+                data['applied'] = apply_bulk_assignment(calendar, results)
+                data['committed'] = True
+        data['revision'] = calendar.revision
+        return Response(data, status=response_status, headers=revision_headers(calendar))
 
     @action(detail=True, methods=['post'])
     def toggle_blocked_day(self, request, pk=None):
         calendar = self.get_object()
         date = request.data['date']
-        blocked, created = CalendarBlockedDay.objects.get_or_create(calendar=calendar, date=date)
-        if not created:
-            blocked.delete()
-            return Response({'blocked': False})
-        return Response({'blocked': True})
+        with calendar_write(calendar, expected_revision(request)):
+            blocked, created = CalendarBlockedDay.objects.get_or_create(calendar=calendar, date=date)
+            if not created:
+                blocked.delete()
+                publish(calendar.id, 'blocked_days', delete=[blocked.date])
+            else:
+                publish(calendar.id, 'blocked_days', [blocked.id])
+        return Response({'blocked': created, 'revision': calendar.revision}, headers=revision_headers(calendar))
 
     @action(detail=True, methods=['delete'], url_path='events/(?P<event_id>[^/.]+)')
     def remove_event(self, request, pk=None, event_id=None):
-        event = ExamEvent.objects.get(id=event_id, calendar_id=pk)
-        event.delete()
-        return Response(status=204)
+        calendar = self.get_object()
+        with calendar_write(calendar, expected_revision(request)):
+            ExamEvent.objects.get(id=event_id, calendar=calendar).delete()
+            publish(calendar.id, 'events', delete=[int(event_id)])
+        return Response(status=204, headers=revision_headers(calendar))
 
     @action(detail=True, methods=['post'])
     def save_version(self, request, pk=None):
         calendar = self.get_object()
-        current = calendar.versions.aggregate(Max('version_number')).get('version_number__max') or 0
-        version = CalendarVersion.objects.create(
-            calendar=calendar,
-            version_number=current + 1,
-            label=request.data.get('label', ''),
-            snapshot=build_snapshot(calendar),
-            created_by=request.user,
-        )
+        version = create_version(calendar, request.data.get('label', ''), request.user)
         return Response(CalendarVersionSerializer(version).data)
 
     @action(detail=True, methods=['post'], url_path='restore_version/(?P<version_id>[^/.]+)')
     def restore_version(self, request, pk=None, version_id=None):
         calendar = self.get_object()
         version = CalendarVersion.objects.get(id=version_id, calendar=calendar)
-        snapshot = version.snapshot
-        calendar.events.all().delete()
-        calendar.blocked_days.all().delete()
-        for b in snapshot.get('blocked_days', []):
-            CalendarBlockedDay.objects.create(calendar=calendar, date=b['date'], reason=b.get('reason', 'FERIADO/BLOQUEADO'))
-        for e in snapshot.get('events', []):
-            ExamEvent.objects.create(calendar=calendar, subject_id=e['subject_id'], date=e['date'])
-        return Response({'detail': 'Versión restaurada'})
+        return Response(restore_version(calendar, version, expected_revision(request)), headers=revision_headers(calendar))
 
     @action(detail=True, methods=['delete'], url_path='versions/(?P<version_id>[^/.]+)')
     def delete_version(self, request, pk=None, version_id=None):
         calendar = self.get_object()
         version = CalendarVersion.objects.get(id=version_id, calendar=calendar)
-        version.delete()
+        delete_version(version)
         return Response(status=204)
 
-    @action(detail=True, methods=['get'], url_path='export/excel')
-    def export_excel_action(self, request, pk=None):
+    @action(detail=True, methods=['post'], url_path='import/(?P<kind>blocked_days|events)')
+    def import_xlsx(self, request, pk=None, kind=None):
+        return import_response(request, kind, self.get_object())
+
+    def _export_response(self, request, fmt):
         calendar = self.get_object()
         version_id = request.query_params.get('version_id')
-        snapshot = CalendarVersion.objects.get(id=version_id, calendar=calendar).snapshot if version_id else None
-        content = export_excel(calendar, snapshot)
-        return FileResponse(content, as_attachment=True, filename=f'{calendar.name}.xlsx')
+        snapshot = version_snapshot(CalendarVersion.objects.get(id=version_id, calendar=calendar)) if version_id else None
+        # La clave sale del contenido: un 304 no necesita abrir ni generar el archivo.
+        key = export_key(calendar, snapshot, fmt)
+        etag = quote_etag(key)
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        content, _ = cached_export(calendar, snapshot, fmt, key)
+        response = FileResponse(content, as_attachment=True, filename=f'{calendar.name}.{fmt}')
+        response['ETag'] = etag
+        return response
+
+    @action(detail=True, methods=['get'], url_path='export/excel')
+    def export_excel_action(self, request, pk=None):
+        return self._export_response(request, 'xlsx')
 
     @action(detail=True, methods=['get'], url_path='export/pdf')
     def export_pdf_action(self, request, pk=None):
-        calendar = self.get_object()
-        version_id = request.query_params.get('version_id')
-        snapshot = CalendarVersion.objects.get(id=version_id, calendar=calendar).snapshot if version_id else None
-        content = export_pdf(calendar, snapshot)
-        return FileResponse(content, as_attachment=True, filename=f'{calendar.name}.pdf')
+        return self._export_response(request, 'pdf')
+
+    def _period_calendars(self, request):
+        return filter_params(ExamCalendar.objects.order_by('start_date', 'id'), request.query_params, {
+            'year': ('start_date__year', int),
+            'period_type': ('period_type', str),
+        })
+
+    def _period_export(self, request, fmt):
+        # Todos los calendarios de un año y/o periodo en un único archivo.
+        calendars = self._period_calendars(request)
+        if not calendars.exists():
+            return Response({'detail': 'No hay calendarios para los filtros indicados.'}, status=status.HTTP_404_NOT_FOUND)
+        parts = [part for part in (request.query_params.get('period_type'), request.query_params.get('year')) if part]
+        filename = '-'.join(['calendarios', *parts])
+        if fmt == 'pdf':
+            content = export_pdf_booklet(calendars.iterator(), subtitle=' '.join(parts) or 'Todos los calendarios')
+        else:
+            content = export_excel_many(calendars.iterator())
+        return FileResponse(content, as_attachment=True, filename=f'{filename}.{fmt}')
+
+    @action(detail=False, methods=['get'], url_path='export/excel')
+    def export_period_excel(self, request):
+        return self._period_export(request, 'xlsx')
+
+    @action(detail=False, methods=['get'], url_path='export/pdf')
+    def export_period_pdf(self, request):
+        return self._period_export(request, 'pdf')
+
+    @action(detail=False, methods=['get'], url_path='audit')
+    def audit_period(self, request):
+        # Auditoría de todos los calendarios de un año y/o periodo (?year=, ?period_type=).
+        return Response(audit_calendars(self._period_calendars(request)))
 
 
 def ensure_roles():
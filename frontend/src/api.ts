@@ -7,3 +7,20 @@ export const api = axios.create({
   xsrfHeaderName: 'X-CSRFToken',
   withXSRFToken: true,
 })
+
+// URL de WebSocket en el mismo servidor que la API (http -> ws, sin /api).
+export const socketUrl = (path: string) => String(api.defaults.baseURL).replace(/^http/, 'ws').replace(/\/api$/, '') + path
+
+// Recorre todas las páginas (paginación por cursor) de un listado.
+export async function fetchAll<T = any>(url: string, params: Record<string, any> = {}): Promise<T[]> {
+  const items: T[] = []
+  let next: string | null = url
+  let query: Record<string, any> | undefined = { page_size: 1000, ...params }
+  while (next) {
+    const res: { data: { results: T[]; next: string | null } } = await api.get(next, { params: query })
+    items.push(...res.data.results)
+    next = res.data.next
+    query = undefined
+  }
+  return items
+}
@@ -5,7 +5,7 @@ import dayGridPlugin from '@fullcalendar/daygrid'
 import interactionPlugin, { Draggable } from '@fullcalendar/interaction'
 import esLocale from '@fullcalendar/core/locales/es'
 import toast from 'react-hot-toast'
-import { api } from '../api'
+import { api, fetchAll, socketUrl } from '../api'
 
 const colorByGroup: Record<string, string> = {
   SEM2: '#1f77b4',
@@ -30,6 +30,16 @@ const weekdayLabelsES: Record<string, string> = {
   Sunday: 'Domingo',
 }
 const weekdayLabel = (value: string) => weekdayLabelsES[value] || value
+
+// Aplica un cambio en vivo sobre una lista: quita `remove` y reemplaza/agrega `upsert` por clave.
+const mergeBy = (items: any[] = [], upsert: any[] = [], remove: any[] = [], key = 'id') => {
+  const removed = new Set(remove.map(String))
+  const byKey = new Map(items.filter(item => !removed.has(String(item[key]))).map(item => [String(item[key]), item]))
+  for (const item of upsert) byKey.set(String(item[key]), item)
+  return Array.from(byKey.values())
+}
+// Reglas entre dos materias (usan Materia B).
+const pairRuleTypes = ['SAME_DAY', 'PREFER_SAME_DAY', 'FORBID_SAME_DAY', 'MIN_GAP_DAYS']
 const toIsoDate = (d: Date) => {
   const y = d.getFullYear()
   const m = String(d.getMonth() + 1).padStart(2, '0')
@@ -49,6 +59,8 @@ export function CalendarPage() {
   const [subjects, setSubjects] = useState<any[]>([])
   const [rules, setRules] = useState<any[]>([])
   const [versions, setVersions] = useState<any[]>([])
+  // Alternativas para la última asignación rechazada (fechas libres y cadenas de movimientos).
+  const [suggestions, setSuggestions] = useState<any>(null)
   const [filters, setFilters] = useState<Record<string, string>>({ SEM2: '', SEM4: '', EXTRA: '' })
   const [newRule, setNewRule] = useState({
     rule_type: 'PREFER_SAME_DAY',
@@ -56,21 +68,119 @@ export function CalendarPage() {
     subject_a: '',
     subject_b: '',
     weekday: 'Friday',
+    dates: '',
+    min_days: '2',
+    max_exams: '2',
+    group: '',
   })
   const containerRef = useRef<HTMLDivElement>(null)
   const calendarRef = useRef<HTMLDivElement>(null)
   const draggableRef = useRef<Draggable | null>(null)
   const pendingAssignRef = useRef<Set<string>>(new Set())
+  // Cambios en vivo (WebSocket): conexión activa, último cambio recibido y cambios que
+  // llegaron durante una recarga (se reaplican sobre los datos nuevos).
+  const liveRef = useRef(false)
+  const lastChangeRef = useRef<number | null>(null)
+  const loadingRef = useRef(0)
+  const pendingChangesRef = useRef<any[]>([])
+  // Revisión del calendario que refleja la vista: se envía en If-Match en cada escritura.
+  const revisionRef = useRef<number | null>(null)
+
+  const trackRevision = (revision: any) => {
+    const value = Number(String(revision ?? '').replace(/^W\//, '').replace(/"/g, ''))
+    if (revision !== null && revision !== undefined && !Number.isNaN(value)) {
+      revisionRef.current = Math.max(revisionRef.current ?? 0, value)
+    }
+  }
+
+  const applyChange = (change: any) => {
+    trackRevision(change.revision)
+    if (change.kind === 'events') {
+      setCalendar((c: any) => c && { ...c, events: mergeBy(c.events, change.upsert, change.delete) })
+    } else if (change.kind === 'blocked_days') {
+      setCalendar((c: any) => c && { ...c, blocked_days: mergeBy(c.blocked_days, change.upsert, change.delete, 'date') })
+    } else if (change.kind === 'rules') {
+      setRules(r => mergeBy(r, change.upsert, change.delete).sort((a, b) => b.id - a.id))
+    } else if (change.kind === 'versions') {
+      setVersions(v => mergeBy(v, change.upsert, change.delete).sort((a, b) => b.version_number - a.version_number))
+    } else if (change.kind === 'reload') {
+      load()
+    }
+  }
 
   const load = async () => {
-    const [c, s, r, v] = await Promise.all([api.get(`/calendars/${id}/`), api.get('/subjects/'), api.get('/rules/'), api.get('/versions/')])
-    setCalendar(c.data)
-    setSubjects(s.data)
-    setRules(r.data.filter((x: any)=>x.calendar === Number(id) || x.global_rule))
-    setVersions(v.data.filter((x: any)=>x.calendar === Number(id)))
+    loadingRef.current += 1
+    try {
+      const [c, s, r, v] = await Promise.all([
+        api.get(`/calendars/${id}/`),
+        fetchAll('/subjects/'),
+        fetchAll('/rules/', { for_calendar: id }),
+        fetchAll('/versions/', { calendar: id }),
+      ])
+      revisionRef.current = c.data.revision
+      setCalendar(c.data)
+      setSubjects(s)
+      setRules(r)
+      setVersions(v)
+    } finally {
+      loadingRef.current -= 1
+      if (!loadingRef.current) pendingChangesRef.current.splice(0).forEach(applyChange)
+    }
+  }
+
+  // Con la conexión en vivo activa, los cambios propios llegan por el WebSocket.
+  const refresh = () => (liveRef.current ? Promise.resolve() : load())
+
+  // Escritura condicionada a la revisión. Si otro editor cambió el calendario (409), se aplica
+  // el delta recibido (o se recarga si no está completo) y devuelve null.
+  const write = async (request: (headers: Record<string, string>) => Promise<any>) => {
+    const headers: Record<string, string> = revisionRef.current === null ? {} : { 'If-Match': `"${revisionRef.current}"` }
+    try {
+      const res = await request(headers)
+      trackRevision(res.headers?.etag)
+      return res
+    } catch (e: any) {
+      const data = e.response?.data
+      if (e.response?.status !== 409 || !data || !('changes' in data)) throw e
+      if (data.changes) data.changes.forEach(applyChange)
+      else await load()
+      trackRevision(data.revision)
+      toast.error('Otro editor modificó el calendario; se actualizó la vista. Revisá y volvé a intentar.')
+      return null
+    }
   }
 
   useEffect(() => { load() }, [id])
+  useEffect(() => {
+    let socket: WebSocket | null = null
+    let closed = false
+    let retry: number | undefined
+    lastChangeRef.current = null
+    const connect = () => {
+      const after = lastChangeRef.current
+      socket = new WebSocket(socketUrl(`/ws/calendars/${id}/${after !== null ? `?after=${after}` : ''}`))
+      socket.onmessage = (msg) => {
+        const change = JSON.parse(msg.data)
+        lastChangeRef.current = Math.max(lastChangeRef.current ?? 0, change.id)
+        if (change.kind === 'hello') {
+          liveRef.current = true
+          return
+        }
+        if (loadingRef.current) pendingChangesRef.current.push(change)
+        applyChange(change)
+      }
+      socket.onclose = () => {
+        liveRef.current = false
+        if (!closed) retry = window.setTimeout(connect, 3000)
+      }
+    }
+    connect()
+    return () => {
+      closed = true
+      window.clearTimeout(retry)
+      socket?.close()
+    }
+  }, [id])
   useEffect(() => {
     if (!calendar || !containerRef.current || draggableRef.current) return
     draggableRef.current = new Draggable(containerRef.current, {
@@ -141,40 +251,73 @@ export function CalendarPage() {
     if (pendingAssignRef.current.has(requestKey)) return true
     pendingAssignRef.current.add(requestKey)
     try {
-      const res = await api.post(`/calendars/${id}/assign_event/`, { subject, date, event_id: eventId })
+      const res = await write(headers => api.post(`/calendars/${id}/assign_event/`, { subject, date, event_id: eventId }, { headers }))
+      if (!res) return false
       if (res.data.warning) toast(res.data.warning.message, { icon: '⚠️' })
       else toast.success('Asignación guardada')
-      await load()
+      await refresh()
       return true
     } catch (e: any) {
       toast.error(e.response?.data?.message || 'No se pudo asignar')
+      if (e.response?.status === 400) suggest(subject, date)
       return false
     } finally {
       pendingAssignRef.current.delete(requestKey)
     }
   }
 
+  const suggest = async (subject: number, date: string) => {
+    try {
+      const res = await api.post(`/calendars/${id}/suggest/`, { subject, date })
+      setSuggestions(res.data.dates.length || res.data.chains.length ? res.data : null)
+    } catch {
+      setSuggestions(null)
+    }
+  }
+
+  // Una sugerencia se aplica entera con assign_events_bulk: se valida y escribe junta.
+  const applySuggestion = async (moves: any[]) => {
+    try {
+      const body = { moves: moves.map(m => ({ subject: m.subject, date: m.to, event_id: m.event_id })), allow_warnings: true }
+      const res = await write(headers => api.post(`/calendars/${id}/assign_events_bulk/`, body, { headers }))
+      if (!res) return
+      setSuggestions(null)
+      toast.success('Sugerencia aplicada')
+      await refresh()
+    } catch (e: any) {
+      toast.error(e.response?.data?.results?.find((r: any) => !r.is_valid)?.message || 'No se pudo aplicar la sugerencia')
+    }
+  }
+
   const createRule = async () => {
-    if (newRule.rule_type === 'SUBJECT_ONLY_WEEKDAYS' && !newRule.subject_a) {
-      toast.error('Seleccioná una materia para la restricción de día único.')
+    const singleSubject = ['SUBJECT_ONLY_WEEKDAYS', 'SUBJECT_ONLY_FIXED_DATES'].includes(newRule.rule_type)
+    if (singleSubject && !newRule.subject_a) {
+      toast.error('Seleccioná una materia para la restricción.')
+      return
+    }
+    const paramsByType: Record<string, any> = {
+      SUBJECT_ONLY_WEEKDAYS: { allowed_weekdays: [newRule.weekday] },
+      SUBJECT_ONLY_FIXED_DATES: { allowed_dates: newRule.dates.split(',').map(d => d.trim()).filter(Boolean) },
+      MIN_GAP_DAYS: { min_days: Number(newRule.min_days) },
+      MAX_EXAMS_PER_DAY_GROUP: { max_exams: Number(newRule.max_exams), ...(newRule.group ? { semester_group: newRule.group } : {}) },
+    }
+    try {
+      await api.post('/rules/', {
+        rule_type: newRule.rule_type,
+        severity: newRule.severity,
+        calendar: Number(id),
+        subject_a: newRule.subject_a || null,
+        subject_b: pairRuleTypes.includes(newRule.rule_type) ? (newRule.subject_b || null) : null,
+        params: paramsByType[newRule.rule_type] || {},
+        enabled: true,
+        global_rule: false,
+      })
+    } catch (e: any) {
+      toast.error(e.response?.data?.non_field_errors?.[0] || 'No se pudo crear la regla')
       return
     }
-    const params =
-      newRule.rule_type === 'SUBJECT_ONLY_WEEKDAYS'
-        ? { allowed_weekdays: [newRule.weekday] }
-        : {}
-    await api.post('/rules/', {
-      rule_type: newRule.rule_type,
-      severity: newRule.severity,
-      calendar: Number(id),
-      subject_a: newRule.subject_a || null,
-      subject_b: newRule.rule_type === 'SUBJECT_ONLY_WEEKDAYS' ? null : (newRule.subject_b || null),
-      params,
-      enabled: true,
-      global_rule: false,
-    })
     toast.success('Regla creada')
-    load()
+    refresh()
   }
 
   const deleteRule = async (rule: any) => {
@@ -182,7 +325,7 @@ export function CalendarPage() {
     if (!window.confirm(`¿Eliminar esta restricción ${target}?`)) return
     await api.delete(`/rules/${rule.id}/`)
     toast.success('Restricción eliminada')
-    await load()
+    await refresh()
   }
 
   const severityLabel = (severity: string) => (severity === 'HARD' ? 'fuerte' : 'suave')
@@ -201,6 +344,20 @@ export function CalendarPage() {
     if (rule.rule_type === 'HEAVY_NOT_SAME_DAY') {
       return `Las materias pesadas en la misma fecha o con 1 día de diferencia generan advertencia${suffix}`
     }
+    if (rule.rule_type === 'FORBID_SAME_DAY') {
+      return `${a} no se puede rendir el mismo día que ${b} (${severityLabel(rule.severity)})${suffix}`
+    }
+    if (rule.rule_type === 'MIN_GAP_DAYS') {
+      return `${a} y ${b} con al menos ${rule.params?.min_days} días de separación (${severityLabel(rule.severity)})${suffix}`
+    }
+    if (rule.rule_type === 'MAX_EXAMS_PER_DAY_GROUP') {
+      const group = rule.params?.semester_group ? `del grupo ${rule.params.semester_group}` : 'por grupo'
+      return `Máximo ${rule.params?.max_exams} exámenes por día ${group} (${severityLabel(rule.severity)})${suffix}`
+    }
+    if (rule.rule_type === 'SUBJECT_ONLY_FIXED_DATES') {
+      const dates = Array.isArray(rule.params?.allowed_dates) ? rule.params.allowed_dates.join(', ') : 'fechas fijas'
+      return `${a} solo puede rendirse el ${dates} (${severityLabel(rule.severity)})${suffix}`
+    }
     if (rule.rule_type === 'SUBJECT_ONLY_WEEKDAYS') {
       const days = Array.isArray(rule.params?.allowed_weekdays) ? rule.params.allowed_weekdays : []
       const label = days.length ? days.map((d: string) => weekdayLabel(d)).join(', ') : 'día específico'
@@ -216,10 +373,15 @@ export function CalendarPage() {
     <div className='main'>
       <div className='toolbar'>
         <button onClick={()=>navigate('/')}>Volver al inicio</button>
-        <button onClick={async()=>{await api.post(`/calendars/${id}/save_version/`, {label:`Borrador ${versions.length+1}`}); toast.success('Versión guardada'); load()}}>Guardar versión</button>
+        <button onClick={async()=>{await api.post(`/calendars/${id}/save_version/`, {label:`Borrador ${versions.length+1}`}); toast.success('Versión guardada'); refresh()}}>Guardar versión</button>
         <button onClick={()=>window.open(`http://localhost:8000/api/calendars/${id}/export/pdf/`)}>Exportar PDF</button>
         <button onClick={()=>window.open(`http://localhost:8000/api/calendars/${id}/export/excel/`)}>Exportar Excel</button>
       </div>
+      {suggestions && <div className='card'><h3>Sugerencias para {subjectNameById.get(suggestions.subject) || 'la materia'}</h3>
+        {suggestions.dates.map((s: any) => <div key={s.date} className='row item'><span>{s.date}{s.severity === 'soft' ? ` (⚠️ ${s.message})` : ''}{s.moves.length > 1 ? ` · junto a ${s.moves.slice(1).map((m: any) => m.subject_name).join(', ')}` : ''}</span><button onClick={() => applySuggestion(s.moves)}>Usar</button></div>)}
+        {suggestions.chains.map((s: any, index: number) => <div key={index} className='row item'><span>{s.moves.map((m: any) => `${m.subject_name}: ${m.from || 'sin fecha'} → ${m.to}`).join(' · ')}</span><button onClick={() => applySuggestion(s.moves)}>Aplicar</button></div>)}
+        <button onClick={() => setSuggestions(null)}>Cerrar</button>
+      </div>}
       <div ref={calendarRef}>
       <FullCalendar plugins={[dayGridPlugin, interactionPlugin]} locales={[esLocale]} locale='es' firstDay={1} initialView='dayGridMonth' initialDate={calendar.start_date} headerToolbar={false} editable droppable fixedWeekCount={false} showNonCurrentDates={false} validRange={{ start: calendar.start_date, end: rangeEndExclusive }} visibleRange={{ start: calendar.start_date, end: rangeEndExclusive }} events={events}
         datesSet={() => { window.setTimeout(compactIrrelevantWeeks, 0) }}
@@ -265,12 +427,12 @@ export function CalendarPage() {
           const ok = await assign(subject, dateStr)
           if (!ok) info.revert()
         }}
-        eventClick={async(info)=>{ if(window.confirm('¿Quitar evento?')) { await api.delete(`/calendars/${id}/events/${info.event.id}/`); toast.success('Evento eliminado'); load() } }}
-        dateClick={async (arg) => { if (!window.confirm(`¿Toggle feriado/bloqueado para ${arg.dateStr}?`)) return; await api.post(`/calendars/${id}/toggle_blocked_day/`, { date: arg.dateStr }); toast.success('Bloqueo actualizado'); load() }}
+        eventClick={async(info)=>{ if(window.confirm('¿Quitar evento?')) { if (await write(headers => api.delete(`/calendars/${id}/events/${info.event.id}/`, { headers }))) { toast.success('Evento eliminado'); refresh() } } }}
+        dateClick={async (arg) => { if (!window.confirm(`¿Toggle feriado/bloqueado para ${arg.dateStr}?`)) return; if (await write(headers => api.post(`/calendars/${id}/toggle_blocked_day/`, { date: arg.dateStr }, { headers }))) { toast.success('Bloqueo actualizado'); refresh() } }}
       />
       </div>
-      <div className='card'><h3>Versiones</h3>{versions.map(v=><div key={v.id} className='row'><span>v{v.version_number} - {v.label || 'Sin etiqueta'}</span><button onClick={async()=>{await api.post(`/calendars/${id}/restore_version/${v.id}/`); toast.success('Restaurado'); load()}}>Restaurar</button><button onClick={()=>window.open(`http://localhost:8000/api/calendars/${id}/export/pdf/?version_id=${v.id}`)}>PDF</button></div>)}</div>
-      <div className='card'><h3>Restricciones</h3><div className='row'><select value={newRule.rule_type} onChange={e=>setNewRule({...newRule, rule_type:e.target.value})}><option value='SAME_DAY'>Mismo día obligatorio</option><option value='PREFER_SAME_DAY'>Preferir mismo día</option><option value='HEAVY_NOT_SAME_DAY'>Advertencia para pesadas cercanas</option><option value='SUBJECT_ONLY_WEEKDAYS'>Solo día específico</option></select><select value={newRule.severity} onChange={e=>setNewRule({...newRule, severity:e.target.value})}><option value='HARD'>Fuerte</option><option value='SOFT'>Suave</option></select><select value={newRule.subject_a} onChange={e=>setNewRule({...newRule,subject_a:e.target.value})}><option value=''>Materia A</option>{subjects.map(s=><option key={s.id} value={s.id}>{s.name}</option>)}</select>{newRule.rule_type === 'SUBJECT_ONLY_WEEKDAYS' ? <select value={newRule.weekday} onChange={e=>setNewRule({...newRule, weekday:e.target.value})}>{weekdayOptions.map(w=><option key={w.value} value={w.value}>{w.label}</option>)}</select> : <select value={newRule.subject_b} onChange={e=>setNewRule({...newRule,subject_b:e.target.value})}><option value=''>Materia B</option>{subjects.map(s=><option key={s.id} value={s.id}>{s.name}</option>)}</select>}<button onClick={createRule}>Crear</button></div>{rules.map(r=><div key={r.id} className='row item'><span>{formatRule(r)}</span><button onClick={()=>deleteRule(r)}>Eliminar</button></div>)}</div>
+      <div className='card'><h3>Versiones</h3>{versions.map(v=><div key={v.id} className='row'><span>v{v.version_number} - {v.label || 'Sin etiqueta'}</span><button onClick={async()=>{if (await write(headers => api.post(`/calendars/${id}/restore_version/${v.id}/`, {}, { headers }))) { toast.success('Restaurado'); refresh() }}}>Restaurar</button><button onClick={()=>window.open(`http://localhost:8000/api/calendars/${id}/export/pdf/?version_id=${v.id}`)}>PDF</button><button onClick={async()=>{await api.post(`/versions/${v.id}/publish/`); toast.success(`Publicado: http://localhost:8000/api/public/calendars/${id}/calendar.ics`)}}>Publicar</button></div>)}</div>
+      <div className='card'><h3>Restricciones</h3><div className='row'><select value={newRule.rule_type} onChange={e=>setNewRule({...newRule, rule_type:e.target.value})}><option value='SAME_DAY'>Mismo día obligatorio</option><option value='PREFER_SAME_DAY'>Preferir mismo día</option><option value='HEAVY_NOT_SAME_DAY'>Advertencia para pesadas cercanas</option><option value='SUBJECT_ONLY_WEEKDAYS'>Solo día específico</option><option value='FORBID_SAME_DAY'>Prohibir mismo día</option><option value='MIN_GAP_DAYS'>Separación mínima en días</option><option value='MAX_EXAMS_PER_DAY_GROUP'>Máximo de exámenes por día y grupo</option><option value='SUBJECT_ONLY_FIXED_DATES'>Solo fechas fijas</option></select><select value={newRule.severity} onChange={e=>setNewRule({...newRule, severity:e.target.value})}><option value='HARD'>Fuerte</option><option value='SOFT'>Suave</option></select><select value={newRule.subject_a} onChange={e=>setNewRule({...newRule,subject_a:e.target.value})}><option value=''>Materia A</option>{subjects.map(s=><option key={s.id} value={s.id}>{s.name}</option>)}</select>{newRule.rule_type === 'SUBJECT_ONLY_WEEKDAYS' && <select value={newRule.weekday} onChange={e=>setNewRule({...newRule, weekday:e.target.value})}>{weekdayOptions.map(w=><option key={w.value} value={w.value}>{w.label}</option>)}</select>}{newRule.rule_type === 'SUBJECT_ONLY_FIXED_DATES' && <input placeholder='AAAA-MM-DD, AAAA-MM-DD' value={newRule.dates} onChange={e=>setNewRule({...newRule, dates:e.target.value})} />}{pairRuleTypes.includes(newRule.rule_type) && <select value={newRule.subject_b} onChange={e=>setNewRule({...newRule,subject_b:e.target.value})}><option value=''>Materia B</option>{subjects.map(s=><option key={s.id} value={s.id}>{s.name}</option>)}</select>}{newRule.rule_type === 'MIN_GAP_DAYS' && <input type='number' min={1} title='Días de separación' value={newRule.min_days} onChange={e=>setNewRule({...newRule, min_days:e.target.value})} />}{newRule.rule_type === 'MAX_EXAMS_PER_DAY_GROUP' && <><input type='number' min={1} title='Exámenes por día' value={newRule.max_exams} onChange={e=>setNewRule({...newRule, max_exams:e.target.value})} /><select value={newRule.group} onChange={e=>setNewRule({...newRule, group:e.target.value})}><option value=''>Cada grupo</option><option value='SEM2'>SEM2</option><option value='SEM4'>SEM4</option><option value='EXTRA'>EXTRA</option></select></>}<button onClick={createRule}>Crear</button></div>{rules.map(r=><div key={r.id} className='row item'><span>{formatRule(r)}</span><button onClick={()=>deleteRule(r)}>Eliminar</button></div>)}</div>
     </div>
   </div>
 }
@@ -1,7 +1,7 @@
 import { useEffect, useState } from 'react'
 import { useNavigate } from 'react-router-dom'
 import toast from 'react-hot-toast'
-import { api } from '../api'
+import { api, fetchAll } from '../api'
 
 export function HomePage() {
   const [calendars, setCalendars] = useState<any[]>([])
@@ -15,9 +15,9 @@ export function HomePage() {
   const navigate = useNavigate()
 
   const load = () => Promise.all([
-    api.get('/calendars/').then(r => setCalendars(r.data)),
-    api.get('/versions/').then(r => setVersions(r.data)),
-    api.get('/subjects/').then(r => setSubjects(r.data)),
+    fetchAll('/calendars/').then(setCalendars),
+    fetchAll('/versions/').then(setVersions),
+    fetchAll('/subjects/').then(setSubjects),
   ])
   useEffect(() => { load() }, [])
 